@@ -5,116 +5,1111 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
 from dotenv import load_dotenv
 import mysql.connector
+import sqlite3
+import json
+import re
+import queue
+import heapq
+import operator
+import zlib
+import uuid
+import atexit
+import contextvars
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from mysql.connector import errorcode, pooling
 import time
-from datetime import datetime
+import functools
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta
 import sys
 import random
 import logging
 import os
+import threading
 
 # Change the working directory to the script's folder
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)  # Set script directory as the working directory
 
-# Define the log file path correctly
-log_file_path = os.path.join(script_dir, 'support_bot_test.log')
+# Settings are read from .env once when the bot starts
+load_dotenv()
+
+# Define the log file path correctly, workers started by supervisor.py get one each
+log_worker = os.getenv("WORKER_ID")
+log_file_path = os.path.join(
+    script_dir, f'support_bot_test_{log_worker}.log' if log_worker else 'support_bot_test.log')
+
+# The log file is rotated at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# An info message repeated within LOG_REPEAT_WINDOW seconds (e.g. "Waiting for
+# user reply...") is only counted, the count is written with its next occurrence
+LOG_REPEAT_WINDOW = float(os.getenv("LOG_REPEAT_WINDOW", "60"))
+
+# Chat and ticket being handled, added to every log line
+log_chat = contextvars.ContextVar("log_chat", default=None)
+log_ticket = contextvars.ContextVar("log_ticket", default=None)
+
+
+def set_log_chat(chat_name):
+    """
+    Tags the following log lines with a chat, and no ticket yet
+    """
+    log_chat.set(chat_name)
+    log_ticket.set(None)
+
+
+class LogContextFilter(logging.Filter):
+    """
+    Adds the worker, chat and ticket to each record, in the thread that logs it
+    """
+
+    def filter(self, record):
+        record.worker = log_worker
+        record.chat = log_chat.get()
+        record.ticket = log_ticket.get()
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Drops info messages repeated in the same chat within window seconds. The
+    next one written says how many were dropped. Warnings and errors always pass.
+    """
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.lock = threading.Lock()
+        self.seen = OrderedDict()  # (chat, message) -> [last written at, dropped since], oldest first
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.window:
+            return True
+        key = (getattr(record, "chat", None), record.getMessage())
+        now = time.time()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry and now - entry[0] < self.window:
+                entry[1] += 1
+                return False
+            self.seen[key] = [now, 0]
+            self.seen.move_to_end(key)
+            # Forgetting a message early only means its next repeat is written
+            while len(self.seen) > 1000:
+                self.seen.popitem(last=False)
+        if entry and entry[1]:
+            record.repeated = entry[1]
+            record.msg, record.args = f"{record.getMessage()} (repeated {entry[1]} times)", None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for key in ("worker", "chat", "ticket", "repeated"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+log_listener = None
+
+
+def stop_logging():
+    """
+    Writes out the records still queued and stops the log listener
+    """
+    global log_listener
+    if log_listener:
+        log_listener.stop()
+        log_listener = None
+
+
+def setup_logging(path, stream=None):
+    """
+    Sends log records through a queue to a background thread, which writes them
+    as JSON lines to a rotating file at path and as text to stream (default:
+    stderr). Logging calls only put the record on the queue.
+
+    Returns the QueueListener writing the records
+    """
+    global log_listener
+    stop_logging()
+
+    file_handler = RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setFormatter(logging.Formatter(
+        f'%(asctime)s - %(levelname)s - {f"[{log_worker}] " if log_worker else ""}%(message)s',
+        datefmt='%d-%m-%Y %H:%M:%S'))  # Specify the desired time format
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(LogContextFilter())
+    queue_handler.addFilter(RepeatFilter(LOG_REPEAT_WINDOW))
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(logging.INFO)
+
+    log_listener = QueueListener(
+        queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    log_listener.start()
+    return log_listener
+
+
+setup_logging(log_file_path)
+atexit.register(stop_logging)
+
+DB_CONFIG = {
+    "host": os.getenv("HOST"),
+    "user": os.getenv("USER"),
+    "password": os.getenv("PASSWORD"),
+    "database": os.getenv("DATABASE"),
+}
+# Number of connections kept open in the pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Attempts to check out a connection, waiting DB_RETRY_BACKOFF seconds after
+# the first failure and doubling the wait after each one
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "3"))
+DB_RETRY_BACKOFF = float(os.getenv("DB_RETRY_BACKOFF", "0.5"))
+
+# Set by supervisor.py for each worker process it runs: "worker1", "worker2", ...
+# and NOTIFIER_ID for the one sending the notifications of all of them
+WORKER_ID = os.getenv("WORKER_ID")
+NOTIFIER_ID = "notify"
+
+# Local spool for tickets waiting to be written to the database, one per worker
+TICKET_SPOOL_PATH = os.path.join(
+    script_dir, f'ticket_spool_{WORKER_ID}.db' if WORKER_ID else 'ticket_spool.db')
+# Checkpoints of the conversations in progress, resumed after a restart
+CONVERSATION_STORE_PATH = os.path.join(
+    script_dir, f'conversations_{WORKER_ID}.db' if WORKER_ID else 'conversations.db')
+
+# Ticket numbers reserved from the database at a time, and how few may be
+# left before the ticket writer reserves the next block in the background
+TICKET_ID_BLOCK = int(os.getenv("TICKET_ID_BLOCK", "20"))
+TICKET_ID_LOW_WATER = int(os.getenv("TICKET_ID_LOW_WATER", str(TICKET_ID_BLOCK // 2)))
+# Largest number of tickets written in one executemany
+TICKET_BATCH_SIZE = int(os.getenv("TICKET_BATCH_SIZE", "50"))
+# Seconds between spool flushes, backing off up to TICKET_RETRY_MAX while the database is down
+TICKET_FLUSH_INTERVAL = float(os.getenv("TICKET_FLUSH_INTERVAL", "2"))
+TICKET_RETRY_MAX = 60
+
+# Ongoing tickets of a contact, served by the (contact_details, status) index
+OPEN_TICKETS_QUERY = "SELECT ticket_no FROM tickets WHERE contact_details = %s AND status = 'Ongoing'"
+
+# Seconds a contact's ongoing tickets are cached, and how many contacts are kept
+OPEN_TICKET_CACHE_TTL = int(os.getenv("OPEN_TICKET_CACHE_TTL", "300"))
+OPEN_TICKET_CACHE_SIZE = int(os.getenv("OPEN_TICKET_CACHE_SIZE", "1000"))
+
+# Tickets changed since a point in time, served by the updated_at index. The ticket
+# writer polls it so a status changed outside the bot drops the contact's cache
+# entry, and the tickets other workers created reach the duplicate index
+TICKET_CHANGES_QUERY = ("SELECT ticket_no, contact_details, status, issue_category, description, "
+                        "date_created, related_to, updated_at FROM tickets "
+                        "WHERE updated_at >= %s ORDER BY updated_at")
+
+# Writes a spooled ticket. A ticket number already taken is never overwritten,
+# see write_tickets_one_by_one
+INSERT_TICKET_QUERY = """
+INSERT INTO tickets (ticket_no, contact_details, issue_category, description, status,
+                     date_created, related_to)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Records a merged report by the id it was spooled under, in the same
+# transaction as the merge, so a merge replayed after a crash is not applied twice
+RECORD_MERGE_QUERY = "INSERT INTO ticket_merges (merge_id, ticket_no) VALUES (%s, %s)"
+# Appends a merged report to a ticket's description, unless the ticket was closed meanwhile
+MERGE_REPORT_QUERY = ("UPDATE tickets SET description = CONCAT(description, %s) "
+                      "WHERE ticket_no = %s AND status = 'Ongoing'")
+
+# Columns and tables added by migrate.py that the bot reads or writes, checked at startup
+REQUIRED_TICKET_COLUMNS = ["related_to", "updated_at"]
+REQUIRED_TABLES = ["ticket_merges"]
+
+# A new ticket duplicates an indexed one of the same category when the estimated
+# similarity of their descriptions (Jaccard similarity of character shingles, 0 to 1) reaches this
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.4"))
+# Days an ongoing ticket takes further reports of its contact instead of a new ticket
+DUPLICATE_CONTACT_DAYS = int(os.getenv("DUPLICATE_CONTACT_DAYS", "7"))
+# Seconds in which similar tickets of different contacts are linked as one outage
+DUPLICATE_CLUSTER_WINDOW = int(os.getenv("DUPLICATE_CLUSTER_WINDOW", "3600"))
+# MinHash signature length and the number of bands it is bucketed by, more
+# bands find less similar candidates at the cost of more comparisons
+MINHASH_SIZE = 64
+MINHASH_BANDS = 32
+# Words left out of the shingles, so "is not working" alone does not make two descriptions similar
+DUPLICATE_STOP_WORDS = frozenset("""
+    a an the is are am was were be been being i im m my me we our us it its s this that
+    there to of in on at for from by with and or but not no cant cannot can t dont don
+    doesnt isnt please again still keeps keep since when has have had do does did hi hello
+""".split())
+# Recent tickets, served by the date_created index, to rebuild the duplicate index at startup
+DUPLICATE_INDEX_QUERY = """
+SELECT ticket_no, contact_details, issue_category, description, status, date_created, related_to
+FROM tickets WHERE date_created >= %s ORDER BY date_created
+"""
+# Description of a ticket whose user sent none, never checked for duplicates
+NO_DESCRIPTION = "No description provided."
+
+# Port of the localhost metrics endpoint (0 turns it off), and an optional
+# file the metrics are also written to every minute
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+
+# Shared by the workers of supervisor.py: who claimed which chat, worker
+# heartbeats and the notifications waiting for the notifier. A claim not
+# renewed for CHAT_CLAIM_TTL seconds (its worker died) can be taken over.
+WORKERS_DB_PATH = os.getenv(
+    "WORKERS_DB_PATH", os.path.join(script_dir, 'workers.db'))
+CHAT_CLAIM_TTL = int(os.getenv("CHAT_CLAIM_TTL", "600"))
+
+# Chromedriver to start Chrome with. Without CHROMEDRIVER_PATH, the driver
+# webdriver_manager downloads is remembered in CHROMEDRIVER_CACHE, so later
+# starts skip its network lookup until Chrome updates past it.
+CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH")
+CHROMEDRIVER_CACHE = os.path.join(script_dir, '.chromedriver_path')
+
+# Chrome profiles are kept here (one per window) so the WhatsApp Web session
+# survives restarts and the QR code only has to be scanned once. Set it empty
+# in .env to start with a fresh profile every time.
+CHROME_PROFILE_DIR = os.getenv(
+    "CHROME_PROFILE_DIR", os.path.join(script_dir, 'chrome_profile'))
+
+# Run Chrome without a window. Log in once with a window first; when a login is
+# needed anyway, the QR code is saved to LOGIN_QR_PATH to be scanned from there.
+HEADLESS = os.getenv("HEADLESS", "0") == "1"
+LOGIN_QR_PATH = os.path.join(script_dir, 'login_qr.png')
+LOGIN_QR_SELECTOR = "canvas[aria-label*='Scan'], div[data-ref] canvas"
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%d-%m-%Y %H:%M:%S',  # Specify the desired time format
-    handlers=[
-        logging.FileHandler(log_file_path),
-        logging.StreamHandler()
-    ]
-)
 # Change to whatever group name to be ignored
 GROUPTOBEIGNORED = ["Test group"]
 
+# Group that is notified about new tickets and update requests
+GROUP_TO_NOTIFY = "Test group"
+
+# Keep the group above open in a second browser window for the whole session,
+# so notifying is a plain send. The window is another linked device, so its QR
+# code has to be scanned too.
+NOTIFY_IN_SEPARATE_WINDOW = os.getenv("NOTIFY_IN_SEPARATE_WINDOW", "1") == "1"
+
+# Notifications are collected and sent to the group as one digest once the
+# oldest has waited DIGEST_WINDOW seconds or DIGEST_MAX_EVENTS are pending.
+# Tickets in URGENT_CATEGORIES (comma-separated, e.g. "Network,Hardware") are sent right away.
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", "30"))
+DIGEST_MAX_EVENTS = int(os.getenv("DIGEST_MAX_EVENTS", "10"))
+URGENT_CATEGORIES = [category.strip() for category in os.getenv("URGENT_CATEGORIES", "").split(",")
+                     if category.strip()]
+
+# How new replies are detected: "observer" waits on a MutationObserver injected
+# into the open chat, "polling" re-counts the incoming messages every 2 seconds.
+# The observer mode falls back to polling if the script cannot be injected.
+REPLY_DETECTION = os.getenv("REPLY_DETECTION", "observer")
+
+# Seconds to wait for each kind of readiness condition, pick a profile with
+# WAIT_PROFILE in .env. Slower machines or connections need the "slow" profile.
+WAIT_PROFILES = {
+    "fast": {
+        "element": 5,        # Buttons, input boxes and menus to become clickable
+        "chat_open": 5,      # Chat header and input box after opening a chat
+        "message_sent": 10,  # Sent tick on an outgoing message
+        "search": 3,         # Search results after typing a contact
+        "input_text": 1,     # Inserted text to render in the input box
+        "login": 60,         # Chat list after opening WhatsApp Web
+    },
+    "default": {
+        "element": 10,
+        "chat_open": 10,
+        "message_sent": 20,
+        "search": 5,
+        "input_text": 2,
+        "login": 120,
+    },
+    "slow": {
+        "element": 20,
+        "chat_open": 30,
+        "message_sent": 60,
+        "search": 10,
+        "input_text": 5,
+        "login": 300,
+    },
+}
+WAIT_PROFILE = os.getenv("WAIT_PROFILE", "default")
+
+MESSAGE_BOX_XPATH = "//div[@contenteditable='true'][@data-tab='10']"
+
+# Insert the whole message at once (FAST_SEND) instead of typing it key by key
+FAST_SEND = os.getenv("FAST_SEND", "1") == "1"
+
+# Replaces the content of the input box (arguments[0]) with arguments[1]. The
+# text is pasted so WhatsApp's editor turns newlines into line breaks of the
+# same message, plain contenteditables get it through insertText instead.
+INSERT_TEXT_JS = """
+const box = arguments[0];
+const text = arguments[1];
+box.focus();
+document.execCommand('selectAll', false, null);
+document.execCommand('delete', false, null);
+if (!text) { return; }
+const data = new DataTransfer();
+data.setData('text/plain', text);
+const paste = new ClipboardEvent('paste', {clipboardData: data, bubbles: true, cancelable: true});
+if (box.dispatchEvent(paste)) {
+    document.execCommand('insertText', false, text);
+}
+"""
+
+# Messages sent through WhatsApp Web per minute across all chats and windows,
+# with bursts of up to SEND_BURST (SEND_RATE=0 turns the limit off). Only a
+# ceiling against runaway sends, a busy bot stays well below it. Lower priorities
+# leave tokens for higher ones: a send needs as many tokens left over as its rank below.
+SEND_RATE = float(os.getenv("SEND_RATE", "120"))
+SEND_BURST = int(os.getenv("SEND_BURST", "20"))
+SEND_PRIORITIES = {
+    "reply": 0,         # Answers to the user in the open chat
+    "ticket": 1,        # Ticket confirmations
+    "notification": 2,  # Messages to the IT group, queued until tokens are spare
+}
+
+# Which unread chat to open next: "oldest" or "most_unread"
+SCHEDULING_POLICY = os.getenv("SCHEDULING_POLICY", "oldest")
+
+# Returns every sidebar chat with an unread badge as
+# {name, unread, preview, timestamp, position, row}, or null without a sidebar
+SCAN_UNREAD_JS = """
+const pane = document.querySelector('#pane-side');
+if (!pane) { return null; }
+let rows = pane.querySelectorAll('[role="listitem"]');
+if (!rows.length) { rows = pane.querySelectorAll('[role="row"]'); }
+const timePattern = /^(\\d{1,2}:\\d{2}(\\s?[AP]M)?|Yesterday|Today|[A-Z][a-z]+day|\\d{1,2}\\/\\d{1,2}\\/\\d{2,4})$/;
+const chats = [];
+rows.forEach((row, position) => {
+    const badge = row.querySelector('[aria-label*="unread message"]');
+    if (!badge) { return; }
+    const titles = Array.from(row.querySelectorAll('span[title]'));
+    if (!titles.length) { return; }
+    const name = titles[0].getAttribute('title');
+    const preview = titles.length > 1 ? titles[titles.length - 1].getAttribute('title') : '';
+    let timestamp = '';
+    for (const el of row.querySelectorAll('div, span')) {
+        const text = el.childElementCount === 0 ? el.textContent.trim() : '';
+        if (timePattern.test(text)) { timestamp = text; break; }
+    }
+    chats.push({
+        name: name,
+        unread: parseInt(badge.textContent, 10) || 1,
+        preview: preview === name ? '' : preview,
+        timestamp: timestamp,
+        position: position,
+        row: row,
+    });
+});
+return chats;
+"""
+
+# Returns the sidebar row of the chat named arguments[0]
+FIND_SIDEBAR_ROW_JS = """
+const pane = document.querySelector('#pane-side');
+if (!pane) { return null; }
+for (const span of pane.querySelectorAll('span[title]')) {
+    if (span.getAttribute('title') === arguments[0]) {
+        return span.closest('[role="listitem"], [role="row"]') || span;
+    }
+}
+return null;
+"""
+
+# Reads the type, name and contact details of the open chat from its header.
+# The group name is checked first, the personal name doubles as the contact
+# details: the saved name, or the number if the contact is not saved.
+CHAT_HEADER_JS = """
+const textAt = (xpath) => {
+    const node = document.evaluate(xpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    return node ? node.textContent : null;
+};
+const groupName = textAt('//*[@id="main"]/header/div[2]/div[1]/div/span');
+const contact = textAt('//*[@id="main"]/header/div[2]/div/div/div/span');
+let type = 'unknown';
+if (groupName !== null) { type = 'group'; } else if (contact !== null) { type = 'personal'; }
+return {type: type, name: groupName !== null ? groupName : contact, contact: contact};
+"""
+
+# Text shown in the input box, with emoji images turned back into characters
+RENDERED_TEXT_JS = """
+const clone = arguments[0].cloneNode(true);
+clone.querySelectorAll('img[alt]').forEach((img) => img.replaceWith(img.alt));
+return clone.textContent;
+"""
+
+# Returns {messages, cursor}: the texts of the incoming messages after the one
+# with data-id arguments[0] (the cursor), oldest first, and the data-id of the
+# last incoming message. The chat is walked from the bottom up to the cursor
+# only. Without a cursor, or if it is no longer rendered, the messages after
+# the last outgoing one count as new. When arguments[1] is true the message
+# observer's queue is cleared, as everything it holds is read here or was before.
+NEW_MESSAGES_JS = """
+const cursor = arguments[0];
+const state = window.__supportBot;
+if (arguments[1] && state && state.queue) { state.queue.length = 0; }
+const bubbles = document.querySelectorAll('#main .message-in, #main .message-out');
+const keyOf = (el) => {
+    const holder = el.closest('[data-id]');
+    return holder ? holder.getAttribute('data-id') : null;
+};
+const textOf = (el) => {
+    const span = el.querySelector('span.selectable-text');
+    return span ? span.innerText : null;
+};
+let last = null;
+for (let i = bubbles.length - 1; i >= 0 && last === null; i--) {
+    if (bubbles[i].classList.contains('message-in')) { last = keyOf(bubbles[i]); }
+}
+const messages = [];
+let afterOutgoing = null;
+for (let i = bubbles.length - 1; i >= 0; i--) {
+    const el = bubbles[i];
+    if (cursor && keyOf(el) === cursor) { return {messages: messages, cursor: last || cursor}; }
+    if (el.classList.contains('message-out')) {
+        if (afterOutgoing === null) { afterOutgoing = messages.slice(); }
+        if (!cursor) { break; }
+        continue;
+    }
+    const text = textOf(el);
+    if (text !== null) { messages.unshift(text); }
+}
+return {messages: afterOutgoing !== null ? afterOutgoing : messages, cursor: last || cursor};
+"""
+
+# Installs (once per open chat, or again when arguments[0] asks for a reset) a
+# MutationObserver on #main that queues the text of every incoming message
+# rendered after the observer was installed. Messages already in the chat, or
+# older history loaded lazily above them, are ignored.
+MESSAGE_OBSERVER_JS = """
+const reset = arguments[0];
+const main = document.querySelector('#main');
+if (!main) { return false; }
+const state = window.__supportBot || (window.__supportBot = {});
+if (!reset && state.root === main && state.observer) { return true; }
+if (state.observer) { state.observer.disconnect(); }
+
+const incoming = (root) => {
+    const found = [];
+    if (root.nodeType !== Node.ELEMENT_NODE) { return found; }
+    if (root.classList.contains('message-in')) { found.push(root); }
+    root.querySelectorAll('.message-in').forEach((el) => found.push(el));
+    return found;
+};
+const keyOf = (el) => {
+    const holder = el.closest('[data-id]');
+    return holder ? holder.getAttribute('data-id') : null;
+};
+
+state.root = main;
+state.queue = [];
+state.seen = new Set();
+state.last = null;
+state.lastKey = null;  // data-id of the last message queued
+incoming(main).forEach((el) => {
+    state.seen.add(keyOf(el) || el);
+    state.last = el;
+});
+
+state.observer = new MutationObserver((mutations) => {
+    for (const mutation of mutations) {
+        mutation.addedNodes.forEach((node) => {
+            incoming(node).forEach((el) => {
+                const key = keyOf(el) || el;
+                if (state.seen.has(key)) { return; }
+                state.seen.add(key);
+                // Lazily loaded history is inserted above the last seen message
+                if (state.last && state.last.isConnected &&
+                        (el.compareDocumentPosition(state.last) & Node.DOCUMENT_POSITION_FOLLOWING)) {
+                    return;
+                }
+                const span = el.querySelector('span.selectable-text');
+                if (!span) { return; }
+                state.last = el;
+                state.lastKey = keyOf(el);
+                state.queue.push(span.innerText);
+            });
+        });
+    }
+    if (state.queue.length && state.waiter) { state.waiter(state.queue.splice(0)); }
+});
+state.observer.observe(main, {childList: true, subtree: true});
+return true;
+"""
+
+# Resolves with {messages, cursor} as soon as the observer queues a message, or
+# with no messages once the timeout (in milliseconds) runs out. The cursor is
+# the data-id of the last message returned, null if none was.
+WAIT_FOR_MESSAGE_JS = """
+const timeoutMs = arguments[0];
+const done = arguments[arguments.length - 1];
+const state = window.__supportBot;
+if (!state || !state.observer || state.root !== document.querySelector('#main')) {
+    done(null);
+    return;
+}
+const result = (messages) => ({messages: messages, cursor: messages.length ? state.lastKey : null});
+if (state.queue.length) {
+    done(result(state.queue.splice(0)));
+    return;
+}
+const timer = setTimeout(() => { state.waiter = null; done(result([])); }, timeoutMs);
+state.waiter = (messages) => { clearTimeout(timer); state.waiter = null; done(result(messages)); };
+"""
+
 
-def initialize_driver():
+def get_chromedriver_path(refresh=False):
     """
-    Setup the driver
+    Returns the chromedriver path: CHROMEDRIVER_PATH if set, otherwise the one
+    remembered from an earlier start, resolved through webdriver_manager only
+    when nothing is remembered yet or refresh is True.
     """
+    if CHROMEDRIVER_PATH:
+        return CHROMEDRIVER_PATH
+    if not refresh:
+        try:
+            with open(CHROMEDRIVER_CACHE) as f:
+                path = f.read().strip()
+            if path and os.path.exists(path):
+                return path
+        except OSError:
+            pass
+
+    path = ChromeDriverManager().install()
     try:
-        driver = webdriver.Chrome(
-            service=ChromeService(ChromeDriverManager().install())
-        )
-        return driver
-    except Exception as e:
-        logging.error(f"Failed to initialize driver: {str(e)}")
-        return None
+        with open(CHROMEDRIVER_CACHE, "w") as f:
+            f.write(path)
+    except OSError as e:
+        logging.warning(f"Could not remember chromedriver path: {str(e)}")
+    return path
+
+
+def initialize_driver(profile="main"):
+    """
+    Setup the driver
+
+    Args:
+        profile: Name of the Chrome profile under CHROME_PROFILE_DIR, each window needs its own
+    """
+    options = webdriver.ChromeOptions()
+    if CHROME_PROFILE_DIR:
+        options.add_argument(
+            f"--user-data-dir={os.path.join(CHROME_PROFILE_DIR, profile)}")
+    if HEADLESS:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1280,900")
+    # Every element is waited for anyway, no need to wait for images and fonts
+    options.page_load_strategy = "eager"
+
+    for refresh in (False, True):
+        try:
+            driver = webdriver.Chrome(
+                service=ChromeService(get_chromedriver_path(refresh)), options=options)
+            break
+        except Exception as e:
+            if refresh or CHROMEDRIVER_PATH:
+                logging.error(f"Failed to initialize driver: {str(e)}")
+                return None
+            # Chrome may have updated past the remembered driver
+            logging.warning(f"Remembered chromedriver failed, resolving it again: {str(e)}")
+
+    if HEADLESS:
+        # WhatsApp Web turns away browsers that call themselves HeadlessChrome
+        user_agent = driver.execute_script("return navigator.userAgent")
+        driver.execute_cdp_cmd("Network.setUserAgentOverride", {
+            "userAgent": user_agent.replace("HeadlessChrome", "Chrome")})
+    return driver
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """
+    Creates the process-wide connection pool on first use.
+
+    Returns the MySQLConnectionPool shared by all database calls
+    """
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = pooling.MySQLConnectionPool(
+                pool_name="support_bot",
+                pool_size=DB_POOL_SIZE,
+                # Prefer the C extension, it is much faster than the pure Python protocol
+                use_pure=not mysql.connector.HAVE_CEXT,
+                **DB_CONFIG
+            )
+            logging.info(
+                f"Connection pool of {DB_POOL_SIZE} created for {DB_CONFIG['database']} "
+                f"({'C extension' if mysql.connector.HAVE_CEXT else 'pure Python'})")
+        return _db_pool
 
 
 def connect_to_db():
     """
-    Establish a database connection.
+    Check out a connection from the pool, retrying with exponential backoff.
+    Calling close() on the connection returns it to the pool.
 
     Returns a database connection if successful
     """
-    load_dotenv()
-    host = os.getenv("HOST")
-    user = os.getenv("USER")
-    password = os.getenv("PASSWORD")
-    database = os.getenv("DATABASE")
+    for attempt in range(1, DB_CONNECT_RETRIES + 1):
+        conn = None
+        try:
+            conn = get_db_pool().get_connection()
+            # Health check, reconnects if the server dropped the idle connection
+            conn.ping(reconnect=True, attempts=1, delay=0)
+            return conn
+        except mysql.connector.Error as err:
+            logging.warning(
+                f"Database connection error (attempt {attempt}/{DB_CONNECT_RETRIES}): {err}")
+            if conn:
+                try:
+                    conn.close()
+                except mysql.connector.Error:
+                    pass
+            if attempt < DB_CONNECT_RETRIES:
+                time.sleep(DB_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+    logging.error("Database connection failed after retries")
+    return None
+
+
+class Metrics:
+    """
+    In-process counters, gauges and histograms, exported in the Prometheus text format
+    through the localhost endpoint (METRICS_PORT) and/or a textfile (METRICS_TEXTFILE).
+    """
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                key, [[0] * len(self.BUCKETS), 0.0, 0])
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        """
+        Observes the duration of the block, and counts <name>_errors_total if it raises
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(name.replace("_seconds", "_errors_total"), **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format
+        """
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                       for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.append(f"{name}{label_text(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                header(name, "gauge")
+                lines.append(f"{name}{label_text(labels)} {value}")
+            for (name, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                header(name, "histogram")
+                for bound, bucket_count in zip(self.BUCKETS, buckets):
+                    lines.append(
+                        f"{name}_bucket{label_text(labels, [('le', bound)])} {bucket_count}")
+                lines.append(
+                    f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{label_text(labels)} {total}")
+                lines.append(f"{name}_count{label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Writes the metrics to a file atomically, e.g. for the node_exporter textfile collector
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+metrics.describe("support_bot_step_seconds",
+                 "Wall-clock of driver helpers, conversation flows and ticket creation")
+metrics.describe("support_bot_step_errors_total",
+                 "Steps that raised or reported failure")
+metrics.describe("support_bot_step_waiting_seconds_total",
+                 "Seconds steps spent waiting on the browser or the user")
+metrics.describe("support_bot_waiting_seconds_total",
+                 "Seconds spent waiting on the browser to get ready or on users to reply")
+metrics.describe("support_bot_db_query_seconds", "Duration of database queries")
+metrics.describe("support_bot_db_query_errors_total", "Failed database queries")
+metrics.describe("support_bot_stage_seconds",
+                 "Time conversations spent in each stage, including the user's reply time")
+metrics.describe("support_bot_startup_seconds",
+                 "Time from start to the driver, login, chat list and first reply being ready")
+metrics.describe("support_bot_time_to_first_reply_seconds",
+                 "Time from opening a new chat to the welcome message being sent")
+metrics.describe("support_bot_tickets_created_total", "Tickets created")
+metrics.describe("support_bot_tickets_quarantined_total",
+                 "Spooled tickets not written because their number was taken by another ticket")
+metrics.describe("support_bot_send_wait_seconds",
+                 "Time a message waited for the send rate limit, or in the send queue")
+metrics.describe("support_bot_send_queue_depth", "Messages waiting in the send queue")
+metrics.describe("support_bot_send_deduplicated_total",
+                 "Messages dropped because the same message was already queued")
+metrics.describe("support_bot_auto_categorized_total",
+                 "New issues whose category was guessed from the opening message")
+metrics.describe("support_bot_duplicate_check_seconds",
+                 "Time to look up the tickets similar to a new one")
+metrics.describe("support_bot_duplicate_reports_total",
+                 "Reports merged into an ongoing ticket of the same contact, or linked to an outage")
+metrics.describe("support_bot_conversations_total",
+                 "Finished conversations by the stage they ended in")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics on /metrics
+    """
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the log
+
+
+def start_metrics_server(port=None):
+    """
+    Serves the metrics on http://127.0.0.1:<port>/metrics from a background thread.
+
+    Returns the server, or None if the endpoint is disabled or the port is taken
+    """
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
     try:
-        conn = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            use_pure=True
-        )
-        logging.info(f"Connected to {database}")
-        return conn
-    except mysql.connector.Error as err:
-        logging.error(f"Database connection error: {err}")
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    except OSError as e:
+        logging.error(f"Failed to start metrics endpoint: {str(e)}")
         return None
+    threading.Thread(target=server.serve_forever,
+                     name="metrics", daemon=True).start()
+    logging.info(f"Metrics available on http://127.0.0.1:{port}/metrics")
+    return server
+
+
+def export_metrics():
+    """
+    Writes the metrics textfile if METRICS_TEXTFILE is set
+    """
+    if METRICS_TEXTFILE:
+        try:
+            metrics.write_textfile(METRICS_TEXTFILE)
+        except OSError as e:
+            logging.error(f"Failed to write metrics textfile: {str(e)}")
+
+
+# Wall-clock per step: [calls, total seconds, seconds spent waiting]
+step_timings = {}
+_step_timings_lock = threading.Lock()
+_active_steps = threading.local()
+
+
+def _step_stack():
+    if not hasattr(_active_steps, "stack"):
+        _active_steps.stack = []
+    return _active_steps.stack
+
+
+def timed_step(func=None, *, errors_on=(False,)):
+    """
+    Decorator that records the wall-clock of a driver helper or conversation
+    flow, so the timing report can split it into waiting and working time.
+    Also exports it as a histogram and counts an error when the step raises
+    or returns one of the errors_on values.
+    """
+    if func is None:
+        return functools.partial(timed_step, errors_on=errors_on)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = _step_stack()
+        stack.append(func.__name__)
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = any(result is value for value in errors_on)
+            return result
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - start
+            with _step_timings_lock:
+                timing = step_timings.setdefault(func.__name__, [0, 0.0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+            metrics.observe("support_bot_step_seconds",
+                            elapsed, step=func.__name__)
+            if failed:
+                metrics.inc("support_bot_step_errors_total",
+                            step=func.__name__)
+    return wrapper
+
+
+@contextmanager
+def waiting(on="browser"):
+    """
+    Counts the time spent in the block as waiting for every step in progress
+
+    Args:
+        on: What is waited on, "browser" or "user"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.inc("support_bot_waiting_seconds_total", elapsed, on=on)
+        with _step_timings_lock:
+            for name in set(_step_stack()):
+                step_timings.setdefault(name, [0, 0.0, 0.0])[2] += elapsed
+        for name in set(_step_stack()):
+            metrics.inc("support_bot_step_waiting_seconds_total",
+                        elapsed, step=name)
+
+
+def wait_timeout(kind):
+    """
+    Returns the timeout in seconds for a kind of wait in the active WAIT_PROFILE
+    """
+    return WAIT_PROFILES.get(WAIT_PROFILE, WAIT_PROFILES["default"])[kind]
+
+
+def wait_until(driver, condition, kind="element", timeout=None):
+    """
+    Waits until the condition is met, for at most the profile's timeout of this kind of wait.
+
+    Returns the value returned by the condition, raises TimeoutException otherwise
+    """
+    with waiting():
+        return WebDriverWait(driver, timeout or wait_timeout(kind)).until(condition)
+
+
+def timing_report():
+    """
+    Returns one line per step with how much of its wall-clock was spent waiting
+    """
+    lines = [f"{'step':<28}{'calls':>7}{'total s':>10}{'waiting s':>11}{'working s':>11}{'waiting':>9}"]
+    with _step_timings_lock:
+        timings = sorted(step_timings.items(),
+                         key=lambda item: item[1][1], reverse=True)
+    for name, (calls, total, waited) in timings:
+        waited = min(waited, total)
+        share = waited / total * 100 if total else 0
+        lines.append(
+            f"{name:<28}{calls:>7}{total:>10.1f}{waited:>11.1f}{total - waited:>11.1f}{share:>8.0f}%")
+    return "\n".join(lines)
+
+
+def install_message_observer(driver, reset=False):
+    """
+    Injects the MutationObserver that queues incoming messages of the open chat.
+    Safe to call repeatedly, it is only installed once per open chat.
+
+    Args:
+        reset: Reinstall the observer, e.g. right after switching to another chat
 
+    Returns:
+        bool: True if the observer is watching the open chat
+    """
+    try:
+        return bool(driver.execute_script(MESSAGE_OBSERVER_JS, reset))
+    except Exception as e:
+        logging.warning(f"Failed to install message observer: {str(e)}")
+        return False
+
+
+@timed_step
+def wait_for_user_reply(driver, timeout=30, cursor=None):
+    """
+    Waits for new user messages for a given timeout. Uses the injected
+    MutationObserver when REPLY_DETECTION is "observer" and falls back to
+    polling the messages after a cursor if the observer is unavailable.
+
+    Args:
+
+        timeout: Max time to wait for a response (default: 30 seconds)
+        cursor: The last message already handled, see wait_for_user_reply_polling
+
+    Returns:
+        (list of message texts, oldest first, empty if no new message appears,
+        cursor after the last of them)
+    """
+    if REPLY_DETECTION == "observer" and install_message_observer(driver):
+        try:
+            messages, last = wait_for_user_reply_observer(driver, timeout)
+            if messages and not last:
+                # The messages carry no data-id, the newest rendered is the best guess
+                last = get_message_cursor(driver)
+            return messages, last or cursor
+        except Exception as e:
+            logging.warning(
+                f"Message observer failed, falling back to polling: {str(e)}")
+
+    return wait_for_user_reply_polling(driver, timeout, cursor)
+
+
+def wait_for_user_reply_observer(driver, timeout=30):
+    """
+    Blocks inside the browser until the message observer queues a new incoming
+    message, so the reply is returned as soon as it is rendered.
+
+    Args:
+
+        timeout: Max time to wait for a response (default: 30 seconds)
+
+    Returns:
+        (list of the texts of the messages queued by the observer, empty if no
+        new message appears, data-id of the last of them or None)
+    """
+    logging.info("Waiting for user reply...")
+    # Leave the browser enough time to resolve the script on its own
+    driver.set_script_timeout(timeout + 5)
+    with waiting("user"):
+        result = driver.execute_async_script(
+            WAIT_FOR_MESSAGE_JS, int(timeout * 1000))
 
-def wait_for_user_reply(driver, timeout=30):
+    if result is None:
+        raise RuntimeError("message observer is not attached to the open chat")
+
+    messages = [message.strip() for message in result["messages"]]
+    for message in messages:
+        logging.info(f"New message detected: '{message}'")
+    return messages, result["cursor"]
+
+
+def wait_for_user_reply_polling(driver, timeout=30, cursor=None):
     """
-    Waits for a new user message for a given timeout by checking if the
-    number of incoming messages has increased. Avoids issues where
-    a new reply has the same text as a previous message.
+    Waits for new user messages for a given timeout by checking every 2 seconds
+    for messages after the last one seen. Only the messages below the cursor
+    are read, however long the chat history is, and a new reply with the same
+    text as a previous message still counts.
 
     Args:
 
         timeout: Max time to wait for a response (default: 30 seconds)
+        cursor: The last message already handled, so a reply that arrived
+            before the call is returned too. Defaults to the last message rendered.
 
     Returns:
-        str: The text content of the latest message, or None if no new message appears.
+        (list of message texts, oldest first, empty if no new message appears,
+        cursor after the last of them)
     """
     start_time = time.time()
-    # Get the count of incoming messages before waiting.
-    messages = driver.find_elements(
-        By.XPATH, "//div[contains(@class, 'message-in')]//span[contains(@class, 'selectable-text')]")
-    initial_count = len(messages)
+    if cursor is None:
+        cursor = get_message_cursor(driver)
 
     while time.time() - start_time < timeout:
         logging.info("Waiting for user reply...")
-        time.sleep(2)  # check more frequently
-        messages = driver.find_elements(
-            By.XPATH, "//div[contains(@class, 'message-in')]//span[contains(@class, 'selectable-text')]")
-        if len(messages) > initial_count:
-            new_msg = messages[-1].text.strip()
-            logging.info(f"New message detected: '{new_msg}'")
-            return new_msg
+        with waiting("user"):
+            time.sleep(2)  # check more frequently
+        messages, cursor = read_messages_since(driver, cursor, consume=True)
+        if messages:
+            for message in messages:
+                logging.info(f"New message detected: '{message}'")
+            return messages, cursor
 
-    return None  # No new message received
+    return [], cursor  # No new message received
 
 
+@timed_step
 def click_all_button(driver):
     """
     Click the all button to go to the all messages tab
     """
     try:
         logging.info("Looking for all button...")
-        time.sleep(5)
-        check_input = driver.find_element(By.XPATH, "//*[@id='all-filter']")
+        check_input = wait_until(driver, EC.element_to_be_clickable(
+            (By.XPATH, "//*[@id='all-filter']")))
         logging.info("All button found!")
         check_input.click()
         return True
@@ -124,21 +1119,20 @@ def click_all_button(driver):
         return False
 
 
+@timed_step
 def close_chat(driver):
     """
     Close the current conversation
     """
+    forget_chat_snapshot(driver)
     try:
         logging.info("Opening chat menu...")
-        triple_dot_button = driver.find_element(
-            By.XPATH, "//*[@id='main']/header/div[3]/div/div[3]/div/button")
+        triple_dot_button = wait_until(driver, EC.element_to_be_clickable(
+            (By.XPATH, "//*[@id='main']/header/div[3]/div/div[3]/div/button")))
         triple_dot_button.click()
         logging.info("Chat menu open!")
-        time.sleep(1)
-        close_chat_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable(
-                (By.XPATH, "//*[@aria-label='Close chat']"))
-        )
+        close_chat_button = wait_until(driver, EC.element_to_be_clickable(
+            (By.XPATH, "//*[@aria-label='Close chat']")))
         logging.info("Closing chat....")
         close_chat_button.click()
         logging.info("Exited chat")
@@ -148,16 +1142,28 @@ def close_chat(driver):
         return False
 
 
-def check_login(driver, timeout=30):
+def check_login(driver, timeout=None):
     """
-    Checks if the login is successful by waiting for the presence of an element.
+    Checks if the login is successful by waiting for the chat list. Returns as
+    soon as the saved session has loaded it; when the QR code shows up instead,
+    asks for a scan (saving the code to LOGIN_QR_PATH when headless) and keeps waiting.
 
     Args:
-        timeout: Maximum time to wait for the element to appear
+        timeout: Maximum time to wait for the element to appear (default: the "login" wait of the profile)
     """
     try:
-        wait = WebDriverWait(driver, timeout)
-        wait.until(EC.presence_of_element_located((By.ID, "pane-side")))
+        ready = wait_until(driver, EC.any_of(
+            EC.presence_of_element_located((By.ID, "pane-side")),
+            EC.presence_of_element_located((By.CSS_SELECTOR, LOGIN_QR_SELECTOR))),
+            "login", timeout=timeout)
+        if ready.get_attribute("id") != "pane-side":
+            if HEADLESS:
+                driver.save_screenshot(LOGIN_QR_PATH)
+                logging.info(f"Not logged in, scan the QR code saved to {LOGIN_QR_PATH}")
+            else:
+                logging.info("Not logged in, scan the QR code in the browser")
+            wait_until(driver, EC.presence_of_element_located(
+                (By.ID, "pane-side")), "login", timeout=timeout)
         logging.info("Login successfully")
         return True
 
@@ -166,14 +1172,15 @@ def check_login(driver, timeout=30):
         return False
 
 
+@timed_step
 def click_unread_button(driver):
     """
     Click the unread button to go to the unread messages tab
     """
     try:
         logging.info("Looking for unread button...")
-        time.sleep(5)
-        check_input = driver.find_element(By.XPATH, "//*[@id='unread-filter']")
+        check_input = wait_until(driver, EC.element_to_be_clickable(
+            (By.XPATH, "//*[@id='unread-filter']")))
         logging.info("Unread button found!")
         check_input.click()
         return True
@@ -183,18 +1190,59 @@ def click_unread_button(driver):
         return False
 
 
+def get_chat_header(driver):
+    """
+    Returns the text of the open chat's header, or None if no chat is open
+    """
+    headers = driver.find_elements(By.CSS_SELECTOR, "#main header")
+    try:
+        return headers[0].text if headers else None
+    except StaleElementReferenceException:
+        return None
+
+
+def wait_for_chat_open(driver, chat_title=None, previous_header=None):
+    """
+    Waits until a chat is open and ready to type in: its header shows the
+    expected title (or at least differs from the previous header) and the
+    message input box is rendered.
+    """
+    forget_chat_snapshot(driver)
+
+    def chat_ready(driver):
+        header = get_chat_header(driver)
+        if not header or (header == previous_header and not chat_title):
+            return False
+        if chat_title and chat_title not in header:
+            return False
+        return bool(driver.find_elements(By.XPATH, MESSAGE_BOX_XPATH))
+
+    wait_until(driver, chat_ready, "chat_open")
+    if REPLY_DETECTION == "observer":
+        install_message_observer(driver, reset=True)
+
+
+def row_title(element):
+    """
+    Returns the chat name shown on a sidebar or search result row, if any
+    """
+    titles = element.find_elements(By.XPATH, ".//span[@title]")
+    return titles[0].get_attribute("title") if titles else None
+
+
+@timed_step(errors_on=())
 def select_first_unread(driver):
     """
     Click on the first unread conversation from the unread tab
     """
     try:
         logging.info("Looking for unread messages...")
-        unread_msg = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable(
-                (By.XPATH, "/html/body/div[1]/div/div/div[3]/div/div[3]/div/div[3]/div[1]/div/div/div[1]/div/div"))
-        )
+        unread_msg = wait_until(driver, EC.element_to_be_clickable(
+            (By.XPATH, "/html/body/div[1]/div/div/div[3]/div/div[3]/div/div[3]/div[1]/div/div/div[1]/div/div")))
+        previous_header = get_chat_header(driver)
+        title = row_title(unread_msg)
         unread_msg.click()
-        time.sleep(8)
+        wait_for_chat_open(driver, title, previous_header)
         return True
 
     except Exception:
@@ -202,149 +1250,431 @@ def select_first_unread(driver):
         return False
 
 
-def send_message(driver, message):
+@dataclass
+class UnreadChat:
     """
-    Sends a message in the current chat
-
-    Args:
-        message: The message to be sent out
+    A chat with unread messages, as listed in the sidebar
     """
-    try:
-        logging.info("Looking for message input box...")
-        # Wait for the message input box
-        message_box = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((
-                By.XPATH, "//div[@contenteditable='true'][@data-tab='10']"
-            ))
-        )
+    name: str
+    unread: int
+    preview: str
+    timestamp: str
+    position: int  # 0 is the top of the sidebar, i.e. the most recent activity
+    row: object = None  # WebElement of the sidebar row
 
-        # Type and send message
-        message_box.clear()
-        message_box.send_keys(message)
-        time.sleep(2)
-        message_box.send_keys(Keys.ENTER)
-        logging.info("Message sent!")
-        return True
 
+def scan_unread_chats(driver):
+    """
+    Reads every chat with an unread badge from the sidebar in one script call.
+
+    Returns:
+        list: UnreadChat entries in sidebar order, or None if the sidebar could not be read
+    """
+    try:
+        rows = driver.execute_script(SCAN_UNREAD_JS)
     except Exception as e:
-        logging.error(f"Failed to send message: {str(e)}")
-        return False
+        logging.error(f"Failed to scan the sidebar: {str(e)}")
+        return None
+    if rows is None:
+        return None
+    return [UnreadChat(**row) for row in rows]
 
 
-def send_message_as_p(driver, message):
+def order_unread_chats(chats, policy=None):
     """
-    Sends a message in the current chat in the form of a paragraph instead of individual messages
+    Orders unread chats by the scheduling policy, the first one is opened next.
 
     Args:
-        message: An array of messages to be sent out
+        policy: "oldest" (default: SCHEDULING_POLICY) opens the chat that has waited longest,
+                "most_unread" the one with the most unread messages
     """
-    try:
-        logging.info("Looking for message input box...")
-        # Wait for the message input box
-        message_box = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((
-                By.XPATH, "//div[@contenteditable='true'][@data-tab='10']"
-            ))
-        )
-
-        # Type and send message
-        message_box.clear()
-        for line in message:
-            message_box.send_keys(line)
-            message_box.send_keys(Keys.SHIFT, Keys.ENTER)
-        time.sleep(1)
-        message_box.send_keys(Keys.ENTER)
-        logging.info("Message sent!")
-        return True
-
-    except Exception as e:
-        logging.error(f"Failed to send message: {str(e)}")
-        return False
+    policy = policy or SCHEDULING_POLICY
+    # The sidebar lists the most recent activity first
+    oldest_first = sorted(chats, key=lambda chat: chat.position, reverse=True)
+    if policy == "most_unread":
+        return sorted(oldest_first, key=lambda chat: chat.unread, reverse=True)
+    return oldest_first
 
 
-def search(driver, contact_to_search):
+def open_unread_chat(driver, chat):
     """
-    Search for a specific contact and open the conversation
+    Opens a chat from the sidebar and waits until it is ready
 
-    Args:
-        contact_to_search = Contact to search
+    Returns:
+        bool: True if the chat opened
     """
+    previous_header = get_chat_header(driver)
     try:
-        click_all_button(driver)
-        logging.info("Looking for search input box...")
-        # Wait for the search input box
-        search_box = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "selectable-text"))
-        )
-
-        time.sleep(3)
-        search_box.clear()
-        logging.info(f"Searching for {contact_to_search}")
-        search_box.send_keys(contact_to_search)
-        time.sleep(2)
+        chat.row.click()
+    except Exception:
+        # The sidebar re-rendered since the scan, find the row again by name
+        row = driver.execute_script(FIND_SIDEBAR_ROW_JS, chat.name)
+        if not row:
+            logging.warning(f"{chat.name} is no longer in the sidebar")
+            return False
+        row.click()
+    wait_for_chat_open(driver, chat.name, previous_header)
+    return True
 
-        # Check if search results are present BEFORE clicking
-        try:
-            search_results = driver.find_elements(
-                By.CLASS_NAME, "matched-text")
-            if not search_results:
-                logging.warning(
-                    f"No search results found for '{contact_to_search}'")
-                close_search_box(driver)
-                click_unread_button(driver)  # Close search if no results
-                return False
 
-            logging.info("Attempting to select matched result...")
-            # Function that clicks on the first result
-            select_first_search(driver)
-            return True  # Success
+@timed_step(errors_on=())
+def select_next_unread(driver):
+    """
+    Opens the next unread chat picked by the scheduling policy. Falls back to
+    clicking the first row of the unread tab if the sidebar cannot be scanned.
+    Workers only open chats they could claim, so they never use the fallback.
 
-        except Exception as e:
-            logging.error(f"Failed to select search result: {e}")
-            close_search_box(driver)
+    Returns:
+        bool: True if a chat was opened
+    """
+    chats = scan_unread_chats(driver)
+    if chats is None:
+        if coordinator:
+            logging.warning("Could not scan the sidebar, no chat can be claimed")
             return False
-
-    except Exception as e:
-        logging.error(f"Search failed: {e}")
+        return select_first_unread(driver)
+    if not chats:
+        logging.info("No unread messages")
         return False
 
+    chats = order_unread_chats(chats)
+    logging.info(f"{len(chats)} unread chat(s) waiting: " +
+                 ", ".join(f"{chat.name} ({chat.unread})" for chat in chats))
+    for chat in chats:
+        held = coordinator and coordinator.holds(chat.name)
+        if coordinator and not coordinator.claim(chat.name):
+            logging.info(f"{chat.name} is served by another worker")
+            continue
+        try:
+            if open_unread_chat(driver, chat):
+                return True
+        except Exception as e:
+            logging.error(f"Failed to open {chat.name}: {str(e)}")
+        # Let another worker take the chat instead of blocking it until the claim expires
+        if coordinator and not held:
+            coordinator.release(chat.name)
+    return False
 
-def close_search_box(driver):
+
+def count_outgoing_messages(driver):
     """
-    Close the search box
+    Returns the number of outgoing messages rendered in the open chat
     """
-    try:
-        logging.info("Closing search box...")
-        close_search = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((
-                By.CSS_SELECTOR, "[aria-label= 'Cancel search']"
-            ))
-        )
-        time.sleep(2)
-        close_search.click()
-        logging.info("Search box closed!")
-    except Exception as e:
-        logging.error({str(e)})
+    return len(driver.find_elements(By.CSS_SELECTOR, ".message-out"))
 
 
-def select_first_search(driver):
+def wait_for_message_sent(driver, previous_count):
     """
-    Click on the first searched conversation
+    Waits until a new outgoing message is rendered with its sent tick,
+    i.e. WhatsApp accepted it and it is no longer pending.
+    """
+    def tick_rendered(driver):
+        return driver.execute_script(
+            """
+            const outgoing = document.querySelectorAll('#main .message-out');
+            if (outgoing.length <= arguments[0]) { return false; }
+            return !!outgoing[outgoing.length - 1].querySelector(
+                '[data-icon^="msg-check"], [data-icon^="msg-dblcheck"]');
+            """, previous_count)
+
+    wait_until(driver, tick_rendered, "message_sent")
+
+
+def wait_for_input_text(driver, message_box):
+    """
+    Waits until the typed text is rendered in the message input box
+    """
+    wait_until(driver, lambda driver: message_box.text.strip(), "element")
+
+
+def normalize_text(text):
+    """
+    Drops all whitespace so typed and rendered text can be compared
+    """
+    return "".join(text.split())
+
+
+def insert_message_text(driver, message_box, text):
+    """
+    Inserts the whole message into the input box in one script call and
+    checks that the rendered text matches before it is sent.
+
+    Returns:
+        bool: True if the input box shows the message
+    """
+    driver.execute_script(INSERT_TEXT_JS, message_box, text)
+    expected = normalize_text(text)
+    try:
+        wait_until(driver, lambda driver: normalize_text(
+            driver.execute_script(RENDERED_TEXT_JS, message_box)) == expected, "input_text")
+        return True
+    except TimeoutException:
+        return False
+
+
+def type_message(driver, message_box, lines):
+    """
+    Types the lines key by key, with SHIFT+ENTER between them
+    """
+    message_box.clear()
+    for line in lines:
+        message_box.send_keys(line)
+        message_box.send_keys(Keys.SHIFT, Keys.ENTER)
+    wait_for_input_text(driver, message_box)
+
+
+def compose_message(driver, message_box, lines):
+    """
+    Puts the lines into the input box as one message, inserting them in one
+    step when FAST_SEND is on and typing them if the inserted text does not match.
+    """
+    if FAST_SEND:
+        if insert_message_text(driver, message_box, "\n".join(lines)):
+            return
+        logging.warning(
+            "Inserted text did not render as expected, typing the message instead")
+        driver.execute_script(INSERT_TEXT_JS, message_box, "")
+    type_message(driver, message_box, lines)
+
+
+class TokenBucket:
+    """
+    Rate limit of rate tokens per second, holding up to capacity tokens. A
+    token is taken per message sent; lower priorities need tokens left over.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _needed(self, priority):
+        return 1 + min(SEND_PRIORITIES[priority], self.capacity - 1)
+
+    def ready(self, priority):
+        """
+        Returns whether a message of the priority could be sent right away
+        """
+        if not self.rate:
+            return True
+        with self.lock:
+            self._refill()
+            return self.tokens >= self._needed(priority)
+
+    def acquire(self, priority):
+        """
+        Blocks until a message of the priority may be sent and takes its token
+
+        Returns the seconds waited
+        """
+        if not self.rate:
+            return 0.0
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                self._refill()
+                needed = self._needed(priority)
+                if self.tokens >= needed:
+                    self.tokens -= 1
+                    return time.monotonic() - start
+                delay = (needed - self.tokens) / self.rate
+            with waiting("rate_limit"):
+                time.sleep(delay)
+
+
+send_bucket = TokenBucket(SEND_RATE / 60, SEND_BURST)
+
+
+def take_send_slot(priority):
+    """
+    Waits for the send rate limit, recording the wait by priority
+    """
+    waited = send_bucket.acquire(priority)
+    metrics.observe("support_bot_send_wait_seconds", waited, priority=priority)
+    if waited >= 1:
+        logging.info(f"Rate limit held a {priority} message for {waited:.1f}s")
+
+
+@timed_step
+def send_message(driver, message, priority="reply"):
+    """
+    Sends a message in the current chat
+
+    Args:
+        message: The message to be sent out
+        priority: Priority class for the send rate limit, see SEND_PRIORITIES
+    """
+    try:
+        take_send_slot(priority)
+        logging.info("Looking for message input box...")
+        # Wait for the message input box
+        message_box = wait_until(driver, EC.element_to_be_clickable(
+            (By.XPATH, MESSAGE_BOX_XPATH)))
+
+        # Type and send message
+        compose_message(driver, message_box, [message])
+        sent_count = count_outgoing_messages(driver)
+        message_box.send_keys(Keys.ENTER)
+        wait_for_message_sent(driver, sent_count)
+        logging.info("Message sent!")
+        return True
+
+    except Exception as e:
+        logging.error(f"Failed to send message: {str(e)}")
+        return False
+
+
+@timed_step
+def send_message_as_p(driver, message, priority="reply"):
+    """
+    Sends a message in the current chat in the form of a paragraph instead of individual messages
+
+    Args:
+        message: An array of messages to be sent out
+        priority: Priority class for the send rate limit, see SEND_PRIORITIES
+    """
+    try:
+        take_send_slot(priority)
+        logging.info("Looking for message input box...")
+        # Wait for the message input box
+        message_box = wait_until(driver, EC.element_to_be_clickable(
+            (By.XPATH, MESSAGE_BOX_XPATH)))
+
+        # Type and send message
+        compose_message(driver, message_box, message)
+        sent_count = count_outgoing_messages(driver)
+        message_box.send_keys(Keys.ENTER)
+        wait_for_message_sent(driver, sent_count)
+        logging.info("Message sent!")
+        return True
+
+    except Exception as e:
+        logging.error(f"Failed to send message: {str(e)}")
+        return False
+
+
+@timed_step
+def search(driver, contact_to_search):
+    """
+    Search for a specific contact and open the conversation
+
+    Args:
+        contact_to_search = Contact to search
+    """
+    try:
+        click_all_button(driver)
+        logging.info("Looking for search input box...")
+        # Wait for the search input box
+        search_box = wait_until(driver, EC.element_to_be_clickable(
+            (By.CLASS_NAME, "selectable-text")))
+
+        search_box.clear()
+        logging.info(f"Searching for {contact_to_search}")
+        search_box.send_keys(contact_to_search)
+
+        # Check if search results are present BEFORE clicking
+        try:
+            try:
+                wait_until(driver, EC.presence_of_element_located(
+                    (By.CLASS_NAME, "matched-text")), "search")
+            except TimeoutException:
+                logging.warning(
+                    f"No search results found for '{contact_to_search}'")
+                close_search_box(driver)
+                click_unread_button(driver)  # Close search if no results
+                return False
+
+            logging.info("Attempting to select matched result...")
+            # Function that clicks on the first result
+            return select_first_search(driver, contact_to_search)
+
+        except Exception as e:
+            logging.error(f"Failed to select search result: {e}")
+            close_search_box(driver)
+            return False
+
+    except Exception as e:
+        logging.error(f"Search failed: {e}")
+        return False
+
+
+def close_search_box(driver):
+    """
+    Close the search box
+    """
+    try:
+        logging.info("Closing search box...")
+        close_search = wait_until(driver, EC.element_to_be_clickable(
+            (By.CSS_SELECTOR, "[aria-label= 'Cancel search']")))
+        close_search.click()
+        logging.info("Search box closed!")
+    except Exception as e:
+        logging.error({str(e)})
+
+
+def select_first_search(driver, chat_title=None):
+    """
+    Click on the first searched conversation
+
+    Args:
+        chat_title: Name of the searched chat, used to confirm the right chat opened
+
+    Returns:
+        bool: True if the conversation opened
     """
     try:
         logging.info("Opening conversation for searched")
-        searched_contact = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((
-                By.CLASS_NAME, 'matched-text'
-            ))
-        )
+        searched_contact = wait_until(driver, EC.element_to_be_clickable(
+            (By.CLASS_NAME, 'matched-text')))
 
+        previous_header = get_chat_header(driver)
         searched_contact.click()
+        wait_for_chat_open(driver, chat_title, previous_header)
         logging.info("Searched conversation opened!")
-        time.sleep(5)
+        return True
 
     except Exception as e:
         logging.error({str(e)})
+        return False
+
+
+# Header snapshot of the chat open in each driver, see get_chat_snapshot
+_chat_snapshots = {}
+
+
+def get_chat_snapshot(driver):
+    """
+    Reads the conversation type, name and contact details of the open chat in
+    one script call. The result is kept until another chat is opened or the
+    chat is closed, so each conversation reads its header only once.
+
+    Returns:
+        dict: {"type", "name", "contact"}, or None if the header cannot be read
+    """
+    snapshot = _chat_snapshots.get(id(driver))
+    if snapshot is None:
+        try:
+            snapshot = driver.execute_script(CHAT_HEADER_JS)
+        except Exception as e:
+            logging.error(f"Error reading chat header: {str(e)}")
+            return None
+        if snapshot:
+            _chat_snapshots[id(driver)] = snapshot
+    return snapshot
+
+
+def forget_chat_snapshot(driver):
+    """
+    Drops the header snapshot of the driver, called whenever the open chat changes
+    """
+    _chat_snapshots.pop(id(driver), None)
 
 
 def detect_conversation_type(driver):
@@ -354,414 +1684,2204 @@ def detect_conversation_type(driver):
     Returns:
         str: "group" or "personal" depending on the type of conversation
     """
+    snapshot = get_chat_snapshot(driver)
+    if not snapshot or snapshot["type"] == "unknown":
+        # If neither is found, log and return unknown
+        logging.warning("Could not determine conversation type")
+        return "unknown"
+    return snapshot["type"]
+
+
+def get_chat_name(driver):
+    """
+    Gets the name of the current chat, whether group or personal.
+
+    Returns:
+        str: The name of the current chat or False if it cannot be determined
+    """
+    conv_type = detect_conversation_type(driver)
+    if conv_type == "unknown":
+        return False
+
+    chat_name = get_chat_snapshot(driver)["name"]
+    logging.info(
+        f"{'Group' if conv_type == 'group' else 'Contact'} name: {chat_name}")
+    return chat_name
+
+
+def get_contact_details(driver):
+    """
+    Extracts the contact details of the current chat, gets the name if the contact is saved, or the contact number if the contact is not saved
+
+    Returns:
+        The name of the current selected chat
+    """
+    logging.info("Extracting contact details...")
+    snapshot = get_chat_snapshot(driver)
+    if not snapshot or not snapshot["contact"]:
+        logging.error(
+            "Couldn't fetch the phone number. It might be hidden or the XPath is outdated.")
+        return False
+
+    logging.info(f"Contact Number: {snapshot['contact']}")
+    return snapshot["contact"]
+
+
+class TicketSpool:
+    """
+    Local SQLite store for tickets that are not written to MySQL yet and for
+    ticket numbers reserved ahead of time, so both survive a restart.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_tickets (
+                    ticket_no INTEGER PRIMARY KEY,
+                    contact_details TEXT,
+                    issue_category TEXT,
+                    description TEXT,
+                    status TEXT,
+                    date_created TEXT,
+                    related_to INTEGER
+                )""")
+            # Spools created before tickets were linked to an outage
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(pending_tickets)")]
+            if "related_to" not in columns:
+                self.conn.execute("ALTER TABLE pending_tickets ADD COLUMN related_to INTEGER")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS reserved_ids (ticket_no INTEGER PRIMARY KEY)")
+            # Hands out provisional numbers, never reused, see add_provisional
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS provisional_ids (id INTEGER PRIMARY KEY AUTOINCREMENT)")
+            # Tickets whose number was taken in the database by another ticket
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS quarantined_tickets (
+                    ticket_no INTEGER,
+                    contact_details TEXT,
+                    issue_category TEXT,
+                    description TEXT,
+                    status TEXT,
+                    date_created TEXT,
+                    related_to INTEGER,
+                    reason TEXT,
+                    quarantined_at TEXT
+                )""")
+            # Reports to append to the description of a ticket, see merge_into_ticket
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_merges (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    merge_id TEXT,
+                    ticket_no INTEGER,
+                    report TEXT,
+                    contact_details TEXT,
+                    issue_category TEXT,
+                    description TEXT
+                )""")
+
+    def add_reserved(self, ticket_nos):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO reserved_ids VALUES (?)", [(n,) for n in ticket_nos])
+
+    def reserved_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM reserved_ids").fetchone()[0]
+
+    def take_reserved(self):
+        """
+        Returns the lowest reserved ticket number and removes it, or None if none is left
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT MIN(ticket_no) FROM reserved_ids").fetchone()
+            if row[0] is None:
+                return None
+            self.conn.execute(
+                "DELETE FROM reserved_ids WHERE ticket_no = ?", row)
+            return row[0]
+
+    def add(self, row):
+        """
+        Spools a ticket, row is (ticket_no, contact_details, issue_category, description, status,
+        date_created, related_to)
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO pending_tickets VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    def add_provisional(self, row):
+        """
+        Spools a ticket while no ticket number is reserved, under a negative
+        provisional number. row is the ticket without its number.
+
+        Returns the provisional number
+        """
+        with self.lock, self.conn:
+            provisional = -self.conn.execute("INSERT INTO provisional_ids DEFAULT VALUES").lastrowid
+            self.conn.execute(
+                "INSERT INTO pending_tickets VALUES (?, ?, ?, ?, ?, ?, ?)", (provisional, *row))
+            return provisional
+
+    def provisional(self):
+        """
+        Returns the spooled tickets waiting for a number as (provisional number, contact_details)
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT ticket_no, contact_details FROM pending_tickets WHERE ticket_no < 0 "
+                "ORDER BY ticket_no DESC").fetchall()
+
+    def renumber(self, provisional, ticket_no, note):
+        """
+        Gives a provisionally numbered ticket its ticket number, noting the
+        provisional reference in its description
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE pending_tickets SET ticket_no = ?, description = description || ? WHERE ticket_no = ?",
+                (ticket_no, note, provisional))
+            self.conn.execute(
+                "UPDATE pending_merges SET ticket_no = ? WHERE ticket_no = ?", (ticket_no, provisional))
+
+    def pending(self, limit=None):
+        """
+        Returns the spooled tickets, oldest first, all of them when no limit is given
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM pending_tickets ORDER BY ticket_no LIMIT ?",
+                (-1 if limit is None else limit,)).fetchall()
+
+    def add_merge(self, ticket_no, report, contact_details, issue_category, description):
+        """
+        Queues a report for a ticket under a merge id unique across workers,
+        with what is needed to open a new ticket if that one was closed meanwhile
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO pending_merges (merge_id, ticket_no, report, contact_details, "
+                "issue_category, description) VALUES (?, ?, ?, ?, ?, ?)",
+                (uuid.uuid4().hex, ticket_no, report, contact_details, issue_category, description))
+
+    def pending_merges(self, limit=None):
+        """
+        Returns the queued reports as (id, merge_id, ticket_no, report,
+        contact_details, issue_category, description), oldest first
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, merge_id, ticket_no, report, contact_details, issue_category, description "
+                "FROM pending_merges ORDER BY id LIMIT ?",
+                (-1 if limit is None else limit,)).fetchall()
+
+    def remove_merges(self, merges):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM pending_merges WHERE id = ?", [(merge[0],) for merge in merges])
+
+    def pending_for(self, contact_details):
+        """
+        Returns the numbers of the spooled ongoing tickets of a contact
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ticket_no FROM pending_tickets "
+                "WHERE contact_details = ? AND status = 'Ongoing' AND ticket_no > 0",
+                (contact_details,)).fetchall()
+        return [row[0] for row in rows]
+
+    def quarantine(self, row, reason):
+        """
+        Moves a spooled ticket that cannot be written to quarantined_tickets,
+        with the reports merged into it meanwhile added to its description
+        """
+        with self.lock, self.conn:
+            reports = self.conn.execute(
+                "SELECT report FROM pending_merges WHERE ticket_no = ? ORDER BY id", (row[0],)).fetchall()
+            self.conn.execute("DELETE FROM pending_merges WHERE ticket_no = ?", (row[0],))
+            self.conn.execute("DELETE FROM pending_tickets WHERE ticket_no = ?", (row[0],))
+            self.conn.execute(
+                "INSERT INTO quarantined_tickets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*row[:3], (row[3] or "") + "".join(report for report, in reports), *row[4:7],
+                 reason, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def remove_written(self, rows):
+        """
+        Removes tickets written to the database
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM pending_tickets WHERE ticket_no = ?", [(row[0],) for row in rows])
+
+
+_ticket_spool = None
+_ticket_spool_lock = threading.Lock()
+ticket_writer = None
+
+
+def get_ticket_spool():
+    """
+    Opens the local ticket spool on first use.
+    """
+    global _ticket_spool
+    with _ticket_spool_lock:
+        if _ticket_spool is None:
+            _ticket_spool = TicketSpool(TICKET_SPOOL_PATH)
+        return _ticket_spool
+
+
+def reserve_ticket_block(size=None):
+    """
+    Reserves a block of ticket numbers from the ticket_sequence table (created
+    by migrate.py) and keeps them in the spool, so tickets can be numbered while the database is down.
+
+    Returns True if the block was reserved
+    """
+    size = size or TICKET_ID_BLOCK
+    conn = connect_to_db()
+    if not conn:
+        logging.error("Database connection failed. Ticket numbers not reserved.")
+        return False
+
     try:
-        # Check for group indicators first
-        group_indicators = driver.find_elements(
-            By.XPATH, '//*[@id="main"]/header/div[2]/div[1]/div/span')
+        cursor = conn.cursor()
+        # Start after the tickets created before the sequence existed
+        cursor.execute("""
+        INSERT IGNORE INTO ticket_sequence (id, next_id)
+        SELECT 1, COALESCE(MAX(ticket_no), 0) + 1 FROM tickets
+        """)
+        with metrics.time("support_bot_db_query_seconds", query="reserve_ticket_numbers"):
+            cursor.execute(
+                "UPDATE ticket_sequence SET next_id = LAST_INSERT_ID(next_id + %s) WHERE id = 1", (size,))
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            end = cursor.fetchone()[0]
+            conn.commit()
+        cursor.close()
 
-        if group_indicators and len(group_indicators) > 0:
-            return "group"
+        get_ticket_spool().add_reserved(range(end - size, end))
+        logging.info(f"Reserved ticket numbers {end - size} to {end - 1}")
+        return True
 
-        # Check for personal chat indicators
-        personal_indicators = driver.find_elements(
-            By.XPATH, '//*[@id="main"]/header/div[2]/div/div/div/span')
+    except mysql.connector.Error as err:
+        logging.error(f"Database query error: {err}")
+        return False
 
-        if personal_indicators and len(personal_indicators) > 0:
-            return "personal"
+    finally:
+        conn.close()
+
+
+def provisional_reference(ticket_no):
+    """
+    Returns how a provisionally numbered ticket is shown to users and the IT group, e.g. P3
+    """
+    return f"P{-ticket_no}"
+
+
+def number_provisional_tickets():
+    """
+    Gives the tickets spooled without a ticket number their number, reserving
+    a block if none is left.
+
+    Returns:
+        bool: False if tickets are still waiting for a number
+    """
+    spool = get_ticket_spool()
+    for provisional, contact in spool.provisional():
+        ticket_no = spool.take_reserved()
+        if ticket_no is None:
+            if not reserve_ticket_block():
+                return False
+            ticket_no = spool.take_reserved()
+        reference = provisional_reference(provisional)
+        spool.renumber(provisional, ticket_no, f"\n[Reported as {reference} while no ticket number was available]")
+        invalidate_open_tickets(contact)
+        logging.info(f"Provisional ticket {reference} is ticket {ticket_no}")
+    return True
+
+
+def flush_tickets():
+    """
+    Writes the spooled tickets to the database in batches, then the reports
+    merged into tickets, once the tickets they go to are written. Tickets
+    spooled under a provisional number are numbered first.
+
+    Returns True if the spool is empty afterwards
+    """
+    spool = get_ticket_spool()
+    if not number_provisional_tickets():
+        return False
+    rows = spool.pending(TICKET_BATCH_SIZE)
+    merges = spool.pending_merges(TICKET_BATCH_SIZE)
+    if not rows and not merges:
+        return True
+
+    conn = connect_to_db()
+    if not conn:
+        logging.warning(
+            "Database connection failed. Tickets kept in the local spool.")
+        return False
+
+    try:
+        cursor = conn.cursor()
+        while rows:
+            try:
+                with metrics.time("support_bot_db_query_seconds", query="insert_tickets"):
+                    cursor.executemany(INSERT_TICKET_QUERY, rows)
+                    conn.commit()
+            except mysql.connector.IntegrityError as err:
+                if err.errno != errorcode.ER_DUP_ENTRY:
+                    raise
+                conn.rollback()
+                write_tickets_one_by_one(conn, cursor, rows)
+            else:
+                spool.remove_written(rows)
+                logging.info(f"Wrote {len(rows)} ticket(s) to the database")
+            rows = spool.pending(TICKET_BATCH_SIZE)
+
+        merges = spool.pending_merges(TICKET_BATCH_SIZE)
+        while merges:
+            for merge in merges:
+                if not apply_merge(conn, cursor, merge):
+                    return False
+                spool.remove_merges([merge])
+            logging.info(f"Added {len(merges)} merged report(s) to their tickets")
+            merges = spool.pending_merges(TICKET_BATCH_SIZE)
+        cursor.close()
+        return True
+
+    except mysql.connector.Error as err:
+        logging.error(f"Database query error: {err}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def apply_merge(conn, cursor, merge):
+    """
+    Appends a merged report to its ticket, in one transaction with the record
+    of its merge id. A merge recorded before was applied before a crash and is
+    skipped. If the ticket was closed after the user agreed to the merge, the
+    report is written as a new ticket instead.
+
+    Returns:
+        bool: False if no ticket number was left for the new ticket, the merge stays spooled
+    """
+    _, merge_id, ticket_no, report, contact_details, issue_category, description = merge
+    with metrics.time("support_bot_db_query_seconds", query="merge_tickets"):
+        try:
+            cursor.execute(RECORD_MERGE_QUERY, (merge_id, ticket_no))
+        except mysql.connector.IntegrityError as err:
+            if err.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            conn.rollback()
+            logging.info(f"Merge {merge_id} into ticket {ticket_no} was applied before, dropped from the spool")
+            return True
+        cursor.execute(MERGE_REPORT_QUERY, (report, ticket_no))
+        merged = cursor.rowcount > 0
+        if not merged:
+            spool = get_ticket_spool()
+            new_ticket_no = spool.take_reserved()
+            if new_ticket_no is None and reserve_ticket_block():
+                new_ticket_no = spool.take_reserved()
+            if new_ticket_no is None:
+                conn.rollback()
+                return False
+            cursor.execute(INSERT_TICKET_QUERY, (
+                new_ticket_no, contact_details, issue_category,
+                f"{description}\n[Reported again after ticket #{ticket_no} was closed]",
+                "Ongoing", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), None))
+        conn.commit()
+
+    if not merged:
+        invalidate_open_tickets(contact_details)
+        metrics.inc("support_bot_tickets_created_total", category=issue_category)
+        logging.warning(f"Ticket {ticket_no} was closed before the report of {contact_details} "
+                        f"was added, created ticket {new_ticket_no} instead")
+    return True
+
+
+def write_tickets_one_by_one(conn, cursor, rows):
+    """
+    Writes a batch in which a ticket number was taken one ticket at a time.
+    A ticket found with the same contact and creation time was written before
+    a crash and is only dropped from the spool. Any other clash is moved to the
+    spool's quarantined_tickets table for the IT team to re-enter, instead of
+    overwriting the ticket in the database.
+    """
+    spool = get_ticket_spool()
+    for row in rows:
+        try:
+            cursor.execute(INSERT_TICKET_QUERY, row)
+            conn.commit()
+        except mysql.connector.IntegrityError as err:
+            if err.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            conn.rollback()
+            cursor.execute(
+                "SELECT contact_details, date_created FROM tickets WHERE ticket_no = %s", (row[0],))
+            existing = cursor.fetchone()
+            if not existing or existing[0] != row[1] or str(existing[1]) != row[5]:
+                spool.quarantine(row, f"Ticket number taken by a ticket of {existing[0] if existing else 'unknown'}")
+                duplicate_index.set_status(row[0], "Quarantined")
+                invalidate_open_tickets(row[1])
+                metrics.inc("support_bot_tickets_quarantined_total")
+                logging.error(f"Ticket {row[0]} of {row[1]} clashes with a ticket in the database. "
+                              f"Moved to quarantined_tickets in {TICKET_SPOOL_PATH}.")
+                continue
+            logging.info(f"Ticket {row[0]} was written before, dropped from the spool")
+        spool.remove_written([row])
+
+
+class TicketWriter(threading.Thread):
+    """
+    Background thread that writes spooled tickets to MySQL and keeps a block of
+    ticket numbers reserved. While the database is unreachable the tickets stay
+    in the spool and the thread retries with backoff.
+    """
+
+    def __init__(self):
+        super().__init__(name="ticket-writer", daemon=True)
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def run(self):
+        delay = TICKET_FLUSH_INTERVAL
+        while not self.stopping.is_set():
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            try:
+                ok = flush_tickets()
+                if ok and get_ticket_spool().reserved_count() < TICKET_ID_LOW_WATER:
+                    ok = reserve_ticket_block()
+                if ok:
+                    ok = ticket_changes.poll()
+            except Exception as e:
+                logging.error(f"Ticket writer error: {e}")
+                ok = False
+            delay = TICKET_FLUSH_INTERVAL if ok else min(
+                delay * 2, TICKET_RETRY_MAX)
+
+        flush_tickets()
+
+    def stop(self, timeout=10):
+        self.stopping.set()
+        self.wakeup.set()
+        self.join(timeout)
+
+
+def check_schema():
+    """
+    Checks that the tickets table has the columns, and the database the
+    tables, added by migrate.py.
+
+    Returns:
+        bool: False if one is missing, True otherwise (also when the database is unreachable)
+    """
+    conn = connect_to_db()
+    if not conn:
+        logging.warning("Database connection failed. Schema not checked.")
+        return True
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(REQUIRED_TICKET_COLUMNS)} FROM tickets LIMIT 0")
+        cursor.fetchall()
+        for table in REQUIRED_TABLES:
+            cursor.execute(f"SELECT 1 FROM {table} LIMIT 0")
+            cursor.fetchall()
+        cursor.close()
+        return True
+
+    except mysql.connector.Error as err:
+        if err.errno not in (errorcode.ER_BAD_FIELD_ERROR, errorcode.ER_NO_SUCH_TABLE):
+            logging.warning(f"Schema not checked: {err}")
+            return True
+        logging.critical(f"The database schema is out of date ({err.msg}). Run 'python migrate.py upgrade'.")
+        return False
+
+    finally:
+        conn.close()
+
+
+def start_ticket_writer():
+    """
+    Starts the background ticket writer, which replays tickets spooled by a previous run first,
+    after rebuilding the duplicate index. Exits if the database schema is out of date.
+    """
+    global ticket_writer
+    if not check_schema():
+        sys.exit("Database schema is out of date, run 'python migrate.py upgrade'")
+    rebuild_duplicate_index()
+    ticket_writer = TicketWriter()
+    ticket_writer.start()
+    ticket_writer.wakeup.set()
+    return ticket_writer
+
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire after a time-to-live. The least
+    recently used entry is evicted once it holds maxsize entries.
+    """
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> (expires at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the cached value, or None if it is missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def update(self, key, func):
+        """
+        Replaces a cached value with func(value), keeping its expiry. Missing keys are left alone.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries[key] = (entry[0], func(entry[1]))
+
+    def invalidate(self, key=None):
+        """
+        Drops one entry, or every entry when no key is given
+        """
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return (f"{self.hits} hits, {self.misses} misses "
+                f"({self.hits / total * 100 if total else 0:.0f}% hit rate), {len(self.entries)} entries")
+
+
+# Ongoing ticket numbers per contact, see lookup_open_tickets
+open_ticket_cache = TTLCache(OPEN_TICKET_CACHE_TTL, OPEN_TICKET_CACHE_SIZE)
+
+
+def lookup_open_tickets(contact_details):
+    """
+    Returns the numbers of the contact's ongoing tickets, served from
+    open_ticket_cache when possible. Raises mysql.connector.Error if the query fails.
+
+    Returns:
+        list: Ticket numbers in ascending order, or None if the database is unreachable
+    """
+    tickets = open_ticket_cache.get(contact_details)
+    if tickets is not None:
+        logging.info("Found user's existing tickets in the cache")
+        return list(tickets)
+
+    conn = connect_to_db()
+    if not conn:
+        logging.error("Database connection failed. Cannot retrieve tickets.")
+        return None
+
+    try:
+        cursor = conn.cursor()
+
+        # Fetch user's ongoing tickets
+        with metrics.time("support_bot_db_query_seconds", query="open_tickets"):
+            cursor.execute(OPEN_TICKETS_QUERY, (contact_details,))
+            tickets = {row[0] for row in cursor.fetchall()}
+        logging.info("Checking DB for user's existing tickets")
+        cursor.close()
+    finally:
+        conn.close()
+
+    # Tickets still waiting in the spool are not in the database yet
+    tickets.update(get_ticket_spool().pending_for(contact_details))
+    tickets = sorted(tickets)
+    open_ticket_cache.set(contact_details, tickets)
+    return list(tickets)
+
+
+def invalidate_open_tickets(contact_details=None):
+    """
+    Drops cached open tickets after a ticket's status changed, for one contact
+    or for everyone. Without a call, a status change shows up once the entry expires.
+    """
+    open_ticket_cache.invalidate(contact_details)
+
+
+class TicketChanges:
+    """
+    Follows the tickets changed in the database through their updated_at column,
+    e.g. a ticket closed by the IT team. Drops the cached open tickets of their
+    contacts and updates their status in the duplicate index, or indexes the
+    tickets other workers created, so they cluster each other's outages. Rows changed within the second of the last poll are seen
+    again by the next one, so they are remembered and skipped.
+    """
+
+    def __init__(self):
+        self.since = None
+        self.seen = set()
+
+    def poll(self):
+        """
+        Returns:
+            bool: False if the database is unreachable or the query failed
+        """
+        conn = connect_to_db()
+        if not conn:
+            return False
+
+        first = self.since is None
+        try:
+            cursor = conn.cursor()
+            if first:
+                # Nothing is cached before the first poll, start from the latest change
+                cursor.execute("SELECT COALESCE(MAX(updated_at), '1970-01-01 00:00:00') FROM tickets")
+                self.since = cursor.fetchone()[0]
+            with metrics.time("support_bot_db_query_seconds", query="ticket_changes"):
+                cursor.execute(TICKET_CHANGES_QUERY, (self.since,))
+                rows = cursor.fetchall()
+            cursor.close()
+
+        except mysql.connector.Error as err:
+            logging.error(f"Database query error: {err}")
+            return False
+
+        finally:
+            conn.close()
+
+        changed = [] if first else [row for row in rows if (row[0], row[-1]) not in self.seen]
+        cluster_start = time.time() - DUPLICATE_CLUSTER_WINDOW
+        for ticket_no, contact, status, category, description, created, related_to, _ in changed:
+            invalidate_open_tickets(contact)
+            if not duplicate_index.set_status(ticket_no, status):
+                # Created by another worker of supervisor.py
+                entry = indexed_ticket(ticket_no, contact, category, description, status,
+                                       created, related_to, cluster_start)
+                if entry:
+                    duplicate_index.add(entry)
+        if rows:
+            self.since = rows[-1][-1]
+            self.seen = {(row[0], row[-1]) for row in rows if row[-1] == self.since}
+        if changed:
+            logging.info(f"Dropped cached open tickets of {len(changed)} changed ticket(s)")
+        return True
+
+
+ticket_changes = TicketChanges()
+
+
+@dataclass
+class IndexedTicket:
+    ticket_no: int
+    contact_details: str
+    issue_category: str
+    created_at: float  # time.time() when the ticket was created
+    signature: tuple
+    related_to: int = None  # First ticket of the outage this ticket was linked to
+    status: str = "Ongoing"
+
+
+class DuplicateIndex:
+    """
+    MinHash signatures of the descriptions of recent tickets, bucketed by band
+    (locality-sensitive hashing), so a new ticket is only compared to the tickets
+    of its category sharing a bucket with it instead of to every recent ticket.
+
+    Descriptions are compared on their character shingles, so rewording or a
+    typo still matches. A signature hashes each shingle once into one of
+    MINHASH_SIZE bins (one permutation hashing) and fills the empty bins from
+    the next filled one, so short descriptions fill every band too.
+    """
+    WORD_RE = re.compile(r"[a-z0-9]+")
+    SHINGLE_SIZE = 3
+
+    def __init__(self, size=MINHASH_SIZE, bands=MINHASH_BANDS):
+        self.size = size
+        self.bands = bands
+        self.rows = size // bands
+        self.span = (1 << 32) // size  # Values of a bin are below this
+        self.entries = {}  # ticket_no -> IndexedTicket
+        # (created_at, ticket_no) of the entries, oldest first. Tickets of other
+        # workers arrive out of order, so the order they were added in is no guide
+        self.by_age = []
+        self.newest = 0  # created_at of the newest ticket indexed
+        self.buckets = {}  # (category, band, values of the band) -> set of ticket numbers
+        self.outages = {}  # first ticket of an outage -> number of tickets linked to it, itself included
+        self.lock = threading.Lock()
+
+    def signature(self, text):
+        """
+        Returns:
+            tuple: MinHash of the description, or None if no word is left to compare
+        """
+        text = " ".join(word for word in self.WORD_RE.findall(text.lower())
+                        if word not in DUPLICATE_STOP_WORDS)
+        if not text:
+            return None
+
+        size = self.size
+        bins = [None] * size
+        for i in range(max(len(text) - self.SHINGLE_SIZE + 1, 1)):
+            h = zlib.crc32(text[i:i + self.SHINGLE_SIZE].encode())
+            slot, value = h % size, h // size
+            if bins[slot] is None or value < bins[slot]:
+                bins[slot] = value
+
+        # An empty bin takes the value of the next filled one, offset by the
+        # distance, so two signatures only agree there if they agree on the filled bin
+        signature = list(bins)
+        value, distance = None, 0
+        for i in range(2 * size - 1, -1, -1):
+            slot = i % size
+            if bins[slot] is not None:
+                value, distance = bins[slot], 0
+            else:
+                distance += 1
+                if i < size:
+                    signature[slot] = value + distance * self.span
+        return tuple(signature)
+
+    def _keys(self, category, signature):
+        rows = self.rows
+        return [(category, band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def similar(self, issue_category, signature):
+        """
+        Returns:
+            list: (similarity, IndexedTicket) of the tickets of the category at
+            least DUPLICATE_THRESHOLD similar to the signature, most similar first
+        """
+        with self.lock:
+            candidates = set()
+            for key in self._keys(issue_category, signature):
+                candidates.update(self.buckets.get(key, ()))
+            matches = []
+            for ticket_no in candidates:
+                entry = self.entries[ticket_no]
+                similarity = sum(map(operator.eq, signature, entry.signature)) / self.size
+                if similarity >= DUPLICATE_THRESHOLD:
+                    matches.append((similarity, entry))
+        matches.sort(key=lambda match: (-match[0], match[1].ticket_no))
+        return matches
+
+    def add(self, entry):
+        """
+        Indexes a ticket and drops the tickets older than DUPLICATE_CONTACT_DAYS
+        """
+        with self.lock:
+            self.entries[entry.ticket_no] = entry
+            heapq.heappush(self.by_age, (entry.created_at, entry.ticket_no))
+            self.newest = max(self.newest, entry.created_at)
+            for key in self._keys(entry.issue_category, entry.signature):
+                self.buckets.setdefault(key, set()).add(entry.ticket_no)
+            if entry.related_to:
+                self.outages[entry.related_to] = self.outages.get(entry.related_to, 1) + 1
+
+            oldest = self.newest - DUPLICATE_CONTACT_DAYS * 86400
+            while self.by_age and self.by_age[0][0] < oldest:
+                created_at, ticket_no = heapq.heappop(self.by_age)
+                first = self.entries.get(ticket_no)
+                if first is None or first.created_at != created_at:
+                    continue  # Already dropped, or indexed again since
+                del self.entries[first.ticket_no]
+                self.outages.pop(first.ticket_no, None)
+                for key in self._keys(first.issue_category, first.signature):
+                    bucket = self.buckets[key]
+                    bucket.discard(first.ticket_no)
+                    if not bucket:
+                        del self.buckets[key]
+
+    def set_status(self, ticket_no, status):
+        """
+        Returns False if the ticket is not indexed
+        """
+        with self.lock:
+            entry = self.entries.get(ticket_no)
+            if entry:
+                entry.status = status
+            return entry is not None
+
+    def outage_size(self, ticket_no):
+        """
+        Returns the number of tickets linked to the outage that started with ticket_no, itself included
+        """
+        with self.lock:
+            return self.outages.get(ticket_no, 1)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Recent tickets checked by create_ticket, filled by rebuild_duplicate_index at startup
+duplicate_index = DuplicateIndex()
+
+
+def indexed_ticket(ticket_no, contact, category, description, status, created, related_to, cluster_start):
+    """
+    Returns the IndexedTicket of a ticket row, or None if it is not worth
+    indexing: closed before cluster_start, or without a description
+    """
+    if isinstance(created, str):
+        created = datetime.strptime(created, "%Y-%m-%d %H:%M:%S")
+    created_at = created.timestamp()
+    if status != "Ongoing" and created_at < cluster_start:
+        return None
+    signature = duplicate_index.signature(description) if description and description != NO_DESCRIPTION else None
+    if not signature:
+        return None
+    return IndexedTicket(ticket_no, contact, category, created_at, signature, related_to, status)
+
+
+def rebuild_duplicate_index():
+    """
+    Rebuilds the duplicate index from the tickets created in the last
+    DUPLICATE_CONTACT_DAYS days, in the database and in the spool. Only the
+    ongoing ones are kept, and the closed ones of the last
+    DUPLICATE_CLUSTER_WINDOW seconds for outages. Without the database only
+    the spooled tickets are indexed.
+
+    Returns:
+        int: The number of tickets indexed
+    """
+    global duplicate_index
+    started = time.perf_counter()
+    since = datetime.now() - timedelta(days=DUPLICATE_CONTACT_DAYS)
+    rows = {}
+    conn = connect_to_db()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            with metrics.time("support_bot_db_query_seconds", query="recent_tickets"):
+                cursor.execute(DUPLICATE_INDEX_QUERY, (since.strftime("%Y-%m-%d %H:%M:%S"),))
+                rows = {row[0]: row[1:] for row in cursor.fetchall()}
+            cursor.close()
+        except mysql.connector.Error as err:
+            logging.error(f"Database query error: {err}")
+        finally:
+            conn.close()
+    else:
+        logging.warning("Database connection failed. Only spooled tickets are checked for duplicates.")
+    # The spool has the latest description of the tickets it still holds
+    for row in get_ticket_spool().pending():
+        rows[row[0]] = row[1:]
+
+    cluster_start = time.time() - DUPLICATE_CLUSTER_WINDOW
+    entries = [indexed_ticket(ticket_no, *row, cluster_start) for ticket_no, row in rows.items()]
+    index = DuplicateIndex()
+    for entry in sorted(filter(None, entries), key=lambda entry: entry.created_at):
+        index.add(entry)
+
+    duplicate_index = index
+    logging.info(f"Indexed {len(index)} recent tickets for duplicate checks in "
+                 f"{(time.perf_counter() - started) * 1000:.0f} ms")
+    return len(index)
+
+
+def find_duplicate(contact_details, issue_category, signature):
+    """
+    Looks for an indexed ticket the new one repeats: a similar ongoing ticket
+    of the same contact, or a similar ticket of another contact created in the
+    last DUPLICATE_CLUSTER_WINDOW seconds, when many users report the same outage.
+    Only the index is consulted, the ticket writer keeps its statuses current.
+
+    Returns:
+        (ongoing ticket of the contact the report repeats, first ticket of the
+        outage to link a new ticket to), either or both None
+    """
+    if signature is None:
+        return None, None
+    with metrics.time("support_bot_duplicate_check_seconds"):
+        matches = duplicate_index.similar(issue_category, signature)
+
+    cluster_start = time.time() - DUPLICATE_CLUSTER_WINDOW
+    own = next((entry.ticket_no for _, entry in matches
+                if entry.contact_details == contact_details and entry.status == "Ongoing"), None)
+    outage = next((entry.related_to or entry.ticket_no for _, entry in matches
+                   if entry.contact_details != contact_details and entry.created_at >= cluster_start), None)
+    return own, outage
+
+
+def find_open_duplicate(contact_details, issue_category, description):
+    """
+    Returns the number of the contact's ongoing ticket the description repeats, or None
+    """
+    if description == NO_DESCRIPTION:
+        return None
+    return find_duplicate(contact_details, issue_category, duplicate_index.signature(description))[0]
+
+
+def merge_into_ticket(ticket_no, contact_details, issue_category, description):
+    """
+    Queues a further report to be appended to the description of an ongoing
+    ticket. Like new tickets, it is kept in the spool and the ticket writer
+    adds it once the ticket is in the database, see apply_merge.
+    """
+    report = f"\n[{datetime.now():%Y-%m-%d %H:%M}] Reported again: {description}"
+    get_ticket_spool().add_merge(ticket_no, report, contact_details, issue_category, description)
+    if ticket_writer and ticket_writer.is_alive():
+        ticket_writer.wakeup.set()
+    else:
+        flush_tickets()  # No writer running, write through
+
+
+@dataclass
+class CreatedTicket:
+    ticket_no: int
+    merged: bool = False  # The report was added to an ongoing ticket of the contact
+    related_to: int = None  # First ticket of the outage the new ticket was linked to
+    outage_size: int = 1  # Tickets linked to that outage, the first one included
+
+    @property
+    def provisional(self):
+        """
+        The ticket was spooled without a ticket number, see number_provisional_tickets
+        """
+        return self.ticket_no < 0
+
+    @property
+    def reference(self):
+        return provisional_reference(self.ticket_no) if self.provisional else f"#{self.ticket_no}"
+
+
+@timed_step(errors_on=(None,))
+def create_ticket(contact_details, issue_category, description, merge_into=None):
+    """
+    Creates a new ticket. The ticket is numbered from the reserved block and
+    spooled locally right away, the background writer inserts it into the database.
+    Without a reserved number it is spooled under a provisional one, and the
+    writer numbers it once it can reserve more, so the database is never waited for.
+
+    A ticket similar to one of another contact from the last hour is linked to
+    it as the same outage.
+
+    Args:
+        contact_details: contact number or name,
+        issue_category: Type of issue
+        description: Brief description of the message
+        merge_into: Ongoing ticket of the contact to add the description to
+            instead, once the user confirmed it is the same issue
+
+    Returns:
+        CreatedTicket, or None if no ticket could be created
+    """
+    if merge_into:
+        merge_into_ticket(merge_into, contact_details, issue_category, description)
+        log_ticket.set(merge_into)
+        metrics.inc("support_bot_duplicate_reports_total", action="merged", category=issue_category)
+        logging.info(f"Report merged into ongoing ticket {merge_into}.")
+        return CreatedTicket(merge_into, merged=True)
+
+    signature = None if description == NO_DESCRIPTION else duplicate_index.signature(description)
+    _, related_to = find_duplicate(contact_details, issue_category, signature)
+
+    spool = get_ticket_spool()
+    current_time = datetime.now()
+    row = (contact_details, issue_category, description,
+           "Ongoing", current_time.strftime("%Y-%m-%d %H:%M:%S"), related_to)
+    ticket_no = spool.take_reserved()
+    if ticket_no is None:
+        # The block ran out before the writer could top it up, e.g. the database is down
+        ticket_no = spool.add_provisional(row)
+        logging.warning(f"No ticket number reserved, spooled as {provisional_reference(ticket_no)}")
+    else:
+        spool.add((ticket_no, *row))
+    log_ticket.set(ticket_no)
+    metrics.inc("support_bot_tickets_created_total", category=issue_category)
+    logging.info(f"Ticket {ticket_no} created successfully.")
+    if ticket_no > 0:
+        # A provisional ticket is indexed and cached once the writer numbered it
+        open_ticket_cache.update(
+            contact_details, lambda tickets: tickets + [ticket_no])
+        if signature:
+            duplicate_index.add(IndexedTicket(ticket_no, contact_details, issue_category,
+                                              current_time.timestamp(), signature, related_to))
+    if related_to:
+        metrics.inc("support_bot_duplicate_reports_total", action="linked", category=issue_category)
+        logging.info(f"Ticket {ticket_no} linked to the outage of ticket {related_to}.")
+
+    if ticket_writer and ticket_writer.is_alive():
+        ticket_writer.wakeup.set()
+    else:
+        flush_tickets()  # No writer running, write through
+
+    return CreatedTicket(ticket_no, related_to=related_to,
+                         outage_size=duplicate_index.outage_size(related_to) if related_to else 1)
+
+
+class WorkerCoordinator:
+    """
+    SQLite store shared by the worker processes of supervisor.py. Workers claim
+    a chat before opening it, so two of them never serve the same user, report
+    a heartbeat every scheduler loop and hand their notifications to the
+    notifier through an outbox.
+    """
+
+    def __init__(self, path, worker_id):
+        self.worker_id = worker_id
+        self.lock = threading.Lock()
+        # Autocommit, every statement is its own transaction
+        self.conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chat_claims (
+                    chat_name TEXT PRIMARY KEY,
+                    worker TEXT,
+                    expires_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker TEXT PRIMARY KEY,
+                    pid INTEGER,
+                    heartbeat_at REAL,
+                    handled INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    worker TEXT,
+                    message TEXT,
+                    queued_at REAL
+                );""")
+
+    def claim(self, chat_name):
+        """
+        Claims a chat for this worker, or renews the claim if it already holds it
+
+        Returns:
+            bool: False if another worker holds the chat
+        """
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute("""
+                INSERT INTO chat_claims VALUES (?, ?, ?)
+                ON CONFLICT(chat_name) DO UPDATE SET worker = excluded.worker, expires_at = excluded.expires_at
+                WHERE chat_claims.worker = excluded.worker OR chat_claims.expires_at < ?""",
+                (chat_name, self.worker_id, now + CHAT_CLAIM_TTL, now))
+            return cursor.rowcount > 0
+
+    def holds(self, chat_name):
+        """
+        Returns True if this worker holds an unexpired claim on the chat
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM chat_claims WHERE chat_name = ? AND worker = ? AND expires_at >= ?",
+                (chat_name, self.worker_id, time.time())).fetchone()
+        return row is not None
+
+    def renew(self, chat_names):
+        """
+        Extends the claims on the chats this worker is still serving
+        """
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE chat_claims SET expires_at = ? WHERE chat_name = ? AND worker = ?",
+                [(time.time() + CHAT_CLAIM_TTL, name, self.worker_id) for name in chat_names])
+
+    def release(self, chat_name):
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM chat_claims WHERE chat_name = ? AND worker = ?",
+                (chat_name, self.worker_id))
+
+    def release_all(self, worker_id=None):
+        """
+        Drops every claim of a worker (default: this one), e.g. after it was restarted
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM chat_claims WHERE worker = ?",
+                              (worker_id or self.worker_id,))
+
+    def heartbeat(self, handled=0):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?)",
+                (self.worker_id, os.getpid(), time.time(), handled))
+
+    def heartbeats(self):
+        """
+        Returns {worker: (pid, last heartbeat, chats handled)}
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM workers").fetchall()
+        return {worker: (pid, heartbeat_at, handled) for worker, pid, heartbeat_at, handled in rows}
+
+    def add_notification(self, message):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO outbox (worker, message, queued_at) VALUES (?, ?, ?)",
+                (self.worker_id, json.dumps(message), time.time()))
+
+    def pending_notifications(self, limit=20):
+        """
+        Returns the oldest waiting notifications as [(id, message)]
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, message FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(row_id, json.loads(message)) for row_id, message in rows]
+
+    def remove_notification(self, row_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+
+
+# Set in main when running as a worker of supervisor.py
+coordinator = None
+
+
+class Transport(ABC):
+    """
+    What the conversation flows need from WhatsApp. The flows and the
+    scheduler only talk to a transport, so they run the same against the
+    browser (SeleniumTransport) and against the in-memory simulator
+    (simulator.SimulatedTransport). Unless a chat is named, methods act on the open chat.
+    """
+
+    # Rate limit the send queue waits for before sending a notification, off
+    # unless the transport is throttled
+    send_bucket = TokenBucket(0, 1)
+
+    @abstractmethod
+    def list_unread(self):
+        """
+        Returns the chats with unread messages as UnreadChat, or None if they cannot be listed
+        """
+
+    @abstractmethod
+    def open_chat(self, chat_name):
+        """
+        Opens a chat by name
+
+        Returns:
+            bool: True if the chat opened
+        """
+
+    def open_next_unread(self):
+        """
+        Opens the unread chat picked by the scheduling policy, skipping chats
+        another worker claimed
+
+        Returns:
+            bool: True if a chat was opened
+        """
+        chats = self.list_unread()
+        if not chats:
+            return False
+        for chat in order_unread_chats(chats):
+            held = coordinator and coordinator.holds(chat.name)
+            if coordinator and not coordinator.claim(chat.name):
+                continue
+            if self.open_chat(chat.name):
+                return True
+            if coordinator and not held:
+                coordinator.release(chat.name)
+        return False
+
+    @abstractmethod
+    def close_chat(self):
+        """
+        Closes the open chat
+        """
+
+    def show_unread(self):
+        """
+        Goes back to the unread chats after a chat was opened by name
+        """
+
+    @abstractmethod
+    def chat_name(self):
+        """
+        Returns the name of the open chat, or False if no chat is open
+        """
+
+    @abstractmethod
+    def contact_details(self):
+        """
+        Returns the number of the open chat's contact, or its name if the number is hidden
+        """
+
+    @abstractmethod
+    def receive(self, timeout, cursor=None):
+        """
+        Waits up to timeout seconds for new messages
+
+        Args:
+            cursor: The last message already handled, if known
+
+        Returns:
+            (list of message texts, oldest first, cursor after the last of them,
+            or the cursor given if none arrived)
+        """
+
+    @abstractmethod
+    def read_since(self, cursor):
+        """
+        Reads the messages received after the one the cursor points at, or
+        after the last message sent when there is no cursor
+
+        Returns:
+            (list of message texts, oldest first, cursor after the last of them)
+        """
+
+    def cursor(self):
+        """
+        Returns the cursor of the last message received
+        """
+        return self.read_since(None)[1]
+
+    @abstractmethod
+    def send(self, message, priority="reply"):
+        """
+        Sends one line, returns True if it was sent
+        """
+
+    @abstractmethod
+    def send_paragraph(self, message, priority="reply"):
+        """
+        Sends a list of lines as one message, returns True if it was sent
+        """
+
+    def send_to(self, chat_name, message, priority):
+        """
+        Sends a list of lines as one message to another chat and closes it again
+
+        Returns:
+            bool: True if the message was sent
+        """
+        if not self.open_chat(chat_name):
+            return False
+        sent = self.send_paragraph(message, priority=priority)
+        self.close_chat()
+        self.show_unread()
+        return sent
+
+
+class SeleniumTransport(Transport):
+    """
+    Drives WhatsApp Web in Chrome through the Selenium helpers above
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    @property
+    def send_bucket(self):
+        # The module's bucket, which send_message and send_message_as_p take their slots from
+        return send_bucket
+
+    def list_unread(self):
+        return scan_unread_chats(self.driver)
+
+    def open_chat(self, chat_name):
+        return search(self.driver, chat_name)
+
+    def open_next_unread(self):
+        # Clicks the scanned rows, and knows a fallback when the sidebar cannot be scanned
+        return select_next_unread(self.driver)
+
+    def close_chat(self):
+        close_chat(self.driver)
+
+    def show_unread(self):
+        click_unread_button(self.driver)
+
+    def chat_name(self):
+        return get_chat_name(self.driver)
+
+    def contact_details(self):
+        return get_contact_details(self.driver)
+
+    def receive(self, timeout, cursor=None):
+        return wait_for_user_reply(self.driver, timeout=timeout, cursor=cursor)
+
+    def read_since(self, cursor):
+        # Messages read here must not be delivered again by the message observer
+        return read_messages_since(self.driver, cursor, consume=True)
+
+    def cursor(self):
+        return get_message_cursor(self.driver)
+
+    def send(self, message, priority="reply"):
+        return send_message(self.driver, message, priority=priority)
+
+    def send_paragraph(self, message, priority="reply"):
+        return send_message_as_p(self.driver, message, priority=priority)
+
+    def send_to(self, chat_name, message, priority):
+        if chat_name == GROUP_TO_NOTIFY:
+            # Goes through the notification window when it is open
+            return send_to_group(self.driver, message)
+        return super().send_to(chat_name, message, priority)
+
+
+MAX_RETRIES = 3
+
+# Conversation stages, each one waits for a single reply from the user
+STAGE_MENU = "menu"                # 1 for a new issue, 2 for an existing issue
+STAGE_CATEGORY = "category"        # Category of the new issue (CATEGORY_MAP)
+STAGE_DESCRIPTION = "description"  # Brief description of the new issue
+STAGE_MERGE = "merge"              # Whether a report repeating an open ticket is added to it
+STAGE_TICKET = "ticket"            # Which open ticket the user wants an update on
+STAGE_DONE = "done"
+
+# Seconds a conversation waits for the user to reply in each stage
+STAGE_TIMEOUTS = {
+    STAGE_MENU: 60,
+    STAGE_CATEGORY: 90,
+    STAGE_DESCRIPTION: 90,
+    STAGE_MERGE: 60,
+    STAGE_TICKET: 40,
+}
+
+# Seconds the scheduler listens for a reply in the open chat before it
+# looks at the other conversations again
+SCHEDULER_REPLY_WAIT = 3
+# A description sent over several messages is collected until the user has
+# been quiet for MESSAGE_BURST_QUIET seconds (0 takes only the first message),
+# for at most MESSAGE_BURST_LIMIT seconds
+MESSAGE_BURST_QUIET = 4
+MESSAGE_BURST_LIMIT = 30
+# Seconds a conversation resumed after a restart waits at least for its reply
+RESUME_GRACE = 60
+
+# Seconds between throughput reports of the scheduler
+SCHEDULER_REPORT_INTERVAL = 60
+
+# Range of seconds the scheduler sleeps when there is nothing to do or after an error
+IDLE_SLEEP_RANGE = (2, 30)
+
+
+@dataclass
+class Conversation:
+    """
+    State of a single support conversation, advanced one user reply at a time
+    """
+    chat_name: str
+    stage: str = STAGE_MENU
+    retries: int = 0
+    deadline: float = 0.0
+    contact_num: str = None
+    issue_category: str = None
+    tickets: list = field(default_factory=list)
+    cursor: str = None  # data-id of the last incoming message handled
+    description: str = None  # Description received so far
+    opening: str = None  # What the user wrote before the menu, to guess the category from
+    merge_into: int = None  # Open ticket the description seems to repeat, see STAGE_MERGE
+    stage_started: float = field(default_factory=time.time)
+
+    def move_to(self, stage):
+        """
+        Enter a new stage with a fresh retry count and reply deadline
+        """
+        if stage != self.stage:
+            metrics.observe("support_bot_stage_seconds",
+                            time.time() - self.stage_started, stage=self.stage)
+        self.stage = stage
+        self.stage_started = time.time()
+        self.retries = 0
+        self.deadline = time.time() + STAGE_TIMEOUTS.get(stage, 0)
+        checkpoint_conversation(self)
+
+    def finish(self):
+        """
+        Marks the conversation as done, counted by the stage it ended in
+        """
+        if self.stage == STAGE_DONE:
+            return
+        metrics.inc("support_bot_conversations_total", ended_in=self.stage)
+        self.move_to(STAGE_DONE)
+
+    @property
+    def done(self):
+        return self.stage == STAGE_DONE
+
+
+class ConversationStore:
+    """
+    Local SQLite checkpoints of the conversations in progress, so a restarted
+    bot carries on with each chat where it left off.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    chat_name TEXT PRIMARY KEY,
+                    state TEXT,
+                    updated_at REAL
+                )""")
+
+    def save(self, conv):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)",
+                (conv.chat_name, json.dumps(asdict(conv)), time.time()))
+
+    def delete(self, chat_name):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM conversations WHERE chat_name = ?", (chat_name,))
+
+    def load(self):
+        """
+        Returns the checkpointed conversations
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state FROM conversations").fetchall()
+        known = {f.name for f in fields(Conversation)}
+        conversations = []
+        for (state,) in rows:
+            state = json.loads(state)
+            conversations.append(Conversation(
+                **{key: value for key, value in state.items() if key in known}))
+        return conversations
+
+
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """
+    Opens the conversation checkpoint store on first use.
+    """
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            _conversation_store = ConversationStore(CONVERSATION_STORE_PATH)
+        return _conversation_store
+
+
+def checkpoint_conversation(conv):
+    """
+    Saves the state of a conversation, or drops its checkpoint once it is done.
+    A failed checkpoint is logged and does not interrupt the conversation.
+    """
+    try:
+        if conv.done:
+            get_conversation_store().delete(conv.chat_name)
+        else:
+            get_conversation_store().save(conv)
+    except sqlite3.Error as e:
+        logging.error(f"Failed to checkpoint conversation: {str(e)}")
+
+
+def resume_conversations():
+    """
+    Loads the conversations checkpointed before a restart. Each gets at least
+    RESUME_GRACE seconds before its stage times out, so replies sent while the
+    bot was down are read first. Workers drop the chats another worker claimed.
+
+    Returns:
+        dict: chat name -> Conversation
+    """
+    conversations = {}
+    for conv in get_conversation_store().load():
+        if coordinator and not coordinator.claim(conv.chat_name):
+            logging.info(f"{conv.chat_name} was taken over by another worker")
+            get_conversation_store().delete(conv.chat_name)
+            continue
+        conv.deadline = max(conv.deadline, time.time() + RESUME_GRACE)
+        conversations[conv.chat_name] = conv
+    if conversations:
+        logging.info(f"Resuming {len(conversations)} conversation(s): " +
+                     ", ".join(f"{conv.chat_name} ({conv.stage})" for conv in conversations.values()))
+    return conversations
+
+
+def read_messages_since(driver, cursor, consume=False):
+    """
+    Reads the incoming messages of the open chat after the message with the
+    cursor's data-id
+
+    Args:
+        consume: Clear the message observer's queue, as its messages are read now
+
+    Returns:
+        (list of message texts, oldest first, cursor after the last of them)
+    """
+    result = driver.execute_script(NEW_MESSAGES_JS, cursor, consume)
+    return [message.strip() for message in result["messages"]], result["cursor"]
 
-        # If neither is found, log and return unknown
-        logging.warning("Could not determine conversation type")
-        return "unknown"
 
-    except Exception as e:
-        logging.error(f"Error detecting conversation type: {str(e)}")
-        return "unknown"
+def get_message_cursor(driver):
+    """
+    Returns the cursor of the last incoming message rendered in the open chat
+    """
+    return read_messages_since(driver, None)[1]
 
 
-def get_chat_name(driver):
+def read_new_messages(transport, conv):
     """
-    Gets the name of the current chat, whether group or personal.
+    Reads the incoming messages of the open chat that arrived after the last
+    reply handled for the conversation, and moves its cursor past them.
 
     Returns:
-        str: The name of the current chat or False if it cannot be determined
+        list: The texts of the new messages, oldest first
     """
-    conv_type = detect_conversation_type(driver)
+    messages, conv.cursor = transport.read_since(conv.cursor)
+    return messages
 
-    if conv_type == "group":
-        try:
-            name_element = driver.find_element(
-                By.XPATH, '//*[@id="main"]/header/div[2]/div[1]/div/span')
-            chat_name = name_element.text
-            logging.info(f"Group name: {chat_name}")
-            return chat_name
-        except Exception as e:
-            logging.error(f"Error getting group name: {str(e)}")
-            return False
 
-    elif conv_type == "personal":
-        try:
-            name_element = driver.find_element(
-                By.XPATH, '//*[@id="main"]/header/div[2]/div/div/div/span')
-            chat_name = name_element.text
-            logging.info(f"Contact name: {chat_name}")
-            return chat_name
-        except Exception as e:
-            logging.error(f"Error getting contact name: {str(e)}")
-            return False
+def receive_new_messages(transport, conv, timeout):
+    """
+    Waits up to timeout seconds for replies in the open chat after the last one
+    handled for the conversation, and moves its cursor past the ones returned
+    only, so a reply that arrives in the meantime is read next time.
 
-    else:
-        return False
+    Returns:
+        list: The texts of the new messages, oldest first
+    """
+    messages, conv.cursor = transport.receive(timeout=timeout, cursor=conv.cursor)
+    return messages
 
 
-def get_contact_details(driver):
+def collect_messages(transport, conv, messages, quiet=None, limit=None):
     """
-    Extracts the contact details of the current chat, gets the name if the contact is saved, or the contact number if the contact is not saved
+    Keeps listening in the open chat while the user sends more messages in a
+    row, e.g. a description split over several messages. Stops once no message
+    arrived for quiet seconds or after limit seconds in total.
+
+    Args:
+        conv: The conversation the messages belong to, its cursor follows them
+        messages: The messages received so far
+        quiet: Seconds without a message that end the burst (default: MESSAGE_BURST_QUIET)
+        limit: Maximum seconds to listen (default: MESSAGE_BURST_LIMIT)
 
     Returns:
-        The name of the current selected chat
+        list: All messages of the burst, oldest first
     """
-
-    try:
-        logging.info("Extracting contact details...")
-        name_element = driver.find_element(
-            By.XPATH, '//*[@id="main"]/header/div[2]/div/div/div/span')
-        contact_name = name_element.text
-        logging.info(f"Contact Number: {contact_name}")
-        return contact_name
-
-    except NoSuchElementException as e:
-        logging.error("Cannot find element", {str(e)})
-        return False
-
-    except Exception:
-        logging.error(
-            "Couldn't fetch the phone number. It might be hidden or the XPath is outdated.")
-        return False
+    quiet = MESSAGE_BURST_QUIET if quiet is None else quiet
+    limit = MESSAGE_BURST_LIMIT if limit is None else limit
+    messages = list(messages)
+    started = time.time()
+    while quiet and time.time() - started < limit:
+        more = receive_new_messages(transport, conv, min(quiet, limit - (time.time() - started)))
+        if not more:
+            break
+        messages += more
+    return messages
+
+
+def end_conversation(transport, conv, message=None):
+    """
+    Optionally sends a final message, then closes the chat and marks the conversation as done
+    """
+    if message:
+        transport.send(message)
+    transport.close_chat()
+    conv.finish()
 
 
-def create_ticket(contact_details, issue_category, description):
+@timed_step
+def handle_conversation(transport, chat_name, messages=None):
     """
-    Inserts a new ticket into the database.
+    Starts a conversation in the open chat by asking whether it is a new or an existing issue.
 
     Args:
-        contact_details: contact number or name,
-        issue_category: Type of issue
-        description: Brief description of the message
+        messages: The messages that opened the chat (default: read from the chat)
 
     Returns:
-        The ticket number if ticket created successfully
+        Conversation: The conversation waiting on the menu stage, or None if the chat is ignored
     """
-    conn = connect_to_db()
-    if not conn:
-        logging.error("Database connection failed. Ticket not created.")
+    # Check if it's a group to be ignored
+    if chat_name in GROUPTOBEIGNORED:
+        logging.info(f"Ignoring group: {chat_name}")
+        transport.close_chat()
         return None
 
-    try:
-        cursor = conn.cursor()
+    MESSAGE = ["Welcome to IT Support via WhatsApp! Could you please let us know what you need help with?",
+               " Reply 1️⃣ for a **new issue**",
+               " Reply 2️⃣ for an **update on an existing issue**",
+               " Reply 'exit' to cancel this request.",]
+    if messages is None:
+        messages, cursor = transport.read_since(None)
+    else:
+        cursor = transport.cursor()
+    logging.info("Sending template msg to check if new or old issue")
+    transport.send_paragraph(MESSAGE)
 
-        current_time = datetime.now()
-        # Insert ticket into the database
-        query = """
-        INSERT INTO tickets (contact_details, issue_category, description, status, date_created)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        values = (contact_details, issue_category, description,
-                  "Ongoing", current_time.strftime("%Y-%m-%d %H:%M:%S"))
+    # The cursor is taken before sending, so a reply typed meanwhile is still read
+    conv = Conversation(chat_name=chat_name, cursor=cursor,
+                        opening="\n".join(messages))
+    conv.move_to(STAGE_MENU)
+    return conv
 
-        cursor.execute(query, values)
-        conn.commit()
-        ticket_no = cursor.lastrowid
-        logging.info(f"Ticket {ticket_no} created successfully.")
 
-        cursor.close()
-        conn.close()
+def step_conversation(transport, conv, messages):
+    """
+    Advances the conversation with the new messages from the user. Expects the chat of the conversation to be open.
+    The latest message is the reply, except for a description: the messages the
+    user sends in a row are collected and make up the description together.
+    """
+    reply = messages[-1]
+    if conv.stage == STAGE_DESCRIPTION and reply.strip().lower() != "exit":
+        conv.description = "\n".join(messages)
+        checkpoint_conversation(conv)
+        reply = conv.description = "\n".join(collect_messages(transport, conv, messages))
+    logging.info(f"[{conv.chat_name}] Stage '{conv.stage}' received: '{reply}'")
+    if reply.strip().lower() == "exit":
+        end_conversation(
+            transport, conv, "Your request has been canceled. Let us know if you need anything else.")
+        logging.info("Conversation exited due to user request")
+        return
 
-        return ticket_no  # Returning the created ticket number
+    handlers = {
+        STAGE_MENU: handle_menu_reply,
+        STAGE_CATEGORY: handle_category_reply,
+        STAGE_DESCRIPTION: handle_description_reply,
+        STAGE_MERGE: handle_merge_reply,
+        STAGE_TICKET: handle_ticket_reply,
+    }
+    handlers[conv.stage](transport, conv, reply)
 
-    except mysql.connector.Error as err:
-        logging.error(f"Database query error: {err}")
-        return False
 
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
-        return False
+@timed_step
+def handle_menu_reply(transport, conv, reply):
+    """
+    Stage 1: directs the user to the new or existing issue flow
+    """
+    if reply == "1":
+        logging.info("New issue report")
+        handle_new_issue(transport, conv)
 
+    elif reply == "2":
+        logging.info("Assisting to check for existing issue")
+        conv.contact_num = transport.contact_details()
+        handle_existing_issue(transport, conv)
 
-def handle_conversation(driver):
+    else:
+        conv.retries += 1
+        if conv.retries < MAX_RETRIES:
+            transport.send_paragraph([
+                f"Invalid response. You have {MAX_RETRIES - conv.retries} attempts left.",
+                " Please reply '1' for a **new issue**",
+                "'2' for an **update**, or 'exit' to cancel."
+            ])
+        else:
+            end_conversation(
+                transport, conv, "I'm sorry I couldn't understand your response. You have reached the maximum retries. Please restart the conversation if you still need assistance.")
+            logging.info(
+                "Conversation ended due to user sending messages in wrong format after max retries")
+
+
+@timed_step
+def handle_new_issue(transport, conv):
     """
-    Handles the initial conversation and directs the user accordingly.
+    Asks the user for the category of the new issue, unless it is clear from
+    what the user wrote before the menu. Then it goes straight to the description.
     """
-
-    chat_name = get_chat_name(driver)
-    # Check if it's a group to be ignored
-    if chat_name in GROUPTOBEIGNORED:
-        logging.info(f"Ignoring group: {chat_name}")
-        close_chat(driver)
+    category, confidence = issue_classifier.classify(conv.opening or "")
+    if category and confidence >= AUTO_CATEGORY_CONFIDENCE:
+        conv.issue_category = category
+        # Stands in for the description if the user sends none
+        conv.description = conv.opening
+        metrics.inc("support_bot_auto_categorized_total", category=category)
+        logging.info(f"Categorized as {category} ({confidence:.2f}) from the opening message")
+        transport.send_paragraph([
+            f"Thank you! This looks like a **{category.upper()}** issue.",
+            "Could you please provide a brief description of the issue in one message?",
+            "Reply 'menu' to choose another category."
+        ])
+        conv.move_to(STAGE_DESCRIPTION)
         return
-    else:
-        MESSAGE = ["Welcome to IT Support via WhatsApp! Could you please let us know what you need help with?",
-                   " Reply 1️⃣ for a **new issue**",
-                   " Reply 2️⃣ for an **update on an existing issue**",
-                   " Reply 'exit' to cancel this request.",]
-        logging.info("Sending template msg to check if new or old issue")
-        send_message_as_p(driver, MESSAGE)
-
-        start_time = time.time()
-        retries = 0
-
-        while retries < MAX_RETRIES:
-            reply = wait_for_user_reply(
-                driver, timeout=30)  # Wait for a response
-
-            if reply:
-                if reply.lower() == "exit":
-                    send_message(
-                        driver, "Your request has been canceled. Let us know if you need anything else.")
-                    close_chat(driver)
-                    logging.info("Conversation exited due to user request")
-                    return  # Exit conversation
-
-                elif reply == "1":
-                    logging.info("New issue report")
-                    handle_new_issue(driver)
-                    return  # Exit after handling
-
-                elif reply == "2":
-                    logging.info("Assisting to check for existing issue")
-                    handle_existing_issue(driver, get_contact_details(driver))
-                    return  # Exit after handling
 
-                else:
-                    retries += 1
-                    if retries < MAX_RETRIES:
-                        send_message_as_p(
-                            driver, [
-                                f"Invalid response. You have {MAX_RETRIES - retries} attempts left.",
-                                " Please reply '1' for a **new issue**",
-                                "'2' for an **update**, or 'exit' to cancel."
-                            ])
-                    else:
-                        send_message(
-                            driver, "I'm sorry I couldn't understand your response. You have reached the maximum retries. Please restart the conversation if you still need assistance.")
-                        close_chat(driver)
-                        logging.info(
-                            "Conversation ended due to user sending messages in wrong format after max retries")
-                        return  # Exit after max retries
+    logging.info("Sending template msg to get category of issue")
+    transport.send_paragraph(CATEGORY_MENU)
+    conv.move_to(STAGE_CATEGORY)
+
+
+@timed_step
+def handle_category_reply(transport, conv, reply):
+    """
+    Stage 2: stores the issue category and asks for a description
+    """
+    category_reply = reply.strip().lower()  # Normalize reply
 
-            elif time.time() - start_time > 60:
-                send_message(
-                    driver, "We haven't received a response. Exiting chat...")
-                close_chat(driver)  # Close the chat if max retries exceeded
-                return
+    # If the user responds with a valid category (1-5)
+    if category_reply in CATEGORY_MAP:
+        conv.issue_category = CATEGORY_MAP[category_reply]
 
+        # Prompt for issue description
+        logging.info("Getting brief description of issue faced...")
+        transport.send("Thank you! Could you please provide a brief description of the issue in one message?")
+        conv.move_to(STAGE_DESCRIPTION)
+        return
 
-MAX_RETRIES = 3
+    conv.retries += 1
+    if conv.retries < MAX_RETRIES:
+        transport.send_paragraph([
+            f"Invalid response. You have {MAX_RETRIES - conv.retries} attempts left.",
+            "Please reply with '1' for **Hardware Issues**",
+            "'2' for **Network Issues**",
+            "'3' for **Account/Password Issues**",
+            "'4' for **Software Issues**",
+            "'5' for **Others** or 'exit' to cancel."
+        ])
+    else:
+        end_conversation(
+            transport, conv, "Sorry but I still couldn't understand your response. You have reached maximum retries. Please restart the conversation to try again.")
+        logging.info("Conversation exited after max retries")
 
 
-def handle_new_issue(driver):
+@timed_step
+def handle_description_reply(transport, conv, reply):
     """
-    Handle new issue flow while ensuring proper wait time for user response.
+    Stage 3: creates the ticket with the description and notifies the IT group.
+    Called with no reply when the user did not send a description in time.
+    If the description repeats an open ticket of the user, asks first whether
+    to add it to that ticket.
     """
-    MESSAGE = ["We apologize for any inconvenience caused. \n",
-               "Before going further, could you please tell us what kind of problem you are facing?",
-               "Please reply:",
-               "1️⃣ for **HARDWARE** Issues",
-               "2️⃣ for **NETWORK** Issues",
-               "3️⃣ for **ACCOUNT/PASSWORD** Issues",
-               "4️⃣ for **SOFTWARE** Issues",
-               "5️⃣ for **OTHERS**",
-               "or Type 'exit' to cancel this request."]
+    if reply and reply.strip().lower() == "menu":
+        # The category guessed from the opening message was wrong
+        logging.info("Sending template msg to get category of issue")
+        conv.description = None
+        transport.send_paragraph(CATEGORY_MENU)
+        conv.move_to(STAGE_CATEGORY)
+        return
 
-    logging.info("Sending template msg to get category of issue")
-    send_message_as_p(driver, MESSAGE)
-
-    # Wait for and handle user reply
-    retries = 0
-    while retries < MAX_RETRIES:
-        category_reply = wait_for_user_reply(
-            driver, timeout=30)  # Wait for user reply
-
-        if category_reply:
-            category_reply = category_reply.strip().lower()  # Normalize reply
-
-            # Check if user wants to exit
-            if category_reply == "exit":
-                send_message(
-                    driver, "Your request has been canceled. Let us know if you need anything else.")
-                logging.info("Exiting conversation due to user request")
-                close_chat(driver)
-                return  # Exit function
-
-            # If the user responds with a valid category (1-5)
-            if category_reply in CATEGORY_MAP:
-                issue_category = CATEGORY_MAP[category_reply]
-
-                # Prompt for issue description
-                logging.info("Getting brief description of issue faced...")
-                send_message(
-                    driver, "Thank you! Could you please provide a brief description of the issue in one message?")
-                issue_description = wait_for_user_reply(
-                    driver, timeout=90)  # Wait for user to describe issue
-                if not issue_description:
-                    send_message(
-                        driver, "It seems we didn't receive a description. Proceeding with ticket creation.")
-                    issue_description = "No description provided."
-
-                # Create ticket with category and description
-                contact_num = get_contact_details(driver)
-                ticket_num = create_ticket(contact_details=contact_num,
-                                           issue_category=issue_category,
-                                           description=issue_description)
-
-                if ticket_num:
-                    send_message_as_p(driver, [
-                        "Thank you for providing the details.",
-                        f"A ticket has been created for you.",
-                        f"Your ticket number is #{ticket_num}.",
-                        "Our team will reach out shortly."
-                    ])
-                else:
-                    send_message(
-                        driver, "Sorry, we encountered an error while creating your ticket. Please try again later.")
+    issue_description = reply or conv.description
+    if not issue_description:
+        transport.send("It seems we didn't receive a description. Proceeding with ticket creation.")
+        issue_description = NO_DESCRIPTION
+
+    conv.contact_num = transport.contact_details()
+    conv.merge_into = find_open_duplicate(conv.contact_num, conv.issue_category, issue_description)
+    if conv.merge_into:
+        conv.description = issue_description
+        logging.info(f"Description repeats open ticket {conv.merge_into}, asking the user")
+        transport.send_paragraph([
+            f"This looks like the issue of your open ticket #{conv.merge_into}.",
+            f" Reply 1️⃣ to add your message to ticket #{conv.merge_into}",
+            " Reply 2️⃣ to open a new ticket",
+        ])
+        conv.move_to(STAGE_MERGE)
+        return
 
-                close_chat(driver)
-                MESSAGE = [
-                    f"{contact_num} is in need of help!",
-                    f"Category: {issue_category}",
-                    f"Description of issue: {issue_description}",
-                    f"Ticket No: {ticket_num}",
-                    "Please send assistance."
-                ]
+    submit_ticket(transport, conv, issue_description)
 
-                notify_group(driver, MESSAGE)
-                return  # Exit function after successful handling
 
-            else:
-                retries += 1
-                if retries < MAX_RETRIES:
-                    send_message_as_p(
-                        driver, [
-                            f"Invalid response. You have {MAX_RETRIES - retries} attempts left.",
-                            "Please reply with '1' for **Hardware Issues**",
-                            "'2' for **Network Issues**",
-                            "'3' for **Account/Password Issues**",
-                            "'4' for **Software Issues**",
-                            "'5' for **Others** or 'exit' to cancel."
-                        ])
-                else:
-                    send_message(
-                        driver, "Sorry but I still couldn't understand your response. You have reached maximum retries. Please restart the conversation to try again.")
-                    logging.info("Conversation exited after max retries")
-                    return  # Exit after max retries
+@timed_step
+def handle_merge_reply(transport, conv, reply):
+    """
+    Stage 3b: adds the description to the open ticket it repeats, or opens a
+    new ticket. Called with no reply when the user did not answer in time,
+    which opens a new ticket, so no report is lost.
+    """
+    if reply == "1":
+        submit_ticket(transport, conv, conv.description, merge_into=conv.merge_into)
+    elif reply in (None, "2"):
+        submit_ticket(transport, conv, conv.description)
+    else:
+        conv.retries += 1
+        if conv.retries < MAX_RETRIES:
+            transport.send_paragraph([
+                f"Invalid response. You have {MAX_RETRIES - conv.retries} attempts left.",
+                f" Please reply '1' to add your message to ticket #{conv.merge_into}",
+                "'2' to open a new ticket, or 'exit' to cancel."
+            ])
+        else:
+            submit_ticket(transport, conv, conv.description)
+
+
+def submit_ticket(transport, conv, issue_description, merge_into=None):
+    """
+    Creates the ticket, or adds the description to merge_into, tells the user
+    and notifies the IT group
+    """
+    contact_num = conv.contact_num
+    ticket = create_ticket(contact_details=contact_num,
+                           issue_category=conv.issue_category,
+                           description=issue_description,
+                           merge_into=merge_into)
+    ticket_num = ticket.ticket_no if ticket else None
+
+    if ticket and ticket.merged:
+        transport.send_paragraph([
+            "Thank you for providing the details.",
+            f"We have added your message to your open ticket #{ticket_num}.",
+            "Our team will reach out shortly."
+        ], priority="ticket")
+        end_conversation(transport, conv)
+        MESSAGE = [
+            f"{contact_num} reported the issue of ticket #{ticket_num} again.",
+            f"Category: {conv.issue_category}",
+            f"Added to the ticket: {issue_description}",
+            "Please check the ticket."
+        ]
+        queue_notification(
+            transport, MESSAGE, f"Report from {contact_num} merged into ticket #{ticket_num}: {issue_description}",
+            category=conv.issue_category)
+        return
+    elif ticket:
+        transport.send_paragraph([
+            "Thank you for providing the details.",
+            f"A ticket has been created for you.",
+            f"Your ticket number is {ticket.reference}.",
+            "Our team will reach out shortly."
+        ], priority="ticket")
+    else:
+        transport.send("Sorry, we encountered an error while creating your ticket. Please try again later.")
+
+    end_conversation(transport, conv)
+    MESSAGE = [
+        f"{contact_num} is in need of help!",
+        f"Category: {conv.issue_category}",
+        f"Description of issue: {issue_description}",
+        f"Ticket No: {ticket.reference if ticket else None}",
+        "Please send assistance."
+    ]
+    summary = f"New ticket {ticket.reference if ticket else None} from {contact_num} ({conv.issue_category}): {issue_description}"
+    if ticket and ticket.related_to:
+        outage = f"Same issue as ticket #{ticket.related_to}, {ticket.outage_size} reports so far"
+        MESSAGE.insert(-1, outage)
+        summary += f" ({outage})"
 
-    close_chat(driver)  # Close the chat if max retries exceeded
+    queue_notification(transport, MESSAGE, summary, category=conv.issue_category)
 
 
-def handle_existing_issue(driver, contact_num):
+@timed_step
+def handle_existing_issue(transport, conv):
     """
     Handle an existing issue query from the user by checking the database.
     """
-    conn = connect_to_db()
-    if not conn:
-        logging.error("Database connection failed. Cannot retrieve tickets.")
-        send_message(
-            driver, "Sorry, we are unable to retrieve your ticket details at the moment. Please try again later.")
-        close_chat(driver)
-        return
-
+    contact_num = conv.contact_num
     try:
-        cursor = conn.cursor(dictionary=True)
-
-        # Fetch user's ongoing tickets
-        query = "SELECT ticket_no FROM tickets WHERE contact_details = %s AND status = 'Ongoing'"
-        cursor.execute(query, (contact_num,))
-        tickets = cursor.fetchall()
-        logging.info("Checking DB for user's existing tickets")
-        cursor.close()
-        conn.close()
+        tickets = lookup_open_tickets(contact_num)
+        if tickets is None:
+            end_conversation(
+                transport, conv, "Sorry, we are unable to retrieve your ticket details at the moment. Please try again later.")
+            return
 
         if not tickets:
-            send_message(
-                driver, "You currently have no unresolved tickets. Let us know if you need further assistance.")
-            close_chat(driver)
+            end_conversation(
+                transport, conv, "You currently have no unresolved tickets. Let us know if you need further assistance.")
             logging.info("Closed chat due to no existing ticket")
             return
 
         # Convert ticket numbers to strings and format with #
-        ticket_numbers_list = [f"#{ticket['ticket_no']}" for ticket in tickets]
-        ticket_numbers = ", ".join(ticket_numbers_list)
+        conv.tickets = [f"#{ticket_no}" for ticket_no in tickets]
+        ticket_numbers = ", ".join(conv.tickets)
 
         MESSAGE = [f"You currently have {len(tickets)} unresolved ticket(s): {ticket_numbers}",
                    "Please reply with the ticket number you are referring to.",
                    "Example: #003",
                    "Reply 'exit' to cancel. \n"]
         logging.info("Confirming which ticket with user")
-        send_message_as_p(driver, MESSAGE)
+        transport.send_paragraph(MESSAGE)
+        conv.move_to(STAGE_TICKET)
 
-        retry_attempts = 3  # Allow up to 3 retries
+    except mysql.connector.Error as err:
+        logging.error(f"Database query error: {err}")
+        end_conversation(
+            transport, conv, "We encountered a database issue while retrieving your ticket. Please try again later.")
 
-        while retry_attempts > 0:
-            reply = wait_for_user_reply(driver, timeout=40)
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        end_conversation(
+            transport, conv, "Something went wrong. Please try again later.")
 
-            if not reply or reply.lower() == "exit":
-                send_message(
-                    driver, "Your request has been canceled. Let us know if you need anything else.")
-                close_chat(driver)
-                return
 
-            if reply in ticket_numbers_list:
-                send_message(
-                    driver, f"Thank you! We have notified IT support about your ticket {reply}. Help is on the way!")
+@timed_step
+def handle_ticket_reply(transport, conv, reply):
+    """
+    Stage 4: notifies IT support about the ticket the user asked an update on
+    """
+    if reply in conv.tickets:
+        transport.send(
+            f"Thank you! We have notified IT support about your ticket {reply}. Help is on the way!",
+            priority="ticket")
+
+        # Notify support team
+        MESSAGE = [f"{conv.contact_num} has asked for an update on ticket {reply}.",
+                   "Kindly check and assist them."]
+        end_conversation(transport, conv)
+        queue_notification(
+            transport, MESSAGE, f"{conv.contact_num} asked for an update on ticket {reply}")
+        return
 
-                # Notify support team
-                MESSAGE = [f"{contact_num} has asked for an update on ticket {reply}.",
-                           "Kindly check and assist them."]
-                close_chat(driver)
-                notify_group(driver, MESSAGE)
-                return  # Exit function after a successful match
+    conv.retries += 1
+    if conv.retries < MAX_RETRIES:
+        transport.send_paragraph([
+            "The ticket number you provided is not found.",
+            f"Please try again({MAX_RETRIES - conv.retries} attempts left).",
+            "Example: #003",
+            "Reply 'exit' to cancel."])
+    else:
+        end_conversation(
+            transport, conv, "Sorry but you have exceeded the maximum number of attempts. Please start over if you need assistance.")
+        logging.info(
+            "Chat exited due to user exceeded maximum attempts")
 
-            else:
-                retry_attempts -= 1
-                if retry_attempts > 0:
-                    send_message_as_p(driver, [
-                        "The ticket number you provided is not found.",
-                        f"Please try again({retry_attempts} attempts left).",
-                        "Example: #003",
-                        "Reply 'exit' to cancel."])
-                else:
-                    send_message(
-                        driver, "Sorry but you have exceeded the maximum number of attempts. Please start over if you need assistance.")
-                    close_chat(driver)
-                    logging.info(
-                        "Chat exited due to user exceeded maximum attempts")
-                    return
 
-    except mysql.connector.Error as err:
-        logging.error(f"Database query error: {err}")
-        send_message(
-            driver, "We encountered a database issue while retrieving your ticket. Please try again later.")
-        close_chat(driver)
+@timed_step
+def handle_stage_timeout(transport, conv):
+    """
+    Handles a conversation whose user did not reply before the stage deadline.
+    Expects the chat of the conversation to be open.
+    """
+    logging.info(f"[{conv.chat_name}] No reply in stage '{conv.stage}'")
+    if conv.stage == STAGE_DESCRIPTION:
+        # A missing description does not stop the ticket from being created
+        handle_description_reply(transport, conv, None)
+    elif conv.stage == STAGE_MERGE:
+        handle_merge_reply(transport, conv, None)
+    elif conv.stage == STAGE_TICKET:
+        end_conversation(
+            transport, conv, "Your request has been canceled. Let us know if you need anything else.")
+    else:
+        end_conversation(
+            transport, conv, "We haven't received a response. Exiting chat...")
 
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
-        send_message(driver, "Something went wrong. Please try again later.")
-        close_chat(driver)
 
+def open_notification_window():
+    """
+    Opens a second browser window, logged in as another linked device of the
+    same WhatsApp account, and keeps the IT group open in it for the session.
+    WhatsApp Web only allows one active tab per browser, hence the separate window.
+
+    Returns:
+        The driver of the notification window, or None if it could not be set up
+    """
+    logging.info("Opening notification window...")
+    driver = initialize_driver("notify")
+    if not driver:
+        return None
+
+    driver.get('https://web.whatsapp.com')
+    if check_login(driver) and search(driver, GROUP_TO_NOTIFY):
+        logging.info(f"Notification window open on {GROUP_TO_NOTIFY}")
+        return driver
+
+    logging.warning("Failed to open notification window, notifications will use the main window")
+    driver.quit()
+    return None
 
-def notify_group(driver, message):
+
+def notify_group(transport, message):
     """
-    Send notification to someone 
+    Send notification to the IT group. The message is queued and goes out
+    from drain_send_queue once the send rate limit leaves room for it.
     """
     logging.info("Notifying group....")
-    GROUP_TO_NOTIFY = "Test group"
+    if coordinator:
+        # The notifier sends it for all workers
+        coordinator.add_notification(message)
+        return
+    send_queue.put(GROUP_TO_NOTIFY, message, "notification")
+
+
+@timed_step
+def send_to_group(driver, message):
+    """
+    Sends a message to the IT group. Uses the notification window when it is
+    open, so the chat open in the main window is left alone.
+
+    Returns:
+        bool: True if the message was sent
+    """
+    if notify_driver:
+        # Reopen the group if it was closed in the notification window
+        header = get_chat_header(notify_driver)
+        if (header and GROUP_TO_NOTIFY in header) or search(notify_driver, GROUP_TO_NOTIFY):
+            return send_message_as_p(notify_driver, message, priority="notification")
+        logging.warning("Notification window lost the group, using the main window")
+
     if search(driver, GROUP_TO_NOTIFY):
-        time.sleep(5)
-        send_message_as_p(driver, message)
+        sent = send_message_as_p(driver, message, priority="notification")
         close_chat(driver)
-        time.sleep(1)
         click_unread_button(driver)
+        return sent
+    return False
+
+
+@dataclass(order=True)
+class QueuedSend:
+    """
+    A message waiting in the send queue, ordered by priority and then by age
+    """
+    rank: int
+    seq: int
+    chat: str = field(compare=False)
+    message: list = field(compare=False)
+    priority: str = field(compare=False)
+    queued_at: float = field(default_factory=time.time, compare=False)
+
+
+class SendQueue:
+    """
+    Messages that do not have to go out right away, sent highest priority
+    first whenever the rate limit leaves room. A message identical to one
+    still waiting for the same chat is dropped. Messages may be queued from
+    one thread while another drains the queue, as webhook.py does.
+    """
+
+    def __init__(self):
+        self.items = []  # heap of QueuedSend
+        self.keys = set()
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def put(self, chat, message, priority):
+        key = (chat, json.dumps(message))
+        with self.lock:
+            if key in self.keys:
+                logging.info(f"Same message already queued for {chat}, dropped")
+                metrics.inc("support_bot_send_deduplicated_total", priority=priority)
+                return False
+            self.seq += 1
+            self.keys.add(key)
+            heapq.heappush(self.items, QueuedSend(
+                SEND_PRIORITIES[priority], self.seq, chat, message, priority))
+            self._report()
+        return True
+
+    def restore(self, item):
+        """
+        Puts a message taken with pop back in its place
+        """
+        with self.lock:
+            self.keys.add((item.chat, json.dumps(item.message)))
+            heapq.heappush(self.items, item)
+            self._report()
+
+    def pop(self):
+        with self.lock:
+            item = heapq.heappop(self.items)
+            self.keys.discard((item.chat, json.dumps(item.message)))
+            self._report()
+        return item
+
+    def _report(self):
+        depth = {priority: 0 for priority in SEND_PRIORITIES}
+        for item in self.items:
+            depth[item.priority] += 1
+        for priority, count in depth.items():
+            metrics.set("support_bot_send_queue_depth", count, priority=priority)
+
+    def __len__(self):
+        return len(self.items)
+
+
+send_queue = SendQueue()
+
+
+def drain_send_queue(transport, force=False):
+    """
+    Sends queued messages while the rate limit has tokens to spare for them,
+    or all of them when forced (waiting for the rate limit in between).
+    A message that could not be sent stays queued for the next drain.
+    """
+    while send_queue and (force or transport.send_bucket.ready(send_queue.items[0].priority)):
+        item = send_queue.pop()
+        metrics.observe("support_bot_send_wait_seconds",
+                        time.time() - item.queued_at, priority=item.priority)
+        if not transport.send_to(item.chat, item.message, item.priority):
+            logging.warning(f"Failed to send queued message to {item.chat}, retrying later")
+            send_queue.restore(item)
+            return
+
+
+# Driver of the notification window, see open_notification_window
+notify_driver = None
+
+
+@dataclass
+class Notification:
+    """
+    A pending notification for the IT group
+    """
+    message: list
+    summary: str
+    queued_at: float = field(default_factory=time.time)
+
+
+# Notifications waiting to be sent in the next digest
+pending_notifications = []
+
+
+def queue_notification(transport, message, summary, category=None):
+    """
+    Queues a notification for the next digest to the IT group. Notifications
+    about an urgent category are sent right away.
+
+    Args:
+        message: Lines sent when the notification goes out on its own
+        summary: One line describing the notification in a digest
+        category: Issue category, if the notification is about a ticket
+    """
+    if category in URGENT_CATEGORIES:
+        logging.info(f"Urgent {category} notification, sending now")
+        notify_group(transport, message)
+        return
+
+    pending_notifications.append(Notification(message, summary))
+    if len(pending_notifications) >= DIGEST_MAX_EVENTS:
+        flush_notifications(transport, force=True)
+
+
+def flush_notifications(transport, force=False):
+    """
+    Sends the pending notifications as one digest once the oldest has waited
+    DIGEST_WINDOW seconds, or right away when forced.
+    """
+    if not pending_notifications:
+        return
+    if not force and time.time() - pending_notifications[0].queued_at < DIGEST_WINDOW:
+        return
+
+    batch = pending_notifications[:]
+    pending_notifications.clear()
+    if len(batch) == 1:
+        notify_group(transport, batch[0].message)
+        return
+
+    MESSAGE = [f"{len(batch)} new support requests:"]
+    MESSAGE += [f"{i}. {notification.summary}" for i,
+                notification in enumerate(batch, start=1)]
+    MESSAGE.append("Please send assistance.")
+    logging.info(f"Sending digest of {len(batch)} notifications")
+    notify_group(transport, MESSAGE)
 
 
+CATEGORY_MENU = ["We apologize for any inconvenience caused. \n",
+                 "Before going further, could you please tell us what kind of problem you are facing?",
+                 "Please reply:",
+                 "1️⃣ for **HARDWARE** Issues",
+                 "2️⃣ for **NETWORK** Issues",
+                 "3️⃣ for **ACCOUNT/PASSWORD** Issues",
+                 "4️⃣ for **SOFTWARE** Issues",
+                 "5️⃣ for **OTHERS**",
+                 "or Type 'exit' to cancel this request."]
+
 CATEGORY_MAP = {
     "1": "Hardware",
     "2": "Network",
@@ -770,52 +3890,352 @@ CATEGORY_MAP = {
     "5": "Others"
 }
 
+# Words and two-word phrases pointing to a category, with how strongly (1-3).
+# Matched against the lowercased words of a message, a plural "s" is ignored.
+CATEGORY_KEYWORDS = {
+    "Hardware": {
+        "hardware": 3, "printer": 3, "print": 2, "printing": 2, "jam": 3, "jammed": 3,
+        "toner": 3, "ink": 3, "scanner": 3, "laptop": 2, "desktop": 1, "computer": 1, "pc": 1,
+        "screen": 2, "monitor": 3, "display": 2, "flickering": 3, "keyboard": 3, "mouse": 3,
+        "battery": 3, "charger": 3, "charging": 3, "power": 2, "turn on": 2, "overheating": 3,
+        "fan": 2, "noise": 2, "broken": 1, "cracked": 3, "projector": 3, "headset": 3,
+        "webcam": 2, "camera": 2, "microphone": 2, "speaker": 2, "usb": 2, "cable": 1,
+        "docking": 3, "dock": 2, "hdmi": 3,
+    },
+    "Network": {
+        "network": 3, "wifi": 3, "wi fi": 3, "wireless": 3, "internet": 3, "vpn": 3,
+        "connection": 2, "connect": 1, "connected": 1, "disconnected": 2, "disconnecting": 2,
+        "dropping": 2, "drops": 2, "offline": 2, "lan": 3, "ethernet": 3, "router": 3,
+        "signal": 2, "hotspot": 3, "dns": 3, "ip": 2, "ping": 2, "bandwidth": 3, "slow": 1,
+        "down": 1, "firewall": 2, "proxy": 2, "website": 1, "load": 1, "loading": 1,
+    },
+    "Account/Password": {
+        "password": 3, "passcode": 3, "login": 3, "log in": 3, "logon": 3, "sign in": 3,
+        "signin": 3, "locked": 3, "locked out": 3, "lockout": 3, "account": 2, "username": 3,
+        "user id": 3, "reset": 2, "forgot": 2, "forgotten": 2, "expired": 2, "mfa": 3,
+        "2fa": 3, "otp": 3, "authenticator": 3, "verification code": 3, "credentials": 3,
+        "access": 1, "permission": 2, "permissions": 2, "disabled": 2, "unlock": 3,
+    },
+    "Software": {
+        "software": 3, "application": 2, "app": 2, "program": 2, "excel": 3, "word": 2,
+        "powerpoint": 3, "outlook": 3, "teams": 3, "zoom": 3, "office": 2, "crash": 3,
+        "crashes": 3, "crashing": 3, "crashed": 3, "install": 3, "installed": 2,
+        "installation": 3, "update": 2, "upgrade": 2, "error": 1, "freeze": 2, "freezes": 2,
+        "frozen": 2, "not responding": 3, "hang": 2, "hangs": 2, "windows": 2, "license": 3,
+        "licence": 3, "activation": 2, "virus": 2, "malware": 2, "antivirus": 3, "browser": 2,
+        "chrome": 2, "sap": 3, "blue screen": 3, "bsod": 3, "pdf": 2, "email": 1, "file": 1,
+        "macro": 3, "driver": 2,
+    },
+    "Others": {
+        "other": 1, "aircon": 3, "air con": 3, "air conditioning": 3, "chair": 3, "desk": 2,
+        "light": 2, "lights": 2, "door": 2, "access card": 3, "parking": 3, "onboarding": 3,
+        "new joiner": 3, "new staff": 3, "training": 2, "stationery": 3, "meeting room": 1,
+        "booking": 2, "furniture": 3,
+    },
+}
+# Confidence the guessed category needs to skip the category menu, 1 or more always shows the menu
+AUTO_CATEGORY_CONFIDENCE = float(os.getenv("AUTO_CATEGORY_CONFIDENCE", "0.6"))
+
+
+class IssueClassifier:
+    """
+    Guesses the category of an issue from free text, with an index of the
+    keywords built once. The confidence is the score of the best category over
+    the total score plus one, so a single weak keyword, or a tie between two
+    categories, is not enough to skip the menu.
+    """
+    WORD_RE = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, keywords):
+        self.index = {}  # word or two-word phrase -> [(category, weight)]
+        for category, words in keywords.items():
+            for word, weight in words.items():
+                self.index.setdefault(word, []).append((category, weight))
+
+    def classify(self, text):
+        """
+        Returns:
+            (category, confidence from 0 to 1), the category is None if no keyword matched
+        """
+        words = self.WORD_RE.findall(text.lower())
+        words = [word[:-1] if word.endswith("s") and word[:-1] in self.index else word
+                 for word in words]
+        scores = {}
+        for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            for category, weight in self.index.get(term, ()):
+                scores[category] = scores.get(category, 0) + weight
+        if not scores:
+            return None, 0.0
+        category = max(scores, key=scores.get)
+        return category, scores[category] / (sum(scores.values()) + 1)
+
+
+issue_classifier = IssueClassifier(CATEGORY_KEYWORDS)
+
+
+# perf_counter() when main started, until the first reply is sent
+startup_started = None
+
+
+def observe_startup(phase):
+    """
+    Records how long after start a startup phase was reached in support_bot_startup_seconds
+    """
+    global startup_started
+    if startup_started is None:
+        return
+    seconds = time.perf_counter() - startup_started
+    metrics.observe("support_bot_startup_seconds", seconds, phase=phase)
+    logging.info(f"Startup: {phase} after {seconds:.1f}s")
+    if phase == "first_reply":
+        startup_started = None
+
+
+def catch_up_conversations(transport, conversations):
+    """
+    Reopens each resumed conversation and handles the replies that arrived
+    while the bot was down. Replies to the chat that was open then were marked
+    read, so they never show up as unread.
+
+    Returns:
+        Conversation: The conversation whose chat is left open, or None
+    """
+    current = None
+    for conv in conversations.values():
+        try:
+            if not transport.open_chat(conv.chat_name):
+                logging.warning(f"Could not reopen {conv.chat_name} to resume it")
+                continue
+            set_log_chat(conv.chat_name)
+            current = conv
+            messages = read_new_messages(transport, conv)
+            if messages:
+                step_conversation(transport, conv, messages)
+            if not conv.done:
+                checkpoint_conversation(conv)
+        except Exception as e:
+            logging.error(f"Failed to resume {conv.chat_name}: {str(e)}")
+    if conversations:
+        transport.show_unread()
+    return current
+
+
+def run_scheduler(transport, should_stop=None, conversations=None):
+    """
+    Serves all open conversations on the single browser session. Instead of
+    blocking on one user, every loop listens briefly for a reply in the open
+    chat, then opens the next unread chat (a new conversation, or a reply to a
+    waiting one) and finally expires conversations that ran out of time.
+
+    Args:
+        should_stop: Optional callable, the scheduler returns once it returns True
+        conversations: Conversations to carry on with, see resume_conversations
+    """
+    conversations = dict(conversations or {})  # chat name -> Conversation
+    current = catch_up_conversations(transport, conversations)  # Conversation whose chat is open
+    handled = 0
+    started = last_report = time.time()
+
+    while not (should_stop and should_stop()):
+        try:
+            # Replies in the open chat never show up as unread
+            if current and not current.done:
+                messages = receive_new_messages(transport, current, SCHEDULER_REPLY_WAIT)
+                if messages:
+                    step_conversation(transport, current, messages)
+                    if not current.done:
+                        checkpoint_conversation(current)
+
+            # Any other chat with a new message, known or not
+            opened = transport.open_next_unread()
+            if opened:
+                chat_name = transport.chat_name()
+                set_log_chat(chat_name)
+                current = conversations.get(chat_name)
+                if current:
+                    messages = read_new_messages(transport, current)
+                    if messages:
+                        step_conversation(transport, current, messages)
+                        if not current.done:
+                            checkpoint_conversation(current)
+                else:
+                    opened_at = time.time()
+                    current = handle_conversation(transport, chat_name)
+                    if not current and coordinator:
+                        coordinator.release(chat_name)
+                    if current:
+                        metrics.observe("support_bot_time_to_first_reply_seconds",
+                                        time.time() - opened_at)
+                        observe_startup("first_reply")
+                        conversations[chat_name] = current
+                        logging.info(
+                            f"Started conversation with {chat_name} ({len(conversations)} active)")
+
+            # Conversations whose user did not reply in time
+            now = time.time()
+            for conv in list(conversations.values()):
+                if conv.done or conv.deadline > now:
+                    continue
+                if conv is not current:
+                    if not transport.open_chat(conv.chat_name):
+                        logging.warning(
+                            f"Could not reopen {conv.chat_name}, dropping conversation")
+                        conv.finish()
+                        continue
+                    current = conv
+                set_log_chat(conv.chat_name)
+                # A reply that came into the open chat after the last step was
+                # marked read by WhatsApp and never showed up as unread
+                messages = read_new_messages(transport, conv)
+                if messages:
+                    step_conversation(transport, conv, messages)
+                    if not conv.done:
+                        checkpoint_conversation(conv)
+                else:
+                    handle_stage_timeout(transport, conv)
+                transport.show_unread()
+
+            flush_notifications(transport)
+            drain_send_queue(transport)
+
+            for chat_name, conv in list(conversations.items()):
+                if conv.done:
+                    del conversations[chat_name]
+                    handled += 1
+                    if coordinator:
+                        coordinator.release(chat_name)
+            if current and current.done:
+                current = None
+
+            if coordinator:
+                coordinator.renew(list(conversations))
+                coordinator.heartbeat(handled)
+
+            if time.time() - last_report >= SCHEDULER_REPORT_INTERVAL:
+                minutes = (time.time() - started) / 60
+                logging.info(
+                    f"Handled {handled} chats ({handled / minutes:.2f} per minute), {len(conversations)} active")
+                logging.info(f"Time spent per step:\n{timing_report()}")
+                logging.info(
+                    f"Open ticket cache: {open_ticket_cache.stats()}")
+                export_metrics()
+                last_report = time.time()
+
+            if not opened and not conversations:
+                logging.info(
+                    "No unread conversations found, waiting before next check...")
+                time.sleep(random.uniform(*IDLE_SLEEP_RANGE))
+
+        except NoSuchElementException as e:
+            logging.error(f"Element not found: {str(e)}")
+            time.sleep(random.uniform(*IDLE_SLEEP_RANGE))
+        except Exception as e:
+            logging.error(f"Unexpected error: {str(e)}")
+            time.sleep(random.uniform(*IDLE_SLEEP_RANGE))
+
+
+# Seconds the notifier waits between checks of the outbox
+NOTIFIER_POLL_INTERVAL = 1
+
+
+def run_notifier(driver, should_stop=None):
+    """
+    Sends the notifications the workers of supervisor.py put in the outbox,
+    keeping the IT group open. A notification is removed once it was sent.
+
+    Args:
+        should_stop: Optional callable, the notifier returns once it returns True
+    """
+    while not (should_stop and should_stop()):
+        try:
+            coordinator.heartbeat()
+            for row_id, message in coordinator.pending_notifications():
+                header = get_chat_header(driver)
+                if not ((header and GROUP_TO_NOTIFY in header) or search(driver, GROUP_TO_NOTIFY)):
+                    logging.warning(f"Could not open {GROUP_TO_NOTIFY}, retrying")
+                    break
+                if not send_message_as_p(driver, message, priority="notification"):
+                    break
+                coordinator.remove_notification(row_id)
+        except Exception as e:
+            logging.error(f"Unexpected error: {str(e)}")
+        time.sleep(NOTIFIER_POLL_INTERVAL)
+
+
+def open_notification_window_in_background():
+    """
+    Opens the notification window next to the main one, notifications use the
+    main window until it is ready.
+
+    Returns the thread opening it
+    """
+    def run():
+        global notify_driver
+        notify_driver = open_notification_window()
+
+    thread = threading.Thread(target=run, name="notify-window", daemon=True)
+    thread.start()
+    return thread
+
 
 def main():
+    global startup_started, coordinator
+    startup_started = time.perf_counter()
     driver = None
+    transport = None
+    notify_thread = None
     try:
+        start_metrics_server()
+        if WORKER_ID:
+            coordinator = WorkerCoordinator(WORKERS_DB_PATH, WORKER_ID)
+        if WORKER_ID != NOTIFIER_ID:
+            start_ticket_writer()
+
         logging.info("Initializing Chrome...")
-        driver = initialize_driver()
+        driver = initialize_driver(WORKER_ID or "main")
         if not driver:
             logging.warning("Failed to initialize Chrome driver")
             return
+        observe_startup("driver")
+
+        if NOTIFY_IN_SEPARATE_WINDOW and not WORKER_ID:
+            notify_thread = open_notification_window_in_background()
 
         # Open WhatsApp Web
         logging.info("Opening WhatsApp Web...")
         driver.get('https://web.whatsapp.com')
 
-        check_login(driver)
-        logging.info("Waiting for page to load completely...")
-        time.sleep(10)
-        # First check for unread messages
+        if not check_login(driver):
+            return
+        observe_startup("login")
+        if WORKER_ID == NOTIFIER_ID:
+            run_notifier(driver)
+            return
+        # First check for unread messages, waits until the filter is clickable
         click_unread_button(driver)
-        while True:
-            try:
-                # Try to select first unread conversation
-                if select_first_unread(driver):
-                    # Process the conversation (your existing message handling code)
-                    handle_conversation(driver)
-                    # After handling the conversation, check for unread messages again
-                    logging.info("Checking for more unread messages...")
-
-                else:
-                    logging.info(
-                        "No unread conversations found, waiting before next check...")
-                    time.sleep(random.randint(2, 30))
-
-            except NoSuchElementException as e:
-                logging.error(f"Element not found: {str(e)}")
-                time.sleep(random.randint(2, 30))
-            except Exception as e:
-                logging.error(f"Unexpected error: {str(e)}")
-                time.sleep(random.randint(2, 30))
+        observe_startup("ready")
+        transport = SeleniumTransport(driver)
+        run_scheduler(transport, conversations=resume_conversations())
 
     except Exception as e:
         logging.error(f"Critical error occurred: {str(e)}")
     finally:
+        if transport and (pending_notifications or send_queue):
+            try:
+                flush_notifications(transport, force=True)
+                drain_send_queue(transport, force=True)
+            except Exception as e:
+                logging.error(f"Failed to send pending notifications: {str(e)}")
+        if ticket_writer:
+            ticket_writer.stop()
+        if coordinator:
+            coordinator.release_all()
+        if notify_thread:
+            notify_thread.join(timeout=wait_timeout("login"))
+        if notify_driver:
+            notify_driver.quit()
         if driver:
-            logging.info("Closing browser in 10 seconds...")
-            time.sleep(10)
+            logging.info("Closing browser...")
             driver.quit()
         sys.exit(0)
 
@@ -0,0 +1,69 @@
+"""
+Accuracy and latency of the keyword classifier that guesses the category of
+a new issue from the user's opening message (app.issue_classifier), on the
+labeled messages in category_samples.csv. Messages without a label should
+fall back to the category menu.
+
+Reports, for each confidence threshold, how many messages skip the menu and
+how many of those get the right category, and the time per message.
+
+    python benchmarks/bench_classifier.py --thresholds 0.5 0.6 0.7
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "category_samples.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=[0.5, app.AUTO_CATEGORY_CONFIDENCE, 0.7, 0.8])
+    parser.add_argument("--loops", type=int, default=1000,
+                        help="times every message is classified for the latency")
+    parser.add_argument("--samples", default=SAMPLES)
+    args = parser.parse_args()
+
+    with open(args.samples, newline="", encoding="utf-8") as f:
+        samples = [(row["text"], row["category"] or None) for row in csv.DictReader(f)]
+
+    started = time.perf_counter()
+    classifier = app.IssueClassifier(app.CATEGORY_KEYWORDS)
+    build_ms = (time.perf_counter() - started) * 1000
+    guesses = [classifier.classify(text) for text, _ in samples]
+
+    started = time.perf_counter()
+    for _ in range(args.loops):
+        for text, _ in samples:
+            classifier.classify(text)
+    per_message_us = (time.perf_counter() - started) / (args.loops * len(samples)) * 1e6
+
+    labeled = sum(1 for _, label in samples if label)
+    top_right = sum(1 for (_, label), (category, _) in zip(samples, guesses) if label and category == label)
+    print(f"{len(samples)} messages, {labeled} labeled, {len(samples) - labeled} without a category")
+    print(f"Index built in {build_ms:.2f} ms, {per_message_us:.1f} us per message")
+    print(f"Best guess right for {top_right}/{labeled} labeled messages ({top_right / labeled:.0%})\n")
+
+    print(f"{'threshold':>9}  {'skip menu':>9}  {'right':>7}  {'wrong':>5}  {'no label':>8}")
+    for threshold in args.thresholds:
+        auto = [(label, category) for (_, label), (category, confidence) in zip(samples, guesses)
+                if category and confidence >= threshold]
+        right = sum(1 for label, category in auto if label == category)
+        unlabeled = sum(1 for label, _ in auto if not label)
+        print(f"{threshold:>9.2f}  {len(auto) / len(samples):>9.0%}  "
+              f"{right / len(auto) if auto else 0:>7.0%}  {len(auto) - right - unlabeled:>5}  {unlabeled:>8}")
+
+    print("\nWrong guesses that skip the menu:")
+    for (text, label), (category, confidence) in zip(samples, guesses):
+        if category and confidence >= app.AUTO_CATEGORY_CONFIDENCE and category != label:
+            print(f"  {confidence:.2f} {category:<17} (labeled {label or '-'}): {text}")
+
+
+if __name__ == "__main__":
+    main()
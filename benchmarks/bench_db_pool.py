@@ -0,0 +1,76 @@
+"""
+Compares tickets per second when every ticket opens its own connection
+(the old connect_to_db) against checking connections out of the pool.
+
+Uses the MySQL server configured in .env and a scratch `tickets_bench`
+table that is dropped afterwards.
+
+    python benchmarks/bench_db_pool.py --tickets 500
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import mysql.connector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+BENCH_TABLE = "tickets_bench"
+
+INSERT_QUERY = f"""
+INSERT INTO {BENCH_TABLE} (contact_details, issue_category, description, status, date_created)
+VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def connect_unpooled():
+    """
+    The connection setup used before pooling: a new pure Python connection per call
+    """
+    return mysql.connector.connect(use_pure=True, **app.DB_CONFIG)
+
+
+def insert_ticket(conn, i):
+    cursor = conn.cursor()
+    cursor.execute(INSERT_QUERY, (f"+6000000{i:04d}", "Hardware", "Benchmark ticket",
+                                  "Ongoing", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def run(label, connect, tickets):
+    start = time.perf_counter()
+    for i in range(tickets):
+        insert_ticket(connect(), i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {tickets} tickets in {elapsed:.2f}s  "
+          f"{tickets / elapsed:8.1f} tickets/s  {elapsed / tickets * 1000:6.2f} ms/ticket")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tickets", type=int, default=500)
+    args = parser.parse_args()
+
+    conn = connect_unpooled()
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.execute(f"CREATE TABLE {BENCH_TABLE} LIKE tickets")
+    conn.commit()
+
+    try:
+        run("unpooled", connect_unpooled, args.tickets)
+        run("pooled", app.connect_to_db, args.tickets)
+    finally:
+        cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
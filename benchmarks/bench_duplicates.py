@@ -0,0 +1,132 @@
+"""
+Cost and accuracy of the duplicate ticket checks of create_ticket
+(app.duplicate_index), with SQLite standing in for MySQL. Runs fully offline.
+
+Reports how long the index takes to rebuild from a week of tickets and the
+time per check. On the labeled messages in category_samples.csv, reports how
+often a reworded report of an issue is found, and how often a different
+issue of the same category is taken for a duplicate.
+
+    python benchmarks/bench_duplicates.py --tickets 100000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from bench_e2e import percentile  # noqa: E402
+from sqlite_db import use_sqlite  # noqa: E402
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "category_samples.csv")
+PREFIXES = ["", "", "hi, ", "hello, ", "urgent: ", "sorry to bother, "]
+SUFFIXES = ["", "", " again", " since this morning", " pls help", ", can someone check"]
+
+
+def reword(text):
+    """
+    Returns the text as another user might report it: a word left out, a typo
+    and some filler around it
+    """
+    words = text.split()
+    if len(words) > 3:
+        del words[random.randrange(1, len(words))]
+    i = random.randrange(len(words))
+    if len(words[i]) > 3:
+        j = random.randrange(len(words[i]) - 1)
+        words[i] = words[i][:j] + words[i][j + 1] + words[i][j] + words[i][j + 2:]
+    return random.choice(PREFIXES) + " ".join(words) + random.choice(SUFFIXES)
+
+
+def check_accuracy(samples):
+    """
+    Indexes every labeled message as a ticket of its own contact, then looks up
+    a reworded copy of each and each message itself against the others
+    """
+    index = app.DuplicateIndex()
+    now = time.time()
+    for ticket_no, (text, category) in enumerate(samples, 1):
+        index.add(app.IndexedTicket(ticket_no, f"+{ticket_no}", category, now, index.signature(text)))
+
+    found = 0
+    taken_for = []
+    for ticket_no, (text, category) in enumerate(samples, 1):
+        matches = index.similar(category, index.signature(reword(text)))
+        found += any(entry.ticket_no == ticket_no for _, entry in matches)
+        for similarity, entry in index.similar(category, index.signature(text)):
+            if entry.ticket_no != ticket_no:
+                taken_for.append((similarity, text, samples[entry.ticket_no - 1][0]))
+    return found, taken_for
+
+
+def seed_tickets(conn, count, samples):
+    """
+    Inserts count tickets spread over the last DUPLICATE_CONTACT_DAYS days, half of them ongoing
+    """
+    now = datetime.now()
+    span = app.DUPLICATE_CONTACT_DAYS * 86400
+    rows = []
+    for ticket_no in range(1, count + 1):
+        text, category = random.choice(samples)
+        created = now - timedelta(seconds=span * (count - ticket_no) / count)
+        rows.append((ticket_no, f"+60{random.randrange(count // 3 + 1):09d}", category, reword(text),
+                     random.choice(["Ongoing", "Closed"]), created.strftime("%Y-%m-%d %H:%M:%S")))
+    conn.executemany("INSERT INTO tickets (ticket_no, contact_details, issue_category, description, status, "
+                     "date_created) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tickets", type=int, default=100000,
+                        help="tickets created in the last DUPLICATE_CONTACT_DAYS days")
+    parser.add_argument("--checks", type=int, default=2000)
+    parser.add_argument("--samples", default=SAMPLES)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with open(args.samples, newline="", encoding="utf-8") as f:
+        samples = [(row["text"], row["category"]) for row in csv.DictReader(f) if row["category"]]
+
+    found, taken_for = check_accuracy(samples)
+    print(f"{len(samples)} labeled messages, threshold {app.DUPLICATE_THRESHOLD}, "
+          f"{app.MINHASH_SIZE} hashes in {app.MINHASH_BANDS} bands")
+    print(f"Reworded report found for {found}/{len(samples)} ({found / len(samples):.0%})")
+    print(f"Different issues taken for a duplicate: {len(taken_for)} of "
+          f"{len(samples) * (len(samples) - 1)} pairs")
+    for similarity, text, other in sorted(taken_for, reverse=True)[:10]:
+        print(f"  {similarity:.2f} {text!r} ~ {other!r}")
+
+    workdir = tempfile.mkdtemp(prefix="support-bot-dup-")
+    app.TICKET_SPOOL_PATH = os.path.join(workdir, "ticket_spool.db")
+    conn = use_sqlite(app, os.path.join(workdir, "tickets.db"), reserved_ids=0)
+    seed_tickets(conn, args.tickets, samples)
+    started = time.perf_counter()
+    indexed = app.rebuild_duplicate_index()
+    rebuild_seconds = time.perf_counter() - started
+    print(f"\nRebuilt from {args.tickets} tickets of the last {app.DUPLICATE_CONTACT_DAYS} days "
+          f"in {rebuild_seconds:.2f}s, {indexed} indexed")
+
+    index = app.duplicate_index
+    latencies = []
+    candidates = 0
+    for _ in range(args.checks):
+        text, category = random.choice(samples)
+        contact = f"+60{random.randrange(args.tickets // 3 + 1):09d}"
+        started = time.perf_counter()
+        signature = index.signature(reword(text))
+        app.find_duplicate(contact, category, signature)
+        latencies.append((time.perf_counter() - started) * 1000)
+        candidates += len(set().union(*(index.buckets.get(key, ()) for key in index._keys(category, signature))))
+    print(f"Check: p50 {percentile(latencies, 0.5):.2f} ms  p99 {percentile(latencies, 0.99):.2f} ms, "
+          f"{candidates / args.checks:.0f} candidates compared on average")
+
+
+if __name__ == "__main__":
+    main()
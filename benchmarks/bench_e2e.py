@@ -0,0 +1,159 @@
+"""
+End-to-end benchmark of the bot against a local mock of WhatsApp Web with
+scripted users, in headless Chrome and with SQLite standing in for MySQL.
+Runs fully offline.
+
+Reports conversations per minute, p50/p95 time to first reply and how much
+of the bot's time was spent waiting.
+
+    python benchmarks/bench_e2e.py --users 20 --arrival 10
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from selenium import webdriver
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from sqlite_db import use_sqlite  # noqa: E402
+
+MOCK_PAGE = Path(__file__).resolve().parent / "mock_whatsapp" / "index.html"
+
+NEW_ISSUE_DESCRIPTIONS = [
+    "The printer on level 2 is jammed again",
+    "Wifi keeps dropping in the meeting room",
+    "I forgot my password and got locked out",
+    "Excel crashes whenever I open the budget file",
+    "My laptop screen is flickering",
+]
+
+
+def user_scripts(count, existing_share, arrival, think, described_share=0):
+    """
+    Builds the simulated users: most report a new issue, the rest ask about an
+    existing ticket. Of the new issues, described_share open the chat with the
+    description, which lets the bot skip the category menu.
+    """
+    users = []
+    for i in range(count):
+        name = f"+60 12-345 {i:04d}"
+        if random.random() < existing_share:
+            script = ["Hello", "2", "{ticket}"]
+        elif described_share and random.random() < described_share:
+            description = random.choice(NEW_ISSUE_DESCRIPTIONS)
+            script = [description, "1", description]
+        else:
+            script = ["Hi, I need help", "1", str(random.randint(1, 5)),
+                      random.choice(NEW_ISSUE_DESCRIPTIONS)]
+        users.append({
+            "name": name,
+            "script": script,
+            "arriveAfterMs": int(random.uniform(0, arrival) * 1000),
+            "thinkMs": [int(think[0] * 1000), int(think[1] * 1000)],
+        })
+    return users
+
+
+def seed_existing_tickets(conn, users):
+    """
+    Gives every user asking about an existing ticket one ongoing ticket
+    """
+    for user in users:
+        if user["script"][1] == "2":
+            conn.execute(
+                "INSERT INTO tickets (contact_details, issue_category, description, status) "
+                "VALUES (?, 'Hardware', 'Seeded ticket', 'Ongoing')", (user["name"],))
+    conn.commit()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--arrival", type=float, default=10,
+                        help="seconds over which users arrive")
+    parser.add_argument("--think", type=float, nargs=2, default=[0.5, 2],
+                        help="min and max seconds users take to reply")
+    parser.add_argument("--existing", type=float, default=0.3,
+                        help="share of users asking about an existing ticket")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--send-rate", type=float, default=0,
+                        help="messages per minute allowed by the send rate limit, 0 turns it off")
+    parser.add_argument("--headed", action="store_true",
+                        help="show the browser")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="support-bot-bench-")
+    app.TICKET_SPOOL_PATH = os.path.join(workdir, "ticket_spool.db")
+    app.CONVERSATION_STORE_PATH = os.path.join(workdir, "conversations.db")
+    conn = use_sqlite(app, os.path.join(workdir, "tickets.db"), reserved_ids=0)
+    app.WAIT_PROFILE = "fast"
+    app.IDLE_SLEEP_RANGE = (0.2, 0.5)
+    app.SCHEDULER_REPORT_INTERVAL = 3600  # Reported below instead
+    app.send_bucket = app.TokenBucket(args.send_rate / 60, app.SEND_BURST)
+
+    users = user_scripts(args.users, args.existing, args.arrival, args.think)
+    seed_existing_tickets(conn, users)
+    # Ticket numbers after the seeded ones
+    start = conn.execute("SELECT MAX(ticket_no) + 1 FROM tickets").fetchone()[0] or 1
+    app.get_ticket_spool().add_reserved(range(start, start + 100000))
+
+    options = webdriver.ChromeOptions()
+    if not args.headed:
+        options.add_argument("--headless=new")
+    driver = webdriver.Chrome(options=options)
+    try:
+        driver.get(MOCK_PAGE.as_uri())
+        app.check_login(driver)
+        driver.execute_script(
+            "window.mock.addGroup(arguments[0])", app.GROUP_TO_NOTIFY)
+        app.click_unread_button(driver)
+
+        started = time.time()
+        driver.execute_script("window.mock.start(arguments[0])", users)
+
+        def finished():
+            return (driver.execute_script("return window.mock.done()")
+                    or time.time() - started > args.timeout)
+
+        app.run_scheduler(app.SeleniumTransport(driver), should_stop=finished)
+        elapsed = time.time() - started
+        results = driver.execute_script("return window.mock.results()")
+    finally:
+        driver.quit()
+
+    done = [r for r in results if r["finished_at"]]
+    first_replies = [(r["first_reply_at"] - r["first_message_at"]) / 1000
+                     for r in results if r["first_reply_at"]]
+    tickets = conn.execute("SELECT COUNT(*) FROM tickets WHERE description != 'Seeded ticket'").fetchone()[0]
+
+    print(f"\n{len(done)}/{len(results)} conversations finished in {elapsed:.1f}s "
+          f"({len(done) / elapsed * 60:.1f} per minute), {tickets} tickets created")
+    if first_replies:
+        print(f"Time to first reply: p50 {percentile(first_replies, 0.5):.2f}s  "
+              f"p95 {percentile(first_replies, 0.95):.2f}s  "
+              f"mean {statistics.mean(first_replies):.2f}s")
+
+    waits = {dict(labels)["on"]: value for (name, labels), value in app.metrics.counters.items()
+             if name == "support_bot_waiting_seconds_total"}
+    browser, user = waits.get("browser", 0), waits.get("user", 0)
+    print(f"Sleep overhead: {browser:.1f}s ({browser / elapsed * 100:.0f}%) waiting on the browser, "
+          f"{user:.1f}s ({user / elapsed * 100:.0f}%) listening for replies, "
+          f"{elapsed - browser - user:.1f}s working\n")
+    print(app.timing_report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Memory use and speed of the ticket export of report.py, with SQLite standing
+in for MySQL. Runs fully offline.
+
+Seeds the tickets table, then exports the first 10k, 100k and 1M tickets as
+CSV and JSON Lines to /dev/null, streamed in chunks and, for comparison, read
+with a single fetchall(). Reports rows per second and the peak memory the
+export allocated (tracemalloc), which stays flat when streaming.
+
+    python benchmarks/bench_export.py --rows 10000 100000 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+import report  # noqa: E402
+from sqlite_db import use_sqlite  # noqa: E402
+
+DESCRIPTIONS = [
+    "The printer on level 2 is jammed again",
+    "Wifi keeps dropping in the meeting room",
+    "I forgot my password and got locked out",
+    "Excel crashes whenever I open the budget file, I already tried reinstalling it twice",
+    "My laptop screen is flickering",
+]
+START = datetime(2024, 1, 1)
+
+
+def seed_tickets(conn, count):
+    """
+    Inserts count tickets, one a minute from START
+    """
+    categories = list(app.CATEGORY_MAP.values())
+    conn.executemany(
+        "INSERT INTO tickets (ticket_no, contact_details, issue_category, description, status, date_created) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        ((i, f"+60{random.randrange(100000):09d}", random.choice(categories), random.choice(DESCRIPTIONS),
+          random.choice(["Ongoing", "Closed"]), (START + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"))
+         for i in range(1, count + 1)))
+    conn.commit()
+
+
+def export_fetchall(out, until):
+    """
+    The export without streaming: every row is read before the first is written
+    """
+    conn = app.connect_to_db()
+    cursor = conn.cursor()
+    cursor.execute(*report.export_query(until=until))
+    rows = cursor.fetchall()
+    writer = csv.writer(out)
+    writer.writerow(report.EXPORT_COLUMNS)
+    writer.writerows(rows)
+    cursor.close()
+    return len(rows)
+
+
+def measure(export, traced):
+    """
+    Returns:
+        (rows exported, seconds, peak MiB allocated or None)
+    """
+    with open(os.devnull, "w", newline="", encoding="utf-8") as out:
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        count = export(out)
+        elapsed = time.perf_counter() - started
+        peak = None
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--chunk-size", type=int, default=report.EXPORT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="support-bot-export-")
+    app.TICKET_SPOOL_PATH = os.path.join(workdir, "ticket_spool.db")
+    conn = use_sqlite(app, os.path.join(workdir, "tickets.db"), reserved_ids=0)
+    started = time.perf_counter()
+    seed_tickets(conn, max(args.rows))
+    print(f"Seeded {max(args.rows)} tickets in {time.perf_counter() - started:.1f}s, "
+          f"chunks of {args.chunk_size} rows\n")
+
+    print(f"{'rows':>9}  {'export':<16} {'rows/s':>9}  {'peak MiB':>8}")
+    for rows in sorted(args.rows):
+        # Tickets before the one a minute after the last to export
+        until = (START + timedelta(minutes=rows + 1)).strftime("%Y-%m-%d %H:%M:%S")
+        exports = [
+            (f"streamed {fmt}", lambda out, fmt=fmt: report.export_tickets(
+                out, fmt, until=until, chunk_size=args.chunk_size))
+            for fmt in report.WRITERS
+        ] + [("fetchall csv", lambda out: export_fetchall(out, until))]
+        for name, export in exports:
+            count, elapsed, _ = measure(export, traced=False)
+            _, _, peak = measure(export, traced=True)
+            print(f"{count:>9}  {name:<16} {count / elapsed:>9.0f}  {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares the cost of logging on the scheduler's hot loop with synchronous
+file and console handlers (the old basicConfig setup) against the queued
+pipeline of app.setup_logging, with its repeat filter.
+
+Reports the time a logging call takes in the calling thread, and how many
+bytes reach the log file.
+
+    python benchmarks/bench_logging.py --loops 20000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def hot_loop(loops):
+    """
+    Logs what an idle scheduler loop logs, with a new message now and then.
+
+    Returns seconds spent in the logging calls
+    """
+    started = time.perf_counter()
+    for i in range(loops):
+        logging.info("Waiting for user reply...")
+        logging.info("No unread messages")
+        if i % 10 == 0:
+            logging.info(f"New message detected: '{i}'")
+    return time.perf_counter() - started
+
+
+def use_sync_logging(path, stream):
+    root = logging.getLogger()
+    file_handler = logging.FileHandler(path)
+    console_handler = logging.StreamHandler(stream)
+    formatter = logging.Formatter(
+        '%(asctime)s - %(levelname)s - %(message)s', datefmt='%d-%m-%Y %H:%M:%S')
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    root.handlers[:] = [file_handler, console_handler]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--loops", type=int, default=20000)
+    args = parser.parse_args()
+    calls = args.loops * 2 + (args.loops + 9) // 10
+    workdir = tempfile.mkdtemp(prefix="support-bot-logging-")
+
+    with open(os.devnull, "w") as devnull:
+        sync_path = os.path.join(workdir, "sync.log")
+        use_sync_logging(sync_path, devnull)
+        sync_seconds = hot_loop(args.loops)
+        for handler in logging.getLogger().handlers:
+            handler.close()
+
+        queued_path = os.path.join(workdir, "queued.log")
+        app.setup_logging(queued_path, stream=devnull)
+        queued_seconds = hot_loop(args.loops)
+        started = time.perf_counter()
+        app.stop_logging()
+        drain_seconds = time.perf_counter() - started
+
+    print(f"{calls} logging calls")
+    print(f"Synchronous: {sync_seconds / calls * 1e6:6.1f} us per call, "
+          f"{os.path.getsize(sync_path) / 1024:8.0f} KiB written")
+    print(f"Queued:      {queued_seconds / calls * 1e6:6.1f} us per call, "
+          f"{os.path.getsize(queued_path) / 1024:8.0f} KiB written "
+          f"(listener done {drain_seconds * 1000:.0f} ms after the loop)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Seeds a scratch copy of the schema with 10k, 100k and 1M tickets and times
+the open ticket lookup with and without the (contact_details, status) index.
+
+Needs permission to create the `<DATABASE>_bench` database on the MySQL
+server configured in .env. The database is dropped afterwards unless --keep.
+
+    python benchmarks/bench_schema.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+import migrate  # noqa: E402
+
+SEED_BATCH = 10000
+INSERT_QUERY = """
+INSERT INTO tickets (contact_details, issue_category, description, status, date_created)
+VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def seed(conn, start, end, contacts):
+    """
+    Inserts tickets start..end-1: one in ten is still ongoing, dates spread over three years
+    """
+    cursor = conn.cursor()
+    first_day = datetime.now() - timedelta(days=3 * 365)
+    categories = list(app.CATEGORY_MAP.values())
+    for batch_start in range(start, end, SEED_BATCH):
+        rows = []
+        for i in range(batch_start, min(batch_start + SEED_BATCH, end)):
+            rows.append((
+                f"+60{random.randrange(contacts):09d}",
+                random.choice(categories),
+                f"Seeded ticket {i}",
+                "Ongoing" if random.random() < 0.1 else "Resolved",
+                first_day + timedelta(seconds=random.randrange(3 * 365 * 86400)),
+            ))
+        cursor.executemany(INSERT_QUERY, rows)
+        conn.commit()
+    cursor.close()
+
+
+def time_lookups(conn, lookups, contacts):
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    for _ in range(lookups):
+        cursor.execute(app.OPEN_TICKETS_QUERY,
+                       (f"+60{random.randrange(contacts):09d}",))
+        cursor.fetchall()
+    elapsed = time.perf_counter() - start
+    cursor.close()
+    return elapsed / lookups * 1000
+
+
+def set_index_visible(conn, visible):
+    cursor = conn.cursor()
+    cursor.execute(
+        f"ALTER TABLE tickets ALTER INDEX idx_tickets_contact_status {'VISIBLE' if visible else 'INVISIBLE'}")
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the scratch database")
+    args = parser.parse_args()
+
+    database = f"{app.DB_CONFIG['database']}_bench"
+    config = dict(app.DB_CONFIG, database=None)
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.execute(f"CREATE DATABASE `{database}`")
+    cursor.execute(f"USE `{database}`")
+    cursor.close()
+
+    try:
+        migrate.upgrade(conn)
+        print(f"{'rows':>10}{'seed s':>10}{'indexed ms':>12}{'full scan ms':>14}")
+        seeded = 0
+        for size in sorted(args.sizes):
+            contacts = max(size // 5, 1)
+            start = time.perf_counter()
+            seed(conn, seeded, size, contacts)
+            seed_time = time.perf_counter() - start
+            seeded = size
+
+            indexed = time_lookups(conn, args.lookups, contacts)
+            set_index_visible(conn, False)
+            # Full scans are slow, a tenth of the lookups is enough
+            scanned = time_lookups(conn, max(args.lookups // 10, 1), contacts)
+            set_index_visible(conn, True)
+            print(f"{size:>10}{seed_time:>10.1f}{indexed:>12.3f}{scanned:>14.3f}")
+
+        if not migrate.check_query_plans(conn):
+            sys.exit("A query falls back to a full table or index scan")
+    finally:
+        if not args.keep:
+            cursor = conn.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+            cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares typing the category menu key by key (the old send_message_as_p)
+against inserting it in one step, on a local page with the same input box
+as WhatsApp Web. Runs offline in headless Chrome.
+
+    python benchmarks/bench_send_message.py --runs 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from urllib.parse import quote
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+INPUT_PAGE = """
+<!DOCTYPE html>
+<html><body>
+<div contenteditable="true" data-tab="10" role="textbox" style="white-space: pre-wrap"></div>
+</body></html>
+"""
+
+
+def run(label, compose, driver, runs):
+    message_box = driver.find_element(By.XPATH, app.MESSAGE_BOX_XPATH)
+    timings = []
+    for _ in range(runs):
+        driver.execute_script(app.INSERT_TEXT_JS, message_box, "")
+        start = time.perf_counter()
+        compose(driver, message_box, app.CATEGORY_MENU)
+        timings.append(time.perf_counter() - start)
+
+    rendered = app.normalize_text(driver.execute_script(
+        app.RENDERED_TEXT_JS, message_box))
+    matches = rendered == app.normalize_text("\n".join(app.CATEGORY_MENU))
+    print(f"{label:<8} median {statistics.median(timings) * 1000:8.1f} ms  "
+          f"max {max(timings) * 1000:8.1f} ms  text matches: {matches}")
+    return statistics.median(timings)
+
+
+def insert(driver, message_box, lines):
+    if not app.insert_message_text(driver, message_box, "\n".join(lines)):
+        raise RuntimeError("inserted text did not match")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    driver = webdriver.Chrome(options=options)
+    try:
+        driver.get("data:text/html;charset=utf-8," + quote(INPUT_PAGE))
+        print(f"Category menu: {len(app.CATEGORY_MENU)} lines, "
+              f"{sum(len(line) for line in app.CATEGORY_MENU)} characters, {args.runs} runs")
+        typed = run("typed", app.type_message, driver, args.runs)
+        inserted = run("inserted", insert, driver, args.runs)
+        print(f"Inserting is {typed / inserted:.1f}x faster")
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    main()
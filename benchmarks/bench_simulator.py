@@ -0,0 +1,92 @@
+"""
+Replays scripted conversations through the scheduler on the in-memory simulator,
+without a browser, with SQLite standing in for MySQL. Measures the cost of the
+conversation logic and of ticket creation on their own.
+
+Reports conversations and tickets per second, and the time spent per step.
+
+    python benchmarks/bench_simulator.py --users 5000 --active 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from bench_e2e import seed_existing_tickets, user_scripts  # noqa: E402
+from simulator import SimulatedTransport  # noqa: E402
+from sqlite_db import use_sqlite  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--active", type=int, default=50,
+                        help="users talking to the bot at the same time")
+    parser.add_argument("--existing", type=float, default=0.3,
+                        help="share of users asking about an existing ticket")
+    parser.add_argument("--described", type=float, default=0,
+                        help="share of new issues described in the opening message")
+    parser.add_argument("--open-chat-replies", type=float, default=0,
+                        help="share of replies sent into the open chat just before the bot leaves it, "
+                             "found only when their stage times out")
+    parser.add_argument("--stage-timeout", type=float, default=None,
+                        help="seconds every stage waits for a reply (default: STAGE_TIMEOUTS)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log", action="store_true",
+                        help="keep logging to the console")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="support-bot-sim-")
+    app.TICKET_SPOOL_PATH = os.path.join(workdir, "ticket_spool.db")
+    app.CONVERSATION_STORE_PATH = os.path.join(workdir, "conversations.db")
+    conn = use_sqlite(app, os.path.join(workdir, "tickets.db"), reserved_ids=0)
+    app.IDLE_SLEEP_RANGE = (0, 0)
+    app.SCHEDULER_REPORT_INTERVAL = 3600  # Reported below instead
+    if args.stage_timeout is not None:
+        app.STAGE_TIMEOUTS = dict.fromkeys(app.STAGE_TIMEOUTS, args.stage_timeout)
+    devnull = open(os.devnull, "w")
+    if not args.log:
+        app.setup_logging(os.path.join(workdir, "bot.log"), stream=devnull)
+
+    users = user_scripts(args.users, args.existing, 0, (0, 0), args.described)
+    seed_existing_tickets(conn, users)
+    # Ticket numbers after the seeded ones
+    start = conn.execute("SELECT MAX(ticket_no) + 1 FROM tickets").fetchone()[0] or 1
+    app.get_ticket_spool().add_reserved(range(start, start + args.users))
+    transport = SimulatedTransport(max_active=args.active, open_chat_replies=args.open_chat_replies)
+
+    started = time.time()
+    for user in users:
+        transport.add_user(user["name"], user["script"])
+
+    def finished():
+        return transport.done() or time.time() - started > args.timeout
+
+    app.run_scheduler(transport, should_stop=finished)
+    app.flush_notifications(transport, force=True)
+    app.drain_send_queue(transport, force=True)
+    app.flush_tickets()
+    elapsed = time.time() - started
+    app.stop_logging()
+    devnull.close()
+
+    tickets = conn.execute("SELECT COUNT(*) FROM tickets WHERE description != 'Seeded ticket'").fetchone()[0]
+    print(f"\n{transport.finished}/{len(users)} conversations finished in {elapsed:.2f}s "
+          f"({transport.finished / elapsed:.0f} per second), "
+          f"{tickets} tickets created ({tickets / elapsed:.0f} per second)")
+    timed_out = sum(1 for chat in transport.chats.values()
+                    if any("haven't received a response" in m.text for m in chat.messages))
+    print(f"{timed_out} conversations timed out waiting for a reply")
+    print(f"{transport.sent} messages sent by the bot, "
+          f"{transport.sent / max(transport.finished, 1):.2f} per conversation\n")
+    print(app.timing_report())
+
+
+if __name__ == "__main__":
+    main()
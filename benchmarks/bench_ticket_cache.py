@@ -0,0 +1,52 @@
+"""
+Compares a burst of repeat open-ticket lookups with and without the
+open ticket cache, against the MySQL server configured in .env.
+
+    python benchmarks/bench_ticket_cache.py --contacts 20 --repeats 50
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def run(label, contacts, repeats, cached):
+    app.invalidate_open_tickets()
+    app.open_ticket_cache.hits = app.open_ticket_cache.misses = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for contact in contacts:
+            if not cached:
+                app.invalidate_open_tickets(contact)
+            app.lookup_open_tickets(contact)
+    elapsed = time.perf_counter() - start
+    lookups = len(contacts) * repeats
+    print(f"{label:<9} {lookups} lookups in {elapsed:.2f}s  "
+          f"{lookups / elapsed:10.1f} lookups/s  {app.open_ticket_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--contacts", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    conn = app.connect_to_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT DISTINCT contact_details FROM tickets WHERE status = 'Ongoing' LIMIT %s", (args.contacts,))
+    contacts = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    if not contacts:
+        sys.exit("No ongoing tickets to look up, create a few first")
+
+    run("uncached", contacts, args.repeats, cached=False)
+    run("cached", contacts, args.repeats, cached=True)
+
+
+if __name__ == "__main__":
+    main()
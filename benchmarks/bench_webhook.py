@@ -0,0 +1,155 @@
+"""
+Load test of webhook.py against a local mock of the WhatsApp Cloud API with
+scripted users, with SQLite standing in for MySQL. The bot runs in a process
+of its own, the mock and its users in this one. Runs fully offline.
+
+Reports messages per second both ways and the p50/p95/p99 time from a user's
+message to the bot's answer.
+
+    python benchmarks/bench_webhook.py --users 2000 --concurrent 300
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientError, ClientSession, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from bench_e2e import percentile, seed_existing_tickets, user_scripts  # noqa: E402
+from mock_cloud_api import MockCloudApi  # noqa: E402
+from sqlite_db import SCHEMA, use_sqlite  # noqa: E402
+
+# Number the IT notifications are sent to, not one of the users
+NOTIFY_NUMBER = "60100000000"
+# Secret the mock signs its webhooks with
+APP_SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_bot(port, api_url, workdir, burst_quiet, ticket_count):
+    """
+    Serves the webhook on port, in a process of its own, until it is terminated
+    """
+    import webhook
+
+    app.TICKET_SPOOL_PATH = os.path.join(workdir, "ticket_spool.db")
+    app.CONVERSATION_STORE_PATH = os.path.join(workdir, "conversations.db")
+    conn = use_sqlite(app, os.path.join(workdir, "tickets.db"), reserved_ids=0)
+    start = conn.execute("SELECT MAX(ticket_no) + 1 FROM tickets").fetchone()[0] or 1
+    app.get_ticket_spool().add_reserved(range(start, start + ticket_count))
+    app.setup_logging(os.path.join(workdir, "bot.log"), stream=open(os.devnull, "w"))
+    app.MESSAGE_BURST_QUIET = burst_quiet
+    webhook.WEBHOOK_PORT = port
+    webhook.CLOUD_API_NOTIFY_TO = NOTIFY_NUMBER
+
+    server = webhook.WebhookServer(webhook.CloudApiClient(api_url, "bench", "bench"), app_secret=APP_SECRET)
+    web.run_app(server.application(), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+async def wait_until_up(url, timeout=30):
+    async with ClientSession() as session:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                async with session.get(url):
+                    return
+            except ClientError:
+                if time.time() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+
+async def drive(users, args, bot, webhook_url, api_port):
+    """
+    Runs the mock API and its users until all of them finished or the timeout,
+    then stops the bot while the mock still takes its last messages
+
+    Returns:
+        (MockCloudApi, elapsed seconds)
+    """
+    mock = MockCloudApi(webhook_url, APP_SECRET, think=args.think, latency=args.latency)
+    runner = web.AppRunner(mock.application(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+    try:
+        await wait_until_up(webhook_url)
+        started = time.perf_counter()
+        await mock.start(users, args.concurrent)
+        try:
+            await asyncio.wait_for(mock.done.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            pass
+        return mock, time.perf_counter() - started
+    finally:
+        bot.terminate()
+        await asyncio.get_running_loop().run_in_executor(None, bot.join)
+        await mock.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrent", type=int, default=300,
+                        help="users talking to the bot at the same time")
+    parser.add_argument("--think", type=float, nargs=2, default=[0, 0],
+                        help="min and max seconds users take to reply")
+    parser.add_argument("--latency", type=float, default=0.1,
+                        help="seconds the mock API takes to answer each send, 0 for none")
+    parser.add_argument("--existing", type=float, default=0.3,
+                        help="share of users asking about an existing ticket")
+    parser.add_argument("--burst-quiet", type=float, default=0,
+                        help="seconds the bot waits for more of a description (the bot's default is "
+                             f"{app.MESSAGE_BURST_QUIET}s)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    users = user_scripts(args.users, args.existing, 0, args.think)
+    for user in users:
+        # Cloud API numbers are digits only, and the bot saves them as +<number>
+        user["number"] = re.sub(r"\D", "", user["name"])
+        user["name"] = f"+{user['number']}"
+
+    workdir = tempfile.mkdtemp(prefix="support-bot-webhook-")
+    conn = sqlite3.connect(os.path.join(workdir, "tickets.db"))
+    conn.executescript(SCHEMA)
+    seed_existing_tickets(conn, users)
+
+    bot_port, api_port = free_port(), free_port()
+    bot = multiprocessing.get_context("spawn").Process(target=run_bot, args=(
+        bot_port, f"http://127.0.0.1:{api_port}", workdir, args.burst_quiet, args.users))
+    bot.start()
+    mock, elapsed = asyncio.run(drive(
+        [(user["number"], user["script"]) for user in users], args, bot,
+        f"http://127.0.0.1:{bot_port}/webhook", api_port))
+
+    tickets = conn.execute("SELECT COUNT(*) FROM tickets WHERE description != 'Seeded ticket'").fetchone()[0]
+    latencies = [seconds * 1000 for seconds in mock.latencies]
+    print(f"\n{mock.finished}/{len(users)} conversations finished in {elapsed:.1f}s "
+          f"with {args.concurrent} at a time and {args.latency * 1000:.0f} ms of API latency, "
+          f"{tickets} tickets created")
+    print(f"{mock.user_messages / elapsed:.0f} user messages/s received, "
+          f"{mock.bot_messages / elapsed:.0f} bot messages/s sent")
+    if latencies:
+        print(f"Time to the bot's answer: p50 {percentile(latencies, 0.5):.1f} ms  "
+              f"p95 {percentile(latencies, 0.95):.1f} ms  p99 {percentile(latencies, 0.99):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
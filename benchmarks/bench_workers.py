@@ -0,0 +1,140 @@
+"""
+Scaling benchmark of several bot workers against local mocks of WhatsApp Web.
+Each worker is a process with its own headless Chrome and mock page, serving
+its share of the scripted users. They claim chats through a shared workers.db
+and write tickets to a shared SQLite database, like workers of supervisor.py.
+
+Reports conversations per minute and time to first reply for each worker count.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --users 40
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from selenium import webdriver
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from bench_e2e import MOCK_PAGE, percentile, seed_existing_tickets, user_scripts  # noqa: E402
+from sqlite_db import SCHEMA, use_sqlite  # noqa: E402
+
+# Ticket numbers reserved per worker
+ID_BLOCK = 100000
+
+
+def run_worker(worker_id, index, users, workdir, timeout, results):
+    """
+    Serves users on one mock page, in a process of its own. Puts
+    (worker_id, elapsed, mock results) on the results queue.
+    """
+    app.TICKET_SPOOL_PATH = os.path.join(workdir, f"ticket_spool_{worker_id}.db")
+    app.CONVERSATION_STORE_PATH = os.path.join(workdir, f"conversations_{worker_id}.db")
+    conn = use_sqlite(app, os.path.join(workdir, "tickets.db"), reserved_ids=0)
+    start = conn.execute("SELECT COALESCE(MAX(ticket_no), 0) + 1 FROM tickets").fetchone()[0]
+    app.get_ticket_spool().add_reserved(
+        range(start + index * ID_BLOCK, start + (index + 1) * ID_BLOCK))
+    app.coordinator = app.WorkerCoordinator(os.path.join(workdir, "workers.db"), worker_id)
+    app.WAIT_PROFILE = "fast"
+    app.IDLE_SLEEP_RANGE = (0.2, 0.5)
+    app.SCHEDULER_REPORT_INTERVAL = 3600
+    app.send_bucket = app.TokenBucket(0, app.SEND_BURST)  # The mock does not throttle
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    driver = webdriver.Chrome(options=options)
+    try:
+        driver.get(MOCK_PAGE.as_uri())
+        app.check_login(driver)
+        app.click_unread_button(driver)
+
+        started = time.time()
+        driver.execute_script("window.mock.start(arguments[0])", users)
+
+        def finished():
+            return (driver.execute_script("return window.mock.done()")
+                    or time.time() - started > timeout)
+
+        app.run_scheduler(app.SeleniumTransport(driver), should_stop=finished)
+        results.put((worker_id, time.time() - started,
+                     driver.execute_script("return window.mock.results()")))
+    finally:
+        driver.quit()
+
+
+def run(worker_count, users, timeout):
+    """
+    Runs worker_count workers over the users, split evenly between them
+
+    Returns:
+        (elapsed seconds, mock results of all users)
+    """
+    workdir = tempfile.mkdtemp(prefix="support-bot-workers-")
+    conn = sqlite3.connect(os.path.join(workdir, "tickets.db"))
+    conn.executescript(SCHEMA)
+    seed_existing_tickets(conn, users)
+    conn.close()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(
+            f"worker{i + 1}", i, users[i::worker_count], workdir, timeout, results))
+        for i in range(worker_count)]
+    for process in processes:
+        process.start()
+
+    elapsed, all_results = 0, []
+    for _ in processes:
+        # A worker that crashed never reports back
+        worker_id, worker_elapsed, worker_results = results.get(timeout=timeout + 120)
+        done = sum(1 for r in worker_results if r["finished_at"])
+        print(f"  {worker_id}: {done}/{len(worker_results)} conversations in {worker_elapsed:.1f}s")
+        elapsed = max(elapsed, worker_elapsed)
+        all_results += worker_results
+    for process in processes:
+        process.join()
+    return elapsed, all_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="worker counts to compare")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--arrival", type=float, default=10,
+                        help="seconds over which users arrive")
+    parser.add_argument("--think", type=float, nargs=2, default=[0.5, 2],
+                        help="min and max seconds users take to reply")
+    parser.add_argument("--existing", type=float, default=0.3,
+                        help="share of users asking about an existing ticket")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    summary = []
+    for worker_count in args.workers:
+        random.seed(args.seed)
+        users = user_scripts(args.users, args.existing, args.arrival, args.think)
+        print(f"{worker_count} worker(s):")
+        elapsed, results = run(worker_count, users, args.timeout)
+
+        done = [r for r in results if r["finished_at"]]
+        first_replies = [(r["first_reply_at"] - r["first_message_at"]) / 1000
+                         for r in results if r["first_reply_at"]]
+        summary.append((worker_count, len(done), len(done) / elapsed * 60,
+                        percentile(first_replies, 0.5) if first_replies else 0,
+                        percentile(first_replies, 0.95) if first_replies else 0))
+
+    print(f"\n{'workers':>8}  {'finished':>8}  {'per min':>8}  {'p50 first reply':>15}  {'p95':>6}")
+    for worker_count, done, per_minute, p50, p95 in summary:
+        print(f"{worker_count:>8}  {done:>8}  {per_minute:>8.1f}  {p50:>14.2f}s  {p95:>5.2f}s")
+
+
+if __name__ == "__main__":
+    main()
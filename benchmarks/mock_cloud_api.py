@@ -0,0 +1,143 @@
+"""
+Local mock of the WhatsApp Cloud API with scripted users, for webhook.py.
+
+The bot's replies are posted to /<phone number id>/messages, like on the Graph
+API. Every user sends the first line of their script to the bot's webhook when
+they start, and the next line each time the bot answers, until the script runs
+out. "{ticket}" is replaced with the first ticket number (#123) of the bot's
+last message.
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+
+from aiohttp import ClientSession, TCPConnector, web
+
+
+@dataclass
+class MockUser:
+    number: str
+    script: list
+    sent: int = 0
+    waiting_since: float = None  # When the user sent a message the bot has not answered yet
+    finished_at: float = None
+
+
+class MockCloudApi:
+    """
+    Args:
+        webhook_url: Where the bot receives webhooks
+        app_secret: Secret the webhooks are signed with, like Meta does
+        think: Min and max seconds users take to reply
+        latency: Seconds the API takes to answer a send request, like the
+                 Graph API's round trip
+        connections: Connections kept open to the webhook
+    """
+
+    def __init__(self, webhook_url, app_secret, think=(0, 0), latency=0, connections=100):
+        self.webhook_url = webhook_url
+        self.app_secret = app_secret
+        self.think = think
+        self.latency = latency
+        self.connections = connections
+        self.session = None
+        self.users = {}  # number -> MockUser
+        self.waiting = []  # users not started yet
+        self.ids = itertools.count(1)
+        self.latencies = []  # Seconds from a user's message to the bot's answer
+        self.user_messages = 0
+        self.bot_messages = 0
+        self.finished = 0
+        self.done = asyncio.Event()
+        self.tasks = set()  # Replies being typed or posted
+
+    def application(self):
+        application = web.Application()
+        application.router.add_post("/{phone_number_id}/messages", self.messages)
+        return application
+
+    async def messages(self, request):
+        """
+        Takes a message sent by the bot, and lets its user answer it
+        """
+        payload = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        to = payload["to"]
+        self.bot_messages += 1
+        user = self.users.get(to)
+        if user:
+            if user.waiting_since is not None:
+                self.latencies.append(time.perf_counter() - user.waiting_since)
+                user.waiting_since = None
+            if user.sent < len(user.script):
+                self.spawn(self.reply(user, payload["text"]["body"]))
+            elif user.finished_at is None:
+                user.finished_at = time.perf_counter()
+                self.finished += 1
+                self.next_user()
+        return web.json_response({
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": to, "wa_id": to}],
+            "messages": [{"id": f"wamid.out{next(self.ids)}"}],
+        })
+
+    async def reply(self, user, bot_text):
+        await asyncio.sleep(random.uniform(*self.think))
+        await self.user_says(user, bot_text)
+
+    async def user_says(self, user, bot_text=None):
+        text = user.script[user.sent]
+        user.sent += 1
+        if "{ticket}" in text:
+            match = re.search(r"#\d+", bot_text or "")
+            text = text.replace("{ticket}", match.group(0) if match else "#0")
+        webhook = {"object": "whatsapp_business_account", "entry": [{"id": "0", "changes": [{
+            "field": "messages",
+            "value": {
+                "messaging_product": "whatsapp",
+                "contacts": [{"profile": {"name": user.number}, "wa_id": user.number}],
+                "messages": [{"from": user.number, "id": f"wamid.in{next(self.ids)}",
+                              "timestamp": str(int(time.time())), "type": "text",
+                              "text": {"body": text}}],
+            }}]}]}
+        self.user_messages += 1
+        user.waiting_since = time.perf_counter()
+        body = json.dumps(webhook).encode()
+        signature = "sha256=" + hmac.new(self.app_secret.encode(), body, hashlib.sha256).hexdigest()
+        async with self.session.post(self.webhook_url, data=body, headers={
+                "Content-Type": "application/json", "X-Hub-Signature-256": signature}) as response:
+            await response.read()
+
+    async def start(self, users, concurrent):
+        """
+        Starts the first concurrent users, each finished user starts the next one
+
+        Args:
+            users: (number, script) pairs
+        """
+        self.session = ClientSession(connector=TCPConnector(limit=self.connections))
+        self.waiting = [MockUser(number, script) for number, script in reversed(users)]
+        self.users = {user.number: user for user in self.waiting}
+        for _ in range(min(concurrent, len(self.waiting))):
+            self.next_user()
+
+    def next_user(self):
+        if self.waiting:
+            self.spawn(self.user_says(self.waiting.pop()))
+        elif self.finished == len(self.users):
+            self.done.set()
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def close(self):
+        await self.session.close()
@@ -0,0 +1,208 @@
+// Mock of the parts of WhatsApp Web that app.py drives, with scripted users.
+// Start it with window.mock.start(users), each user being
+// {name, script: [messages], arriveAfterMs, thinkMs: [min, max]}.
+// The first message is sent on arrival, every following one after a bot
+// message arrives in the user's chat. "{ticket}" is replaced with the first
+// ticket number (#123) of the last bot message.
+(function () {
+    const chats = new Map();
+    const users = [];
+    let openChat = null;
+    let filter = 'all';
+    let nextId = 1;
+
+    const pane = document.getElementById('pane-side');
+    const slot = document.getElementById('main-slot');
+    const searchBox = document.getElementById('search');
+    const cancelSearch = document.querySelector('[aria-label="Cancel search"]');
+
+    const el = (tag, attrs, children) => {
+        const node = document.createElement(tag);
+        Object.entries(attrs || {}).forEach(([key, value]) => {
+            if (key === 'text') { node.textContent = value; } else { node.setAttribute(key, value); }
+        });
+        (children || []).forEach((child) => node.appendChild(child));
+        return node;
+    };
+    const clock = (at) => {
+        const date = new Date(at);
+        return `${String(date.getHours()).padStart(2, '0')}:${String(date.getMinutes()).padStart(2, '0')}`;
+    };
+
+    function getChat(name, group) {
+        if (!chats.has(name)) {
+            chats.set(name, {name: name, group: !!group, messages: [], unread: 0, lastAt: Date.now(), user: null});
+        }
+        return chats.get(name);
+    }
+
+    function renderSidebar() {
+        const query = searchBox.textContent.trim().toLowerCase();
+        cancelSearch.style.display = query ? '' : 'none';
+        const rows = Array.from(chats.values())
+            .filter((chat) => chat.messages.length || chat.group)
+            .sort((a, b) => b.lastAt - a.lastAt);
+        pane.innerHTML = '';
+        rows.forEach((chat) => {
+            if (query) {
+                if (!chat.name.toLowerCase().includes(query)) { return; }
+            } else if (filter === 'unread' && !chat.unread && chat !== openChat) {
+                return;
+            }
+            const last = chat.messages[chat.messages.length - 1];
+            const name = query
+                ? el('span', {title: chat.name}, [el('span', {class: 'matched-text', text: chat.name})])
+                : el('span', {title: chat.name, text: chat.name});
+            const bottom = [el('span', {title: last ? last.text : '', text: last ? last.text : ''})];
+            if (chat.unread) {
+                const label = `${chat.unread} unread message${chat.unread > 1 ? 's' : ''}`;
+                bottom.push(el('span', {class: 'badge', 'aria-label': label, text: String(chat.unread)}));
+            }
+            const row = el('div', {role: 'listitem'}, [
+                el('div', {class: 'row-top'}, [name, el('div', {text: clock(chat.lastAt)})]),
+                el('div', {class: 'row-bottom'}, bottom),
+            ]);
+            row.addEventListener('click', () => open(chat));
+            pane.appendChild(row);
+        });
+    }
+
+    function messageNode(message) {
+        const text = el('span', {class: 'selectable-text copyable-text'}, [el('span', {text: message.text})]);
+        const children = [text];
+        if (message.dir === 'out') {
+            message.icon = el('span', {'data-icon': message.delivered ? 'msg-check' : 'msg-time'});
+            children.push(message.icon);
+        }
+        return el('div', {'data-id': `msg-${message.id}`}, [
+            el('div', {class: `message-${message.dir} focusable-list-item`}, children),
+        ]);
+    }
+
+    function renderHeader(chat) {
+        // header/div[2]/div[1]/div/span for groups, header/div[2]/div/div/div/span for personal chats
+        const title = chat.group
+            ? el('div', {}, [el('div', {}, [el('span', {dir: 'auto', text: chat.name})]), el('div', {text: 'IT, You'})])
+            : el('div', {}, [el('div', {}, [el('div', {}, [el('div', {}, [el('span', {dir: 'auto', text: chat.name})])])])]);
+        const menuButton = el('button', {'aria-label': 'Menu', title: 'Menu', text: '⋮'});
+        menuButton.addEventListener('click', showMenu);
+        // header/div[3]/div/div[3]/div/button
+        const actions = el('div', {}, [el('div', {}, [
+            el('div', {}), el('div', {}), el('div', {}, [el('div', {}, [menuButton])]),
+        ])]);
+        return el('header', {}, [el('div', {class: 'avatar'}), title, actions]);
+    }
+
+    function showMenu() {
+        const item = el('div', {role: 'button', 'aria-label': 'Close chat', text: 'Close chat'});
+        item.addEventListener('click', close);
+        document.body.appendChild(el('div', {class: 'chat-menu', role: 'application'}, [item]));
+    }
+
+    function open(chat) {
+        openChat = chat;
+        chat.unread = 0;
+        searchBox.textContent = '';
+        slot.innerHTML = '';
+        document.querySelectorAll('.chat-menu').forEach((menu) => menu.remove());
+        const list = el('div', {class: 'messages'}, chat.messages.map(messageNode));
+        const input = el('div', {contenteditable: 'true', 'data-tab': '10', role: 'textbox', title: 'Type a message'});
+        input.addEventListener('keydown', (event) => {
+            if (event.key === 'Enter' && !event.shiftKey) {
+                event.preventDefault();
+                const text = input.innerText.trim();
+                input.innerHTML = '';
+                if (text) { botSend(chat, text); }
+            }
+        });
+        slot.appendChild(el('div', {id: 'main'}, [renderHeader(chat), list, el('footer', {}, [input])]));
+        renderSidebar();
+    }
+
+    function close() {
+        openChat = null;
+        slot.innerHTML = '';
+        document.querySelectorAll('.chat-menu').forEach((menu) => menu.remove());
+        renderSidebar();
+    }
+
+    function append(chat, message) {
+        chat.messages.push(message);
+        chat.lastAt = message.at;
+        if (chat === openChat) {
+            document.querySelector('#main .messages').appendChild(messageNode(message));
+        } else if (message.dir === 'in') {
+            chat.unread += 1;
+        }
+        renderSidebar();
+    }
+
+    function botSend(chat, text) {
+        const message = {id: nextId++, dir: 'out', text: text, at: Date.now(), delivered: false};
+        append(chat, message);
+        // The sent tick shows once the server accepted the message
+        setTimeout(() => {
+            message.delivered = true;
+            if (message.icon) { message.icon.setAttribute('data-icon', 'msg-check'); }
+        }, 50);
+        if (chat.user) { chat.user.onBotMessage(text); }
+    }
+
+    function userSend(chat, text) {
+        append(chat, {id: nextId++, dir: 'in', text: text, at: Date.now()});
+    }
+
+    function addUser(config) {
+        const chat = getChat(config.name);
+        const [minThink, maxThink] = config.thinkMs || [500, 2000];
+        const user = {
+            name: config.name, script: config.script.slice(), sent: 0,
+            firstMessageAt: null, firstReplyAt: null, finishedAt: null, botMessages: 0,
+            sendNext(lastBotText) {
+                let text = this.script[this.sent++];
+                if (text.includes('{ticket}')) {
+                    const match = (lastBotText || '').match(/#\d+/);
+                    text = text.replace('{ticket}', match ? match[0] : '#0');
+                }
+                userSend(chat, text);
+            },
+            onBotMessage(text) {
+                this.botMessages += 1;
+                if (this.firstReplyAt === null) { this.firstReplyAt = Date.now(); }
+                if (this.sent < this.script.length) {
+                    const think = minThink + Math.random() * (maxThink - minThink);
+                    setTimeout(() => this.sendNext(text), think);
+                } else if (this.finishedAt === null) {
+                    this.finishedAt = Date.now();
+                }
+            },
+        };
+        chat.user = user;
+        users.push(user);
+        setTimeout(() => {
+            user.firstMessageAt = Date.now();
+            user.sendNext(null);
+        }, config.arriveAfterMs || 0);
+    }
+
+    searchBox.addEventListener('input', renderSidebar);
+    cancelSearch.addEventListener('click', () => { searchBox.textContent = ''; renderSidebar(); });
+    document.getElementById('all-filter').addEventListener('click', () => { filter = 'all'; renderSidebar(); });
+    document.getElementById('unread-filter').addEventListener('click', () => { filter = 'unread'; renderSidebar(); });
+
+    window.mock = {
+        start(userConfigs) { userConfigs.forEach(addUser); },
+        addGroup(name) { getChat(name, true); renderSidebar(); },
+        done() { return users.length > 0 && users.every((user) => user.finishedAt !== null); },
+        results() {
+            return users.map((user) => ({
+                name: user.name,
+                first_message_at: user.firstMessageAt,
+                first_reply_at: user.firstReplyAt,
+                finished_at: user.finishedAt,
+                bot_messages: user.botMessages,
+            }));
+        },
+    };
+    renderSidebar();
+})();
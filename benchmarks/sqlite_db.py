@@ -0,0 +1,134 @@
+"""
+SQLite stand-in for the MySQL database, so benchmarks run offline.
+
+use_sqlite(app) points app.connect_to_db at a SQLite database with the
+tickets table and reserves ticket numbers locally, so no query needs MySQL.
+"""
+import sqlite3
+import threading
+
+# MySQL syntax used by app.py and its SQLite equivalent
+TRANSLATIONS = [
+    ("CONCAT(description, %s)", "description || %s"),
+    ("%s", "?"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_no INTEGER PRIMARY KEY,
+    contact_details VARCHAR(255),
+    issue_category VARCHAR(50),
+    description TEXT,
+    status VARCHAR(20),
+    date_created DATETIME DEFAULT CURRENT_TIMESTAMP,
+    related_to INTEGER,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_contact_status ON tickets (contact_details, status);
+CREATE INDEX IF NOT EXISTS idx_tickets_date_created ON tickets (date_created);
+CREATE INDEX IF NOT EXISTS idx_tickets_updated_at ON tickets (updated_at);
+CREATE TABLE IF NOT EXISTS ticket_merges (
+    merge_id CHAR(32) PRIMARY KEY,
+    ticket_no INTEGER NOT NULL,
+    merged_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def translate(query):
+    for mysql_syntax, sqlite_syntax in TRANSLATIONS:
+        query = query.replace(mysql_syntax, sqlite_syntax)
+    return query
+
+
+class SQLiteCursor:
+    """
+    The subset of the mysql.connector cursor API used by app.py
+    """
+
+    def __init__(self, conn, lock, dictionary=False):
+        self.lock = lock
+        self.cursor = conn.cursor()
+        self.dictionary = dictionary
+
+    def execute(self, query, params=()):
+        with self.lock:
+            self.cursor.execute(translate(query), params)
+
+    def executemany(self, query, rows):
+        with self.lock:
+            self.cursor.executemany(translate(query), rows)
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self.cursor.description, row)}
+
+    def fetchone(self):
+        with self.lock:
+            return self._row(self.cursor.fetchone())
+
+    def fetchmany(self, size):
+        with self.lock:
+            return [self._row(row) for row in self.cursor.fetchmany(size)]
+
+    def fetchall(self):
+        with self.lock:
+            return [self._row(row) for row in self.cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """
+    Wraps one shared SQLite connection, close() leaves it open like returning a pooled connection
+    """
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def cursor(self, dictionary=False, buffered=False):
+        # SQLite cursors always step through the rows as they are fetched
+        return SQLiteCursor(self.conn, self.lock, dictionary)
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.conn.rollback()
+
+    def ping(self, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+def use_sqlite(app, path=":memory:", reserved_ids=100000):
+    """
+    Makes app use a SQLite database at path instead of MySQL.
+
+    Returns the SQLite connection, e.g. to seed or inspect tickets
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(SCHEMA)
+    lock = threading.RLock()
+    app.connect_to_db = lambda: SQLiteConnection(conn, lock)
+
+    # Ticket numbers come from the local spool, ticket_sequence is MySQL only
+    start = conn.execute(
+        "SELECT COALESCE(MAX(ticket_no), 0) + 1 FROM tickets").fetchone()[0]
+    app.get_ticket_spool().add_reserved(range(start, start + reserved_ids))
+    return conn
@@ -0,0 +1,179 @@
+"""
+Creates and upgrades the database schema of the support bot, and checks
+that the bot's queries are served by indexes.
+
+Usage:
+    python migrate.py upgrade   Apply the migrations that are not applied yet
+    python migrate.py status    List the migrations and whether they are applied
+    python migrate.py check     EXPLAIN the bot's queries, fails on a full table or index scan
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import app
+import report
+
+# (version, description, statements). Append new migrations, never edit applied ones.
+MIGRATIONS = [
+    (1, "Create tickets table", [
+        """
+        CREATE TABLE IF NOT EXISTS tickets (
+            ticket_no INT AUTO_INCREMENT PRIMARY KEY,
+            contact_details VARCHAR(255),
+            issue_category VARCHAR(50),
+            description TEXT,
+            status VARCHAR(20),
+            date_created DATETIME
+        )
+        """,
+    ]),
+    (2, "Create ticket_sequence table for reserved ticket numbers", [
+        """
+        CREATE TABLE IF NOT EXISTS ticket_sequence (
+            id TINYINT PRIMARY KEY,
+            next_id INT NOT NULL
+        )
+        """,
+    ]),
+    (3, "Index open ticket lookups by contact and status", [
+        "ALTER TABLE tickets ADD INDEX idx_tickets_contact_status (contact_details, status)",
+    ]),
+    (4, "Index tickets by creation date", [
+        "ALTER TABLE tickets ADD INDEX idx_tickets_date_created (date_created)",
+    ]),
+    (5, "Default date_created to the insert time", [
+        "ALTER TABLE tickets MODIFY date_created DATETIME DEFAULT CURRENT_TIMESTAMP",
+    ]),
+    (6, "Link tickets reporting the same outage to its first ticket", [
+        "ALTER TABLE tickets ADD COLUMN related_to INT NULL",
+        "ALTER TABLE tickets ADD INDEX idx_tickets_related_to (related_to)",
+    ]),
+    (7, "Track when a ticket last changed, so the bot notices status changes", [
+        "ALTER TABLE tickets ADD COLUMN updated_at DATETIME DEFAULT CURRENT_TIMESTAMP "
+        "ON UPDATE CURRENT_TIMESTAMP",
+        "ALTER TABLE tickets ADD INDEX idx_tickets_updated_at (updated_at)",
+    ]),
+    (8, "Record the reports merged into tickets, so a merge is applied once", [
+        """
+        CREATE TABLE IF NOT EXISTS ticket_merges (
+            merge_id CHAR(32) PRIMARY KEY,
+            ticket_no INT NOT NULL,
+            merged_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+]
+
+# (name, query, sample parameters) for every query the bot runs against tickets
+BOT_QUERIES = [
+    ("open tickets lookup", app.OPEN_TICKETS_QUERY, ("+60123456789",)),
+    ("ticket sequence start", "SELECT COALESCE(MAX(ticket_no), 0) + 1 FROM tickets", ()),
+    ("ticket changes poll", app.TICKET_CHANGES_QUERY,
+     ((datetime.now() - timedelta(seconds=app.TICKET_FLUSH_INTERVAL)).strftime("%Y-%m-%d %H:%M:%S"),)),
+    ("duplicate index rebuild", app.DUPLICATE_INDEX_QUERY,
+     ((datetime.now() - timedelta(days=app.DUPLICATE_CONTACT_DAYS)).strftime("%Y-%m-%d %H:%M:%S"),)),
+    ("monthly ticket export", *report.export_query(
+        (datetime.now() - timedelta(days=30)).date().isoformat(), None)),
+]
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+
+
+def applied_versions(cursor):
+    ensure_migrations_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def upgrade(conn):
+    """
+    Applies the pending migrations in order.
+
+    Returns the number of migrations applied
+    """
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    applied = 0
+    for version, description, statements in MIGRATIONS:
+        if version in done:
+            continue
+        logging.info(f"Applying migration {version}: {description}")
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description))
+        conn.commit()
+        applied += 1
+    cursor.close()
+    logging.info(f"Schema is up to date ({applied} migration(s) applied)")
+    return applied
+
+
+def status(conn):
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    cursor.close()
+    for version, description, _ in MIGRATIONS:
+        print(f"{'applied' if version in done else 'pending':<8} {version:>3}  {description}")
+    return all(version in done for version, _, _ in MIGRATIONS)
+
+
+def check_query_plans(conn, queries=None):
+    """
+    Runs EXPLAIN on the bot's queries and reports any that scan a whole table or index.
+
+    Returns True if every query uses an index
+    """
+    cursor = conn.cursor(dictionary=True)
+    ok = True
+    for name, query, params in queries or BOT_QUERIES:
+        cursor.execute("EXPLAIN " + query, params)
+        for row in cursor.fetchall():
+            # Type ALL means MySQL reads every row of the table, and type index
+            # every entry of an index, which is no better for a large table
+            full_scan = row["type"] in ("ALL", "index")
+            ok = ok and not full_scan
+            print(f"{'FULL SCAN' if full_scan else 'ok':<10} {name:<24} table={row['table']} "
+                  f"type={row['type']} key={row['key']} rows={row['rows']}")
+    cursor.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["upgrade", "status", "check"])
+    args = parser.parse_args()
+
+    conn = app.connect_to_db()
+    if not conn:
+        sys.exit("Database connection failed")
+
+    try:
+        if args.command == "upgrade":
+            upgrade(conn)
+        elif args.command == "status":
+            if not status(conn):
+                sys.exit(1)
+        elif not check_query_plans(conn):
+            sys.exit("A query falls back to a full table or index scan, run 'python migrate.py upgrade'")
+    except mysql.connector.Error as err:
+        logging.error(f"Database query error: {err}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
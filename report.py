@@ -0,0 +1,165 @@
+"""
+Exports tickets as CSV or JSON Lines for reporting.
+
+Usage:
+    python report.py --since 2024-01-01 --until 2024-02-01 -o january.csv
+    python report.py --category Network --status Ongoing --format jsonl > open_network.jsonl
+
+Rows are streamed from an unbuffered cursor in chunks of EXPORT_CHUNK_SIZE and
+written as they arrive, so memory use stays the same however many tickets
+match. --since is inclusive and --until exclusive.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date
+
+import mysql.connector
+
+import app
+
+# Columns exported, in order
+EXPORT_COLUMNS = ["ticket_no", "contact_details", "issue_category", "description",
+                  "status", "date_created", "related_to"]
+# Rows fetched from the database at a time
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+
+def export_query(since=None, until=None, categories=None, statuses=None):
+    """
+    Builds the export query for the filters given, in ticket number order.
+    A date range is served by the date_created index.
+
+    Returns:
+        (query, params)
+    """
+    conditions, params = [], []
+    if since:
+        conditions.append("date_created >= %s")
+        params.append(since)
+    if until:
+        conditions.append("date_created < %s")
+        params.append(until)
+    if categories:
+        conditions.append(f"issue_category IN ({', '.join(['%s'] * len(categories))})")
+        params.extend(categories)
+    if statuses:
+        conditions.append(f"status IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+    query = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM tickets"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + " ORDER BY ticket_no", tuple(params)
+
+
+def stream_rows(conn, query, params=(), chunk_size=None):
+    """
+    Yields the rows of a query in chunks. The cursor is unbuffered, so the rows
+    are read off the connection as they are fetched instead of all at once.
+    """
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size or EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass  # Rows left unread when the export stopped early
+
+
+def write_csv(out, chunks):
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_jsonl(out, chunks):
+    count = 0
+    for rows in chunks:
+        out.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str, ensure_ascii=False) + "\n"
+                       for row in rows)
+        count += len(rows)
+    return count
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def export_tickets(out, fmt="csv", since=None, until=None, categories=None, statuses=None,
+                   chunk_size=None):
+    """
+    Writes the tickets matching the filters to out.
+
+    Args:
+        out: Text file to write to
+        fmt: "csv" or "jsonl"
+        since: First day, or None for no lower bound
+        until: Day after the last one, or None for no upper bound
+        categories: Issue categories to keep, or None for all
+        statuses: Statuses to keep, or None for all
+
+    Returns:
+        int: The number of tickets written, or None if the database is unreachable
+    """
+    conn = app.connect_to_db()
+    if not conn:
+        logging.error("Database connection failed. Tickets not exported.")
+        return None
+
+    started = time.perf_counter()
+    try:
+        query, params = export_query(since, until, categories, statuses)
+        count = WRITERS[fmt](out, stream_rows(conn, query, params, chunk_size))
+    finally:
+        conn.close()
+    logging.info(f"Exported {count} ticket(s) in {time.perf_counter() - started:.1f}s")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", type=date.fromisoformat, help="first day, YYYY-MM-DD")
+    parser.add_argument("--until", type=date.fromisoformat, help="day after the last one, YYYY-MM-DD")
+    parser.add_argument("--category", action="append", choices=list(app.CATEGORY_MAP.values()),
+                        help="issue category to export, can be repeated")
+    parser.add_argument("--status", action="append",
+                        help="ticket status to export (e.g. Ongoing), can be repeated")
+    parser.add_argument("--format", choices=list(WRITERS), default="csv")
+    parser.add_argument("-o", "--output", help="file to write, standard output by default")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE,
+                        help="rows fetched from the database at a time")
+    args = parser.parse_args()
+
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        count = export_tickets(
+            out, args.format,
+            since=args.since.isoformat() if args.since else None,
+            until=args.until.isoformat() if args.until else None,
+            categories=args.category, statuses=args.status, chunk_size=args.chunk_size)
+    except mysql.connector.Error as err:
+        logging.error(f"Database query error: {err}")
+        sys.exit(1)
+    finally:
+        if args.output:
+            out.close()
+    if count is None:
+        sys.exit("Database connection failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+In-memory stand-in for WhatsApp, to run the conversation flows without a browser.
+
+Usage:
+    transport = SimulatedTransport()
+    transport.add_user("+60 12-345 0001", ["Hi", "1", "2", "My laptop screen is flickering"])
+    app.run_scheduler(transport, should_stop=transport.done)
+
+A scripted user sends the first line of their script when they arrive, and
+the next line after every answer of the bot, until the script runs out.
+Nothing waits: a reply arrives the moment the bot listens for it, or as an
+unread message once the bot moved on to another chat, so the flows, ticket
+creation and the scheduler run as fast as Python runs them. With
+open_chat_replies, a share of the replies instead arrives while the bot is
+still in the chat, just before it switches away: WhatsApp marks those read, so
+they never show up as unread and the bot only finds them by reading the chat again. Messages
+sent to another chat, like the IT group, are delivered without leaving the
+open chat, the way the notification window does.
+"""
+import itertools
+import random
+import re
+from collections import deque
+from dataclasses import dataclass, field
+
+import app
+
+
+@dataclass
+class SimulatedMessage:
+    id: str  # Like the data-id of a message in WhatsApp Web
+    incoming: bool  # Sent by the user, not by the bot
+    text: str
+
+
+@dataclass
+class SimulatedChat:
+    """
+    A chat and, for a scripted user, what they are going to say
+    """
+    name: str
+    script: list = field(default_factory=list)
+    messages: list = field(default_factory=list)
+    contact: str = None  # Number shown in the contact details, None when hidden
+    unread: int = 0
+    last_activity: int = 0
+    said: int = 0   # Lines of the script sent so far
+    heard: int = 0  # Messages the bot has listened to since it opened the chat
+    replying: bool = False  # The user owes the bot their next line
+    finished: bool = False  # The bot answered the last line of the script
+
+
+class SimulatedTransport(app.Transport):
+    """
+    Chats kept in memory, with scripted users replying instantly
+
+    Args:
+        max_active: Users talking at the same time, further users arrive as
+                    earlier ones finish (default: all at once)
+        open_chat_replies: Share of the replies sent into the open chat just
+                    before the bot leaves it (default: none)
+    """
+
+    def __init__(self, max_active=None, open_chat_replies=0):
+        self.chats = {}
+        self.unread_chats = {}  # name -> SimulatedChat with unread messages
+        self.open = None
+        self.clock = itertools.count(1)  # Message ids, also the order of activity
+        self.max_active = max_active
+        self.open_chat_replies = open_chat_replies
+        self.arriving = deque()
+        self.replying = []  # Chats whose user is typing their next line
+        self.active = 0
+        self.finished = 0
+        self.sent = 0
+        self.add_chat(app.GROUP_TO_NOTIFY)
+
+    def add_chat(self, name, script=(), contact=None):
+        chat = self.chats[name] = SimulatedChat(name, list(script), contact=contact)
+        return chat
+
+    def add_user(self, name, script, contact=None):
+        """
+        Adds a user who starts talking as soon as fewer than max_active users are
+        """
+        chat = self.add_chat(name, script, contact)
+        if self.max_active and self.active >= self.max_active:
+            self.arriving.append(chat)
+        else:
+            self.arrive(chat)
+        return chat
+
+    def arrive(self, chat):
+        self.active += 1
+        self.user_says(chat)
+
+    def user_says(self, chat):
+        text = chat.script[chat.said]
+        chat.said += 1
+        if "{ticket}" in text:
+            # The first ticket number the bot listed
+            bot_texts = [m.text for m in chat.messages if not m.incoming]
+            match = re.search(r"#\d+", bot_texts[-1]) if bot_texts else None
+            text = text.replace("{ticket}", match.group(0) if match else "#0")
+        self.append(chat, True, text)
+        if chat is not self.open:
+            chat.unread += 1
+            self.unread_chats[chat.name] = chat
+
+    def append(self, chat, incoming, text):
+        tick = next(self.clock)
+        chat.messages.append(SimulatedMessage(f"sim-{tick}", incoming, text))
+        chat.last_activity = tick
+
+    def bot_says(self, chat, text):
+        self.append(chat, False, text)
+        self.sent += 1
+        if chat.said < len(chat.script):
+            if not chat.replying:
+                chat.replying = True
+                self.replying.append(chat)
+        elif chat.script and not chat.finished:
+            chat.finished = True
+            self.finished += 1
+            self.active -= 1
+            if self.arriving:
+                self.arrive(self.arriving.popleft())
+
+    def deliver_replies(self):
+        """
+        Delivers the lines the users are typing, into the open chat or as unread messages
+        """
+        replying, self.replying = self.replying, []
+        for chat in replying:
+            chat.replying = False
+            self.user_says(chat)
+
+    def leave_open_chat(self):
+        """
+        The user of the open chat may answer just before the bot switches away
+        """
+        chat = self.open
+        if chat and chat.replying and random.random() < self.open_chat_replies:
+            self.replying.remove(chat)
+            chat.replying = False
+            self.user_says(chat)
+
+    def done(self):
+        """
+        Returns True once every user got an answer to the last line of their script
+        """
+        return not self.arriving and not self.active
+
+    def list_unread(self):
+        recent_first = sorted(
+            self.unread_chats.values(), key=lambda chat: chat.last_activity, reverse=True)
+        return [app.UnreadChat(chat.name, chat.unread, chat.messages[-1].text, "", position)
+                for position, chat in enumerate(recent_first)]
+
+    def open_chat(self, chat_name):
+        chat = self.chats.get(chat_name)
+        if not chat:
+            return False
+        self.leave_open_chat()
+        self.open = chat
+        chat.unread = 0
+        chat.heard = len(chat.messages)
+        self.unread_chats.pop(chat_name, None)
+        self.deliver_replies()
+        return True
+
+    def close_chat(self):
+        self.leave_open_chat()
+        self.open = None
+        self.deliver_replies()
+
+    def chat_name(self):
+        return self.open.name if self.open else False
+
+    def contact_details(self):
+        return self.open.contact or self.open.name
+
+    def receive(self, timeout, cursor=None):
+        if not self.open:
+            return [], cursor
+        self.deliver_replies()
+        chat = self.open
+        if cursor:
+            # Polls like wait_for_user_reply_polling: whatever came after the cursor
+            new, cursor = self.read_since(cursor)
+        else:
+            new = [m.text for m in chat.messages[chat.heard:] if m.incoming]
+            cursor = self.cursor()
+        chat.heard = len(chat.messages)
+        return new, cursor
+
+    def read_since(self, cursor):
+        # Same rules as NEW_MESSAGES_JS
+        messages = self.open.messages
+        last = next((m.id for m in reversed(messages) if m.incoming), None)
+        new, after_outgoing = [], None
+        for message in reversed(messages):
+            if cursor and message.id == cursor:
+                return new, last or cursor
+            if not message.incoming:
+                if after_outgoing is None:
+                    after_outgoing = new[:]
+                if not cursor:
+                    break
+                continue
+            new.insert(0, message.text)
+        return (after_outgoing if after_outgoing is not None else new), last or cursor
+
+    def send(self, message, priority="reply"):
+        if not self.open:
+            return False
+        self.bot_says(self.open, message)
+        return True
+
+    def send_paragraph(self, message, priority="reply"):
+        return self.send("\n".join(message), priority=priority)
+
+    def send_to(self, chat_name, message, priority):
+        chat = self.chats.get(chat_name)
+        if not chat:
+            return False
+        self.bot_says(chat, "\n".join(message))
+        return True
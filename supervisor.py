@@ -0,0 +1,165 @@
+"""
+Runs several bot workers side by side and restarts them when they crash or hang.
+
+Usage:
+    python supervisor.py --workers 3
+
+Each worker is `python app.py` with WORKER_ID=worker1, worker2, ... and logs in
+with its own Chrome profile, as a different support number or another linked
+device of the same one. Workers claim a chat in workers.db before opening it,
+so no chat is served twice, and write tickets to the shared database. One more
+process, the notifier, sends the notifications of all workers to the IT group.
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import app
+
+# Seconds between health checks
+HEALTH_CHECK_INTERVAL = 5
+# A worker that has not reported back in this many seconds is restarted.
+# Right after a start it gets the login wait on top, for the QR code scan.
+WORKER_HEARTBEAT_TIMEOUT = int(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "300"))
+# Seconds before restarting a worker, doubled after every failure in a row up to the max
+RESTART_BACKOFF = 5
+RESTART_BACKOFF_MAX = 300
+# A worker up for this long is healthy again and restarts without backoff
+RESTART_RESET_AFTER = 600
+# Seconds a stopped worker gets to close its browser before it is killed
+STOP_GRACE = 30
+
+APP_SCRIPT = os.path.join(app.script_dir, "app.py")
+
+
+class Worker:
+    """
+    One `python app.py` process run by the supervisor
+    """
+
+    def __init__(self, worker_id, metrics_port):
+        self.worker_id = worker_id
+        self.metrics_port = metrics_port
+        self.process = None
+        self.started_at = 0
+        self.backoff = RESTART_BACKOFF
+        self.next_start = 0
+
+    def start(self):
+        env = dict(os.environ, WORKER_ID=self.worker_id,
+                   METRICS_PORT=str(self.metrics_port))
+        # Own process group, so a hung worker is killed together with its Chrome
+        self.process = subprocess.Popen(
+            [sys.executable, APP_SCRIPT], env=env, start_new_session=(os.name == "posix"))
+        self.started_at = time.time()
+        logging.info(f"Started {self.worker_id} (pid {self.process.pid})")
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def problem(self, heartbeats):
+        """
+        Returns why the worker needs a restart, or None if it is healthy
+        """
+        if not self.running():
+            return f"exited with code {self.process.returncode}"
+        _, heartbeat_at, _ = heartbeats.get(self.worker_id, (None, 0, 0))
+        if heartbeat_at >= self.started_at:
+            if time.time() - heartbeat_at > WORKER_HEARTBEAT_TIMEOUT:
+                return f"no heartbeat for {time.time() - heartbeat_at:.0f}s"
+        elif time.time() - self.started_at > WORKER_HEARTBEAT_TIMEOUT + app.wait_timeout("login"):
+            return "no heartbeat since start"
+        return None
+
+    def stop(self):
+        """
+        Asks the worker to shut down like Ctrl+C would, and kills it if it does not
+        """
+        if not self.running():
+            return
+        if os.name == "posix":
+            self.process.send_signal(signal.SIGINT)
+        else:
+            self.process.terminate()
+        try:
+            self.process.wait(timeout=STOP_GRACE)
+        except subprocess.TimeoutExpired:
+            logging.warning(f"{self.worker_id} did not stop, killing it")
+            if os.name == "posix":
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+            self.process.wait()
+
+
+def supervise(workers, coordinator, should_stop=None):
+    """
+    Starts the workers and keeps them running, restarting a worker with
+    backoff when it exits or stops sending heartbeats.
+
+    Args:
+        should_stop: Optional callable, all workers are stopped once it returns True
+    """
+    for worker in workers:
+        worker.start()
+    try:
+        while not (should_stop and should_stop()):
+            time.sleep(HEALTH_CHECK_INTERVAL)
+            heartbeats = coordinator.heartbeats()
+            for worker in workers:
+                if worker.process is None:
+                    if time.time() >= worker.next_start:
+                        worker.start()
+                    continue
+
+                problem = worker.problem(heartbeats)
+                if not problem:
+                    continue
+                logging.warning(f"{worker.worker_id} {problem}, restarting in {worker.backoff}s")
+                worker.stop()
+                # Its chats go back to the unread ones any worker can claim
+                coordinator.release_all(worker.worker_id)
+                if time.time() - worker.started_at > RESTART_RESET_AFTER:
+                    worker.backoff = RESTART_BACKOFF
+                worker.next_start = time.time() + worker.backoff
+                worker.backoff = min(worker.backoff * 2, RESTART_BACKOFF_MAX)
+                worker.process = None
+    finally:
+        for worker in workers:
+            worker.stop()
+            coordinator.release_all(worker.worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2,
+                        help="number of WhatsApp sessions serving chats")
+    args = parser.parse_args()
+
+    # SIGTERM (e.g. from systemd) stops the workers like Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # The notifier takes METRICS_PORT, the workers the ports after it
+    port = app.METRICS_PORT
+    workers = [Worker(app.NOTIFIER_ID, port)]
+    workers += [Worker(f"worker{i}", port + i if port else 0)
+                for i in range(1, args.workers + 1)]
+
+    coordinator = app.WorkerCoordinator(app.WORKERS_DB_PATH, "supervisor")
+    for worker in workers:
+        # Claims left behind by an earlier run
+        coordinator.release_all(worker.worker_id)
+    logging.info(f"Supervising {args.workers} workers and the notifier")
+    try:
+        supervise(workers, coordinator)
+    except KeyboardInterrupt:
+        logging.info("Stopping workers...")
+
+
+if __name__ == "__main__":
+    main()
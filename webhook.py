@@ -0,0 +1,457 @@
+"""
+Serves the bot over the WhatsApp Business Cloud API instead of WhatsApp Web.
+
+Usage:
+    python webhook.py
+
+Meta delivers the messages users send to the business number as webhooks,
+and the replies go out through the Cloud API. The conversation flows, tickets
+and notifications are the ones of app.py, only the transport differs. Without
+a browser to drive, one process serves many chats at once: the HTTP side runs
+on asyncio, and the flows run one step at a time on a thread of their own, as
+they make blocking database calls. The notifications to the IT team are sent
+from another thread, as each one waits for the API. Every webhook must be signed with the app
+secret, the server does not start without it.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, web
+
+import app
+
+# Where Meta delivers the webhooks, usually behind a reverse proxy with HTTPS
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Token Meta sends back when the webhook is registered, and the app secret
+# that signs every delivery (required, unsigned webhooks are rejected)
+CLOUD_API_VERIFY_TOKEN = os.getenv("CLOUD_API_VERIFY_TOKEN")
+CLOUD_API_APP_SECRET = os.getenv("CLOUD_API_APP_SECRET")
+# Graph API, business phone number and access token the replies are sent with
+CLOUD_API_URL = os.getenv("CLOUD_API_URL", "https://graph.facebook.com/v20.0")
+CLOUD_API_PHONE_NUMBER_ID = os.getenv("CLOUD_API_PHONE_NUMBER_ID")
+CLOUD_API_TOKEN = os.getenv("CLOUD_API_TOKEN")
+# The Cloud API cannot post to groups, the IT notifications go to this number instead
+CLOUD_API_NOTIFY_TO = os.getenv("CLOUD_API_NOTIFY_TO")
+# Connections kept open to the API, shared by all sends
+CLOUD_API_CONNECTIONS = int(os.getenv("CLOUD_API_CONNECTIONS", "32"))
+# Seconds a request to the API may take, and attempts for a message the API
+# answered with 429 or a server error
+CLOUD_API_TIMEOUT = 10
+CLOUD_API_RETRIES = 3
+# Seconds between checks for conversations that ran out of time and for notifications to send
+HOUSEKEEPING_INTERVAL = 1
+# Ids of the latest messages, to drop the webhooks Meta delivers again
+SEEN_MESSAGE_IDS = 10000
+
+app.metrics.describe("support_bot_webhook_messages_total", "Messages received through webhooks")
+app.metrics.describe("support_bot_api_send_seconds", "Duration of Cloud API send requests")
+app.metrics.describe("support_bot_api_send_errors_total",
+                     "Cloud API send requests that failed, by HTTP status")
+
+
+def parse_messages(payload):
+    """
+    Reads the messages from a Cloud API webhook payload. Button and list
+    replies count as the text of the option picked, other message types
+    (images, locations, ...) and delivery statuses are skipped.
+
+    Returns:
+        list: (sender number, message id, text) tuples, oldest first
+    """
+    messages = []
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            for message in change.get("value", {}).get("messages", []):
+                kind = message.get("type")
+                if kind == "text":
+                    text = message["text"]["body"]
+                elif kind == "button":
+                    text = message["button"]["text"]
+                elif kind == "interactive":
+                    reply = message["interactive"]
+                    text = (reply.get("button_reply") or reply.get("list_reply") or {}).get("title", "")
+                else:
+                    logging.info(f"Skipping {kind} message from {message.get('from')}")
+                    continue
+                messages.append((message["from"], message["id"], text.strip()))
+    return messages
+
+
+def valid_signature(secret, body, header):
+    """
+    Checks the X-Hub-Signature-256 header Meta signs a webhook's body with.
+    Without a secret no webhook is valid.
+    """
+    if not secret:
+        return False
+    signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, header or "")
+
+
+class CloudApiClient:
+    """
+    Sends text messages through the Cloud API over a pool of kept-alive
+    connections. Messages to the same number go out one after another, in the
+    order they were queued, and messages to different numbers in parallel.
+    """
+
+    def __init__(self, url=None, phone_number_id=None, token=None, connections=None):
+        self.url = f"{url or CLOUD_API_URL}/{phone_number_id or CLOUD_API_PHONE_NUMBER_ID}/messages"
+        self.token = token or CLOUD_API_TOKEN
+        self.connections = connections or CLOUD_API_CONNECTIONS
+        self.session = None
+        self.queues = {}  # number -> texts waiting to be sent to it
+        self.senders = {}  # number -> task sending its queue
+
+    async def start(self):
+        self.session = ClientSession(
+            connector=TCPConnector(limit=self.connections),
+            timeout=ClientTimeout(total=CLOUD_API_TIMEOUT),
+            headers={"Authorization": f"Bearer {self.token}"})
+
+    async def close(self):
+        """
+        Sends what is still queued, then closes the connections
+        """
+        while self.senders:
+            await asyncio.gather(*self.senders.values())
+        await self.session.close()
+
+    def send(self, to, text):
+        """
+        Queues a text for a number and returns at once. Must be called on the event loop.
+
+        Returns:
+            asyncio.Future: Resolves to True once the API accepted the text, False if it was not sent
+        """
+        if to not in self.queues:
+            self.queues[to] = deque()
+            self.senders[to] = asyncio.create_task(self.send_queued(to))
+        sent = asyncio.get_running_loop().create_future()
+        self.queues[to].append((text, sent))
+        return sent
+
+    async def send_and_wait(self, to, text):
+        """
+        Queues a text like send and waits until it went out
+
+        Returns:
+            bool: True if the API accepted the message
+        """
+        return await self.send(to, text)
+
+    async def send_queued(self, to):
+        queue = self.queues[to]
+        try:
+            while queue:
+                text, sent = queue.popleft()
+                ok = False
+                try:
+                    ok = await self.post(to, text)
+                finally:
+                    sent.set_result(ok)
+        finally:
+            del self.queues[to], self.senders[to]
+
+    async def post(self, to, text):
+        """
+        Sends one text, retrying with backoff while the API is rate limiting or failing
+
+        Returns:
+            bool: True if the API accepted the message
+        """
+        payload = {"messaging_product": "whatsapp", "recipient_type": "individual",
+                   "to": to, "type": "text", "text": {"body": text}}
+        for attempt in range(1, CLOUD_API_RETRIES + 1):
+            delay = attempt
+            try:
+                with app.metrics.time("support_bot_api_send_seconds"):
+                    async with self.session.post(self.url, json=payload) as response:
+                        body = await response.read()
+                if response.status < 400:
+                    return True
+                app.metrics.inc("support_bot_api_send_errors_total", status=response.status)
+                if response.status != 429 and response.status < 500:
+                    logging.error(f"Cloud API rejected message to {to}: "
+                                  f"{response.status} {body[:200].decode(errors='replace')}")
+                    return False
+                if response.headers.get("Retry-After", "").isdigit():
+                    delay = int(response.headers["Retry-After"])
+                logging.warning(f"Cloud API answered {response.status}, retrying in {delay}s")
+            except (ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"Failed to reach the Cloud API: {str(e) or type(e).__name__}")
+            if attempt < CLOUD_API_RETRIES:
+                await asyncio.sleep(delay)
+        logging.error(f"Message to {to} not sent after {CLOUD_API_RETRIES} attempts")
+        return False
+
+
+class CloudApiTransport(app.Transport):
+    """
+    A chat is the WhatsApp number of the user. The flows run one step at a
+    time, so the open chat is the one of the step running. Sends are handed to
+    the client on the event loop. Replies to users are not waited for, so a
+    slow API does not hold up the other chats' steps; the client sends them in
+    order and logs the ones that fail. Notifications wait for the API's answer,
+    so drain_send_queue keeps the ones that were not sent.
+    """
+
+    def __init__(self, client, loop):
+        self.client = client
+        self.loop = loop
+        self.open = None
+        self.cursors = {}  # number -> id of the last message received from it
+
+    def list_unread(self):
+        # Nothing to poll, new messages arrive as webhooks
+        return []
+
+    def open_chat(self, chat_name):
+        self.open = chat_name
+        return True
+
+    def close_chat(self):
+        self.open = None
+
+    def chat_name(self):
+        return self.open or False
+
+    def contact_details(self):
+        return f"+{self.open}"
+
+    def receive(self, timeout, cursor=None):
+        # The messages a user sends in a row are collected before the step, see WebhookServer.serve
+        return [], cursor
+
+    def read_since(self, cursor):
+        return [], self.cursors.get(self.open, cursor)
+
+    def send(self, message, priority="reply"):
+        return self.send_paragraph([message], priority=priority)
+
+    def send_paragraph(self, message, priority="reply"):
+        if not self.open:
+            return False
+        return self.send_to(self.open, message, priority)
+
+    def send_to(self, chat_name, message, priority):
+        if chat_name == app.GROUP_TO_NOTIFY:
+            if not CLOUD_API_NOTIFY_TO:
+                # Nowhere to send it, retrying would only hold up the send queue
+                logging.warning("CLOUD_API_NOTIFY_TO is not set, notification dropped")
+                return True
+            chat_name = CLOUD_API_NOTIFY_TO
+        text = "\n".join(message)
+        if priority != "notification":
+            self.loop.call_soon_threadsafe(self.client.send, chat_name, text)
+            return True
+        sent = asyncio.run_coroutine_threadsafe(
+            self.client.send_and_wait(chat_name, text), self.loop)
+        return sent.result()
+
+
+class WebhookServer:
+    """
+    Receives the webhooks and runs the conversation flows for the messages in them
+    """
+
+    def __init__(self, client, conversations=None, app_secret=None):
+        self.client = client
+        self.app_secret = app_secret or CLOUD_API_APP_SECRET
+        self.conversations = dict(conversations or {})  # number -> Conversation
+        self.transport = None
+        self.flows = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flows")
+        # Drains the send queue, waiting for each notification without holding up the flows
+        self.notifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notify")
+        self.inboxes = {}  # number -> texts received and not handled yet
+        self.arrived = {}  # number -> Event set when a message arrives while a burst is collected
+        self.serving = {}  # number -> task handling its inbox
+        self.seen = OrderedDict()  # ids of the latest messages, oldest first
+        self.housekeeper = None
+        self.drainer = None
+
+    def application(self):
+        application = web.Application()
+        application.router.add_get(WEBHOOK_PATH, self.verify)
+        application.router.add_post(WEBHOOK_PATH, self.receive)
+        application.on_startup.append(self.start)
+        application.on_cleanup.append(self.stop)
+        return application
+
+    async def start(self, application):
+        await self.client.start()
+        self.transport = CloudApiTransport(self.client, asyncio.get_running_loop())
+        self.housekeeper = asyncio.create_task(self.housekeep())
+        self.drainer = asyncio.create_task(self.drain())
+        logging.info(f"Listening for webhooks on port {WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    async def stop(self, application):
+        self.housekeeper.cancel()
+        self.drainer.cancel()
+        while self.serving:
+            await asyncio.gather(*self.serving.values())
+        await self.run_flow(app.flush_notifications, self.transport, True)
+        await self.run_flow(app.drain_send_queue, self.transport, True, executor=self.notifier)
+        await self.client.close()
+        self.flows.shutdown()
+        self.notifier.shutdown()
+
+    async def verify(self, request):
+        """
+        Answers Meta's challenge when the webhook is registered
+        """
+        query = request.query
+        if (query.get("hub.mode") == "subscribe" and CLOUD_API_VERIFY_TOKEN
+                and hmac.compare_digest(query.get("hub.verify_token", ""), CLOUD_API_VERIFY_TOKEN)):
+            return web.Response(text=query.get("hub.challenge", ""))
+        return web.Response(status=403)
+
+    async def receive(self, request):
+        """
+        Queues the messages of a webhook and answers right away, Meta delivers
+        a webhook again when the answer takes too long
+        """
+        body = await request.read()
+        if not valid_signature(self.app_secret, body, request.headers.get("X-Hub-Signature-256")):
+            logging.warning("Dropped a webhook without a valid signature")
+            return web.Response(status=403)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        for number, message_id, text in parse_messages(payload):
+            if message_id in self.seen:
+                continue
+            self.seen[message_id] = True
+            while len(self.seen) > SEEN_MESSAGE_IDS:
+                self.seen.popitem(last=False)
+            app.metrics.inc("support_bot_webhook_messages_total")
+            self.transport.cursors[number] = message_id
+            self.inboxes.setdefault(number, []).append(text)
+            if number in self.arrived:
+                self.arrived[number].set()
+            if number not in self.serving:
+                self.serving[number] = asyncio.create_task(self.serve(number))
+        return web.Response(text="OK")
+
+    async def serve(self, number):
+        """
+        Steps the conversation of a number with the messages in its inbox, until it is empty
+        """
+        try:
+            while self.inboxes.get(number):
+                conv = self.conversations.get(number)
+                if conv and conv.stage == app.STAGE_DESCRIPTION:
+                    await self.collect_burst(number)
+                messages = self.inboxes.pop(number)
+                await self.run_flow(self.step, number, messages)
+        finally:
+            del self.serving[number]
+
+    async def collect_burst(self, number):
+        """
+        Waits while the user keeps sending messages, like app.collect_messages
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        arrived = self.arrived[number] = asyncio.Event()
+        try:
+            while app.MESSAGE_BURST_QUIET and loop.time() - started < app.MESSAGE_BURST_LIMIT:
+                arrived.clear()
+                try:
+                    await asyncio.wait_for(arrived.wait(), min(
+                        app.MESSAGE_BURST_QUIET, app.MESSAGE_BURST_LIMIT - (loop.time() - started)))
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            del self.arrived[number]
+
+    async def run_flow(self, func, *args, executor=None):
+        """
+        Runs a flow step on the flows thread (or executor), logging instead of raising when it fails
+        """
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor or self.flows, func, *args)
+        except Exception as e:
+            logging.error(f"Unexpected error: {str(e)}")
+
+    def step(self, number, messages):
+        app.set_log_chat(number)
+        self.transport.open_chat(number)
+        conv = self.conversations.get(number)
+        if conv:
+            app.step_conversation(self.transport, conv, messages)
+        else:
+            conv = app.handle_conversation(self.transport, number, messages)
+            if not conv:
+                return
+            self.conversations[number] = conv
+            logging.info(f"Started conversation with {number} ({len(self.conversations)} active)")
+        if conv.done:
+            del self.conversations[number]
+        else:
+            conv.cursor = self.transport.cursor()
+            app.checkpoint_conversation(conv)
+
+    def expire(self):
+        """
+        Times out the conversations whose user did not reply in time and
+        queues the notifications that are due
+        """
+        now = time.time()
+        for number, conv in list(self.conversations.items()):
+            # A reply already in the inbox is handled first
+            if conv.deadline > now or number in self.serving:
+                continue
+            app.set_log_chat(number)
+            self.transport.open_chat(number)
+            app.handle_stage_timeout(self.transport, conv)
+            if conv.done:
+                del self.conversations[number]
+        app.set_log_chat(None)
+        app.flush_notifications(self.transport)
+
+    async def housekeep(self):
+        while True:
+            await asyncio.sleep(HOUSEKEEPING_INTERVAL)
+            await self.run_flow(self.expire)
+
+    async def drain(self):
+        while True:
+            await asyncio.sleep(HOUSEKEEPING_INTERVAL)
+            await self.run_flow(app.drain_send_queue, self.transport, executor=self.notifier)
+
+
+def main():
+    if not (CLOUD_API_PHONE_NUMBER_ID and CLOUD_API_TOKEN):
+        logging.error("Set CLOUD_API_PHONE_NUMBER_ID and CLOUD_API_TOKEN to use the Cloud API")
+        return
+    if not CLOUD_API_APP_SECRET:
+        logging.error("Set CLOUD_API_APP_SECRET, webhooks are only accepted with a valid signature")
+        return
+    if not CLOUD_API_NOTIFY_TO:
+        logging.warning("CLOUD_API_NOTIFY_TO is not set, the IT team will not be notified")
+
+    app.start_metrics_server()
+    app.start_ticket_writer()
+    server = WebhookServer(CloudApiClient(), app.resume_conversations())
+    try:
+        # Stops on Ctrl+C or SIGTERM, after the replies and notifications still queued went out
+        web.run_app(server.application(), host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                    print=None, access_log=None)
+    finally:
+        app.ticket_writer.stop()
+
+
+if __name__ == "__main__":
+    main()